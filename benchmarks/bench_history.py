@@ -0,0 +1,83 @@
+# bench_history.py
+"""
+Micro-benchmark: reverse search over a large persistent history.
+
+    python benchmarks/bench_history.py [--runs 1000000] [--distinct 200000]
+
+Fills a throwaway database with --runs executions of --distinct command lines
+(bulk-inserted, as a long-lived history would be), then times substring,
+fuzzy and filtered searches as the `history` builtin issues them.
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cli"))
+
+from historydb import HistoryDB, char_mask  # noqa: E402
+
+WORDS = ("git", "status", "commit", "push", "make", "test", "docker", "run", "build", "ls", "cd",
+         "python", "pytest", "grep", "kubectl", "logs", "deploy", "npm", "install", "src", "main")
+
+
+def fill(db: HistoryDB, runs: int, distinct: int, rng: random.Random):
+    lines = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))) + f" {i}" for i in range(distinct)]
+    conn = db._db
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO commands(id, text, chars) VALUES (?, ?, ?)",
+                     ((i, line, char_mask(line)) for i, line in enumerate(lines, 1)))
+    started = time.time() - runs
+    conn.executemany(
+        "INSERT INTO runs(id, command_id, cwd, status, duration, started) VALUES (?, ?, ?, ?, ?, ?)",
+        ((i, rng.randint(1, distinct), f"/home/me/p{i % 50}", 0 if i % 9 else 1, 0.1, started + i)
+         for i in range(1, runs + 1)),
+    )
+    conn.execute("UPDATE commands SET last_run = coalesce((SELECT max(id) FROM runs WHERE command_id = commands.id), 0), "
+                 "count = (SELECT count(*) FROM runs WHERE command_id = commands.id)")
+    conn.execute("COMMIT")
+
+
+def timed(label, func, repeat=20):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        results = func()
+        best = min(best, time.perf_counter() - started)
+    print(f"{label:<34} {best * 1000:8.2f} ms  ({len(results)} results)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=1_000_000, help="Executions logged")
+    parser.add_argument("--distinct", type=int, default=200_000, help="Distinct command lines")
+    parser.add_argument("--seed", type=int, default=7)
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db = HistoryDB(os.path.join(directory, "history.sqlite3"))
+        started = time.perf_counter()
+        fill(db, options.runs, options.distinct, random.Random(options.seed))
+        print(f"filled {options.runs} runs / {options.distinct} commands in {time.perf_counter() - started:.1f} s")
+
+        started = time.perf_counter()
+        for i in range(1000):
+            db.append(f"echo appended {i}", "/tmp", 0, 0.01)
+        print(f"{'append':<34} {(time.perf_counter() - started) / 1000 * 1000:8.2f} ms")
+
+        timed("recent commands (prompt load)", lambda: db.recent_commands())
+        timed("substring 'kubectl logs'", lambda: db.search("kubectl logs"))
+        timed("substring, rare 'status 12345'", lambda: db.search("status 12345"))
+        timed("substring, no match 'zzzz'", lambda: db.search("zzzz"))
+        timed("fuzzy 'gcp'", lambda: db.search("gcp", fuzzy=True))
+        timed("fuzzy, rare 'kdp1999'", lambda: db.search("kdp1999", fuzzy=True))
+        timed("failed in one directory", lambda: db.search(cwd="/home/me/p7", failed=True))
+        timed("substring + directory filter", lambda: db.search("docker", cwd="/home/me/p3"))
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# bench_spawn.py
+"""
+Micro-benchmark: latency of starting an external command through the shell
+versus directly.
+
+    python benchmarks/bench_spawn.py [--runs 300] [--command true]
+
+Each run starts the command with stdout and stderr on pipes and waits for it.
+Two ways are timed, as run_system_command uses them:
+
+  shell   the old path: one string, `shell=True` (sh -c, or cmd.exe /c)
+  direct  spawn.spawn(): argv from the cached PATH index, executed without a
+          shell (by posix_spawn where subprocess can use it)
+
+The default command does next to nothing (`uname`, or `hostname` on
+Windows), so what is measured is the cost of getting a process started. Avoid
+shell builtins such as `true`: `sh -c true` starts no process at all.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cli"))
+
+
+def timed(start, runs: int):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        process = start()
+        process.communicate()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=300, help="Processes started per path")
+    parser.add_argument("--command", default="hostname" if os.name == "nt" else "uname", help="Command to start")
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["MYCLI_HOME"] = directory
+        from pathindex import ExecutableIndex  # noqa: E402
+        from spawn import spawn  # noqa: E402
+
+        executables = ExecutableIndex()
+        executables.resolve(options.command)  # Index PATH before timing, as a running shell has
+        pipes = {"stdout": subprocess.PIPE, "stderr": subprocess.PIPE}
+        paths = {
+            "shell": lambda: subprocess.Popen(options.command, shell=True, **pipes),
+            "direct": lambda: spawn(executables, options.command, [], options.command, **pipes),
+        }
+        results = {label: timed(start, options.runs) for label, start in paths.items()}
+
+    print(f"{options.runs} x '{options.command}'")
+    for label, samples in results.items():
+        print(f"{label:>6}: median {statistics.median(samples) * 1000:7.3f} ms"
+              f"  mean {statistics.mean(samples) * 1000:7.3f} ms  p95 {sorted(samples)[int(len(samples) * 0.95)] * 1000:7.3f} ms")
+    speedup = statistics.median(results["shell"]) / statistics.median(results["direct"])
+    print(f"direct is {speedup:.2f}x faster (median)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# bench_suggest.py
+"""
+Micro-benchmark: "Did you mean" lookups with difflib versus the bigram index.
+
+    python benchmarks/bench_suggest.py [--names 5000] [--queries 200]
+
+Candidates are the executables on this machine's PATH, padded with generated
+names up to --names; queries are real names with one or two random typos.
+"""
+
+import argparse
+import difflib
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cli"))
+
+from pathindex import ExecutableIndex  # noqa: E402
+from registry import COMMANDS  # noqa: E402
+from suggest import SuggestionIndex  # noqa: E402
+
+
+def candidate_names(count: int, rng: random.Random):
+    names = set(COMMANDS)
+    names.update(ExecutableIndex(index_file=os.devnull).names())
+    while len(names) < count:
+        length = rng.randint(3, 14)
+        names.add("".join(rng.choice(string.ascii_lowercase + "-_") for _ in range(length)))
+    return sorted(names)
+
+
+def typo(word: str, rng: random.Random) -> str:
+    chars = list(word)
+    for _ in range(rng.choice((1, 1, 2)) if len(word) > 4 else 1):
+        i = rng.randrange(len(chars))
+        edit = rng.choice(("substitute", "delete", "insert", "transpose"))
+        if edit == "substitute":
+            chars[i] = rng.choice(string.ascii_lowercase)
+        elif edit == "delete" and len(chars) > 2:
+            del chars[i]
+        elif edit == "insert":
+            chars.insert(i, rng.choice(string.ascii_lowercase))
+        elif i + 1 < len(chars):
+            chars[i], chars[i + 1] = chars[i + 1], chars[i]
+    return "".join(chars)
+
+
+def timed(func, queries):
+    started = time.perf_counter()
+    results = [func(query) for query in queries]
+    return (time.perf_counter() - started) / len(queries), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--names", type=int, default=5000, help="Number of candidate names")
+    parser.add_argument("--queries", type=int, default=200, help="Number of mistyped queries")
+    parser.add_argument("--seed", type=int, default=7)
+    options = parser.parse_args()
+
+    rng = random.Random(options.seed)
+    names = candidate_names(options.names, rng)
+    queries = [typo(rng.choice(names), rng) for _ in range(options.queries)]
+
+    started = time.perf_counter()
+    index = SuggestionIndex(names)
+    build = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for name in names[:100]:
+        index.discard(name)
+        index.add(name)
+    incremental = (time.perf_counter() - started) / 200
+
+    difflib_time, difflib_results = timed(lambda q: difflib.get_close_matches(q, names, n=3, cutoff=0.6), queries)
+    index_time, index_results = timed(lambda q: index.suggest(q, limit=3), queries)
+    worst = max(timed(lambda q: index.suggest(q, limit=3), [query])[0] for query in queries)
+    agree = sum(1 for a, b in zip(difflib_results, index_results) if a[:1] == b[:1])
+
+    print(f"candidates:          {len(names)}")
+    print(f"index build:         {build * 1000:.1f} ms")
+    print(f"add/discard:         {incremental * 1e6:.1f} µs per name")
+    print(f"difflib lookup:      {difflib_time * 1000:.3f} ms per query")
+    print(f"index lookup:        {index_time * 1000:.3f} ms per query (worst {worst * 1000:.3f} ms)")
+    print(f"same top suggestion: {agree}/{len(queries)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# bench_undo.py
+"""
+Micro-benchmark: undoing and redoing many commands in one go.
+
+    python benchmarks/bench_undo.py [--ops 10000]
+
+Creates --ops files in a throwaway directory, each with the undo record
+`touch` leaves (a typed "remove" operation), then times `undo <ops>` and
+`redo <ops>` as the shell runs them: operations applied in process, deleted
+files renamed into the trash, one journal sync per batch.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cli"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--ops", type=int, default=10_000, help="Commands undone, then redone")
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["MYCLI_HOME"] = os.path.join(directory, "state")
+        os.environ["MYCLI_UNDO_MAX_ENTRIES"] = str(options.ops)
+        from main import PowerShell, console  # noqa: E402
+        from undoops import undo_record  # noqa: E402
+
+        work = os.path.join(directory, "work")
+        os.makedirs(work)
+        shell = PowerShell()
+        history = shell.command_history
+        records = []
+        for i in range(options.ops):
+            path = os.path.join(work, f"file{i}.txt")
+            open(path, "w").close()
+            records.append((f"touch {path}", undo_record(f'Deleted file "{path}"', {"op": "remove", "path": path})))
+        history.append_many(records)
+
+        with patch.object(console, "print"):
+            started = time.perf_counter()
+            shell.onecmd(f"undo {options.ops}")
+            undo_seconds = time.perf_counter() - started
+            assert not os.listdir(work) and len(history) == 0, "undo left files behind"
+
+            started = time.perf_counter()
+            shell.onecmd(f"redo {options.ops}")
+            redo_seconds = time.perf_counter() - started
+            assert len(os.listdir(work)) == options.ops and len(history) == options.ops, "redo did not restore every file"
+
+        for label, seconds in (("undo", undo_seconds), ("redo", redo_seconds)):
+            print(f"{label} {options.ops} ops (fsync={history.fsync:<6}) {seconds * 1000:8.1f} ms"
+                  f"  ({seconds / options.ops * 1e6:.1f} us/op)")
+        history.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# accounting.py
+"""
+Resource accounting for `time <command>` and the always-on mode (`time -on`).
+
+A ResourceMeter samples the shell process before and after a line runs. The
+report is the difference.
+
+- Wall time comes from the monotonic clock.
+- CPU time is split in two. The shell's own comes from psutil, which covers
+  builtins, run in process. The children's comes from
+  getrusage(RUSAGE_CHILDREN); it counts only children that have been waited
+  for, which every foreground command has been by the time the line ends.
+- Peak RSS can only be read as a high-water mark over a process's whole life
+  (ru_maxrss), so it is exact only when the line pushed the mark up. Otherwise
+  the line used at most the previous peak, and the report says "≤". On Linux
+  a child's peak is never below the shell's own size when it was started,
+  because exec keeps the mark of the memory it replaces.
+- I/O is the bytes the storage layer saw read and written (psutil
+  io_counters). On Linux that includes children once they are reaped. Where
+  psutil has no I/O counters (macOS), block counts from getrusage are used
+  instead.
+
+Windows has no getrusage: children's CPU time and peak are not reported there.
+"""
+
+import sys
+import time
+from typing import NamedTuple, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BLOCK_SIZE = 512  # Unit of ru_inblock / ru_oublock
+# ru_maxrss is in kilobytes on Linux, bytes on macOS
+MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+class Usage(NamedTuple):
+    wall: float
+    user: float  # The shell process (builtins)
+    system: float
+    child_user: Optional[float]  # Waited-for children (external commands); None where unknown
+    child_system: Optional[float]
+    shell_peak: int
+    shell_peak_exact: bool
+    child_peak: Optional[int]  # None when no child ran
+    child_peak_exact: bool
+    read_bytes: Optional[int]
+    write_bytes: Optional[int]
+
+
+class _Sample(NamedTuple):
+    wall: float
+    user: float
+    system: float
+    rss: int
+    self_peak: int
+    children: Optional[tuple]  # (utime, stime, maxrss, inblock, oublock)
+    io: Optional[tuple]  # (read_bytes, write_bytes)
+
+
+class ResourceMeter:
+    """Measures what runs between entering and leaving it; the result is in .usage."""
+
+    def __init__(self):
+        import psutil
+        self._process = psutil.Process()
+        self._start: Optional[_Sample] = None
+        self.usage: Optional[Usage] = None
+
+    def _sample(self) -> _Sample:
+        process = self._process
+        cpu = process.cpu_times()
+        memory = process.memory_info()
+        children = io = None
+        if resource is not None:
+            own = resource.getrusage(resource.RUSAGE_SELF)
+            peak = own.ru_maxrss * MAXRSS_UNIT
+            usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+            children = (usage.ru_utime, usage.ru_stime, usage.ru_maxrss * MAXRSS_UNIT, usage.ru_inblock, usage.ru_oublock)
+        else:
+            peak = getattr(memory, "peak_wset", memory.rss)
+        if hasattr(process, "io_counters"):
+            counters = process.io_counters()
+            io = (counters.read_bytes, counters.write_bytes)
+        elif resource is not None:
+            blocks = resource.getrusage(resource.RUSAGE_SELF)
+            io = ((blocks.ru_inblock + children[3]) * BLOCK_SIZE, (blocks.ru_oublock + children[4]) * BLOCK_SIZE)
+        return _Sample(time.perf_counter(), cpu.user, cpu.system, memory.rss, peak, children, io)
+
+    def __enter__(self) -> "ResourceMeter":
+        self._start = self._sample()
+        return self
+
+    def __exit__(self, *exc):
+        start, end = self._start, self._sample()
+        shell_exact = end.self_peak > start.self_peak
+        child_user = child_system = child_peak = None
+        child_exact = False
+        if start.children is not None:
+            child_user = end.children[0] - start.children[0]
+            child_system = end.children[1] - start.children[1]
+            child_exact = end.children[2] > start.children[2]
+            if child_exact or child_user or child_system:
+                child_peak = end.children[2]
+        self.usage = Usage(
+            wall=end.wall - start.wall,
+            user=end.user - start.user,
+            system=end.system - start.system,
+            child_user=child_user,
+            child_system=child_system,
+            shell_peak=end.self_peak if shell_exact else max(start.rss, end.rss, end.self_peak),
+            shell_peak_exact=shell_exact,
+            child_peak=child_peak,
+            child_peak_exact=child_exact,
+            read_bytes=end.io[0] - start.io[0] if end.io and start.io else None,
+            write_bytes=end.io[1] - start.io[1] if end.io and start.io else None,
+        )
+        return False
+
+
+def size(count: Optional[int]) -> str:
+    if count is None:
+        return "n/a"
+    for unit in ("B", "KB", "MB", "GB"):
+        if count < 1024 or unit == "GB":
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
+
+
+def describe(usage: Usage) -> str:
+    """The one-line report printed after a timed command (Rich markup)."""
+    parts = [f"real {usage.wall:.3f}s", f"builtin cpu {usage.user:.3f}s user {usage.system:.3f}s sys"]
+    if usage.child_user is not None:
+        parts.append(f"children {usage.child_user:.3f}s user {usage.child_system:.3f}s sys")
+    peaks = f"peak RSS shell {'' if usage.shell_peak_exact else '≤ '}{size(usage.shell_peak)}"
+    if usage.child_peak is not None:
+        peaks += f", children {'' if usage.child_peak_exact else '≤ '}{size(usage.child_peak)}"
+    parts.append(peaks)
+    if usage.read_bytes is not None:
+        parts.append(f"I/O read {size(usage.read_bytes)} write {size(usage.write_bytes)}")
+    return "[dim]⏱  " + " · ".join(parts) + "[/]"
+
+
+def timed_command(line: str) -> Optional[str]:
+    """The command a timed line runs: the line without its `time` prefix, or None for `time -on` and the like."""
+    words = line.split()
+    if not words or words[0] != "time":
+        return line
+    rest = line.strip()[len("time"):].strip()
+    if not rest or rest.split()[0] in ("-on", "-off", "-h", "--help"):
+        return None
+    return rest
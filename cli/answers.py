@@ -0,0 +1,122 @@
+# answers.py
+"""
+Answer policies for non-interactive use (batch scripts, daemon requests).
+
+Builtins and onecmd import Prompt and Confirm from here instead of from
+rich.prompt. With no policy installed they behave exactly like Rich's; with a
+policy installed every question is answered from it and nothing reads the
+terminal, so a script never blocks on a prompt.
+"""
+
+from contextlib import contextmanager
+from typing import List, Optional
+
+from rich.prompt import Confirm as RichConfirm
+from rich.prompt import Prompt as RichPrompt
+
+YES_WORDS = {"y", "yes", "true", "1", "o", "overwrite"}
+YES_CHOICES = ("yes", "y", "overwrite", "o")
+NO_CHOICES = ("no", "n", "cancel", "c")
+
+_policy = None
+
+
+class PromptUnavailable(Exception):
+    """Raised when a prompt needs an answer that the active policy cannot give."""
+
+
+class AnswerPolicy:
+    """Answers prompts from a queue of scripted answers, then from a blanket yes/no.
+
+    `assume` is True for --yes, False for --no, or None to only accept a
+    prompt's own default. Scripted answers are consumed in the order the
+    prompts are asked.
+    """
+
+    def __init__(self, assume: Optional[bool] = None, answers: Optional[List[str]] = None):
+        self.assume = assume
+        self.answers = list(answers or [])
+        self.asked = 0
+
+    @classmethod
+    def from_file(cls, path: str, assume: Optional[bool] = None) -> "AnswerPolicy":
+        """One answer per line; blank lines and lines starting with '#' are skipped."""
+        with open(path, "r", encoding="utf-8") as f:
+            answers = [line.rstrip("\n") for line in f if line.strip() and not line.lstrip().startswith("#")]
+        return cls(assume, answers)
+
+    def _next_answer(self):
+        self.asked += 1
+        return self.answers.pop(0) if self.answers else None
+
+    def confirm(self, message: str, default=...) -> bool:
+        answer = self._next_answer()
+        if answer is not None:
+            return answer.strip().lower() in YES_WORDS
+        if self.assume is not None:
+            return self.assume
+        if default is not ...:
+            return bool(default)
+        raise PromptUnavailable(f"No answer for prompt: {message}")
+
+    def ask(self, message: str, choices: Optional[List[str]] = None, default=...) -> str:
+        answer = self._next_answer()
+        if answer is not None:
+            if choices and answer not in choices:
+                raise PromptUnavailable(f"Answer '{answer}' is not one of {choices} for prompt: {message}")
+            return answer
+        if choices and self.assume is not None:
+            for choice in (YES_CHOICES if self.assume else NO_CHOICES):
+                if choice in choices:
+                    return choice
+        if default is not ...:
+            return str(default)
+        raise PromptUnavailable(f"No answer for prompt: {message}")
+
+    def read_line(self) -> str:
+        """Answer for a bare input() prompt; an empty line picks the builtin's default."""
+        answer = self._next_answer()
+        return answer if answer is not None else ""
+
+
+def get_policy() -> Optional[AnswerPolicy]:
+    return _policy
+
+
+def set_policy(policy: Optional[AnswerPolicy]):
+    global _policy
+    _policy = policy
+
+
+@contextmanager
+def answering(policy: Optional[AnswerPolicy]):
+    """Install `policy` for the duration of a block."""
+    previous = _policy
+    set_policy(policy)
+    try:
+        yield policy
+    finally:
+        set_policy(previous)
+
+
+class Prompt(RichPrompt):
+    @classmethod
+    def ask(cls, prompt="", *, choices=None, default=..., **kwargs):
+        if _policy is None:
+            return super().ask(prompt, choices=choices, default=default, **kwargs)
+        return _policy.ask(str(prompt), choices, default)
+
+
+class Confirm(RichConfirm):
+    @classmethod
+    def ask(cls, prompt="", *, default=..., **kwargs):
+        if _policy is None:
+            return super().ask(prompt, default=default, **kwargs)
+        return _policy.confirm(str(prompt), default)
+
+
+def read_input() -> str:
+    """input() that is answered by the active policy in non-interactive mode."""
+    if _policy is None:
+        return input()
+    return _policy.read_line()
@@ -0,0 +1,38 @@
+# appdata.py
+"""
+Location of the shell's persistent state (indexes, databases, journals).
+
+Everything lives under ~/.mycli unless MYCLI_HOME points somewhere else.
+"""
+
+import json
+import os
+
+
+def data_dir() -> str:
+    """Return the state directory, creating it if needed."""
+    path = os.environ.get("MYCLI_HOME") or os.path.join(os.path.expanduser("~"), ".mycli")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def data_path(*parts: str) -> str:
+    """Return a path inside the state directory."""
+    return os.path.join(data_dir(), *parts)
+
+
+def write_json_atomic(path: str, data):
+    """Write JSON to a temp file and rename it over `path` so readers never see a torn file."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def read_json(path: str, default=None):
+    """Load JSON from `path`, returning `default` if it is missing or corrupt."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
@@ -0,0 +1,225 @@
+# backupstore.py
+"""
+Content-addressed store for the pre-images undo restores.
+
+Instead of copying a file to "<name>.bak" or "backup_<name>" next to the
+user's data, commands save the file here and keep the returned object id in
+their undo record. Layout under <state dir>/backups:
+
+    objects/<id>.json   manifest: size, mode, mtime and either the chunk
+                        list or the name of a linked copy
+    objects/<id>.data   reflink or hardlink of the file, when one was possible
+    chunks/ab/<sha256>  zlib-compressed chunk, shared by every object that
+                        contains those bytes
+
+A save first tries a reflink (copy-on-write clone, Linux FICLONE), then, for a
+file that is about to be deleted, a hardlink. Both cost O(1) whatever the file
+size. Otherwise the file is read in CHUNK_SIZE pieces, and only pieces the
+store has not seen are compressed and written. Saving a 2 GB log again after an
+append therefore writes only its last chunk or two. Chunks are fixed-size
+rather than content-defined: appends keep them aligned, and a rolling hash in
+Python would cost more than it saves.
+
+collect_garbage() removes objects no undo journal refers to, then chunks no
+remaining object uses. Anything younger than GRACE_SECONDS is kept, so an
+object saved by a command that has not written its undo record yet survives.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+import zlib
+from typing import Iterable, Optional, Set
+
+from appdata import data_path
+
+CHUNK_SIZE = 4 * 1024 * 1024
+COMPRESS_LEVEL = 1  # Fast: the store is written on the command's critical path
+GRACE_SECONDS = 600
+FICLONE = 0x40049409  # Linux ioctl: share the source's extents (btrfs, XFS, bcachefs)
+
+RAW, DEFLATE = b"R", b"Z"  # First byte of a chunk file
+
+
+def reflink(source: str, destination: str) -> bool:
+    """Clone `source` to `destination` without copying data; False where unsupported."""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(source, "rb") as src, open(destination, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        try:
+            os.remove(destination)
+        except OSError:
+            pass
+        return False
+
+
+class BackupStore:
+    """Deduplicated, compressed pre-images of files, addressed by object id."""
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or data_path("backups")
+        self.objects = os.path.join(self.root, "objects")
+        self.chunks = os.path.join(self.root, "chunks")
+        os.makedirs(self.objects, exist_ok=True)
+        os.makedirs(self.chunks, exist_ok=True)
+
+    def _manifest_path(self, object_id: str) -> str:
+        return os.path.join(self.objects, f"{object_id}.json")
+
+    def _chunk_path(self, digest: str) -> str:
+        return os.path.join(self.chunks, digest[:2], digest)
+
+    # Saving
+
+    def save(self, path: str, deleting: bool = False) -> str:
+        """Store the current contents of the file at `path`; returns the object id.
+
+        `deleting` says the caller removes the file right after, which makes a
+        hardlink a safe O(1) copy (nothing will modify the shared inode).
+        """
+        st = os.stat(path)
+        object_id = uuid.uuid4().hex
+        manifest = {"size": st.st_size, "mode": st.st_mode & 0o7777, "mtime_ns": st.st_mtime_ns}
+
+        linked = os.path.join(self.objects, f"{object_id}.data")
+        if reflink(path, linked):
+            manifest["link"] = "reflink"
+        elif deleting and self._hardlink(path, linked):
+            manifest["link"] = "hardlink"
+        else:
+            manifest["chunks"] = self._write_chunks(path)
+
+        tmp = self._manifest_path(object_id) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self._manifest_path(object_id))
+        return object_id
+
+    @staticmethod
+    def _hardlink(source: str, destination: str) -> bool:
+        try:
+            os.link(source, destination)
+            return True
+        except (OSError, NotImplementedError):
+            return False  # Different filesystem, or links unsupported
+
+    def _write_chunks(self, path: str):
+        chunks = []
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                digest = hashlib.sha256(data).hexdigest()
+                self._put_chunk(digest, data)
+                chunks.append([digest, len(data)])
+        return chunks
+
+    def _put_chunk(self, digest: str, data: bytes):
+        chunk_path = self._chunk_path(digest)
+        if os.path.exists(chunk_path):
+            os.utime(chunk_path)  # Reused: restart its grace period for a concurrent collection
+            return
+        os.makedirs(os.path.dirname(chunk_path), exist_ok=True)
+        tmp = f"{chunk_path}.{os.getpid()}.tmp"
+        compressor = zlib.compressobj(COMPRESS_LEVEL)
+        view = memoryview(data)
+        with open(tmp, "wb") as out:
+            out.write(DEFLATE)
+            for start in range(0, len(data), 256 * 1024):
+                out.write(compressor.compress(view[start:start + 256 * 1024]))
+            out.write(compressor.flush())
+            compressed = out.tell() - 1
+        if compressed >= len(data):
+            with open(tmp, "wb") as out:  # Already compressed data: keep it as it is
+                out.write(RAW)
+                out.write(data)
+        os.replace(tmp, chunk_path)
+
+    # Restoring
+
+    def manifest(self, object_id: str) -> dict:
+        with open(self._manifest_path(object_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def restore(self, object_id: str, path: str):
+        """Put the saved contents back at `path`, replacing whatever is there."""
+        manifest = self.manifest(object_id)
+        directory = os.path.dirname(os.path.abspath(path))
+        tmp = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.restore")
+        try:
+            if "link" in manifest:
+                source = os.path.join(self.objects, f"{object_id}.data")
+                if not reflink(source, tmp):
+                    shutil.copyfile(source, tmp)
+            else:
+                with open(tmp, "wb") as out:
+                    for digest, length in manifest["chunks"]:
+                        out.write(self._read_chunk(digest, length))
+            os.chmod(tmp, manifest["mode"])
+            os.utime(tmp, ns=(manifest["mtime_ns"], manifest["mtime_ns"]))
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def _read_chunk(self, digest: str, length: int) -> bytes:
+        with open(self._chunk_path(digest), "rb") as f:
+            kind = f.read(1)
+            data = f.read()
+        if kind == DEFLATE:
+            data = zlib.decompress(data)
+        if len(data) != length or hashlib.sha256(data).hexdigest() != digest:
+            raise OSError(f"backup chunk {digest[:12]} is damaged")
+        return data
+
+    # Garbage collection
+
+    def object_ids(self) -> Set[str]:
+        return {name[:-5] for name in os.listdir(self.objects) if name.endswith(".json")}
+
+    def collect_garbage(self, referenced: Iterable[str], now: Optional[float] = None) -> int:
+        """Delete unreferenced objects and chunks older than the grace period; returns how many files went."""
+        now = time.time() if now is None else now
+        referenced = set(referenced)
+        removed = 0
+        live_chunks = set()
+        for object_id in self.object_ids():
+            manifest_path = self._manifest_path(object_id)
+            try:
+                young = now - os.path.getmtime(manifest_path) < GRACE_SECONDS
+                if object_id in referenced or young:
+                    live_chunks.update(digest for digest, _ in self.manifest(object_id).get("chunks", ()))
+                    continue
+                data = os.path.join(self.objects, f"{object_id}.data")
+                if os.path.exists(data):
+                    os.remove(data)
+                os.remove(manifest_path)
+                removed += 1
+            except (OSError, ValueError):
+                continue
+        for prefix in os.listdir(self.chunks):
+            directory = os.path.join(self.chunks, prefix)
+            for name in os.listdir(directory):
+                if name in live_chunks:
+                    continue
+                chunk_path = os.path.join(directory, name)
+                try:
+                    if now - os.path.getmtime(chunk_path) >= GRACE_SECONDS:
+                        os.remove(chunk_path)
+                        removed += 1
+                except OSError:
+                    pass
+        return removed
@@ -0,0 +1,69 @@
+# batch.py
+"""
+Non-interactive batch execution: `mycli run script.txt` and `mycli run -`.
+
+Lines are fed straight to PowerShell.onecmd, without building a
+prompt_toolkit prompt, while an AnswerPolicy answers every question the
+builtins or the typo/flag correction would otherwise ask.
+"""
+
+import json
+import time
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from rich.console import Console
+
+from answers import AnswerPolicy, answering
+
+console = Console()
+
+
+class LineResult(NamedTuple):
+    lineno: int
+    line: str
+    status: int
+    seconds: float
+
+
+def script_lines(stream: Iterable[str]) -> Iterator[Tuple[int, str]]:
+    """Yield (line number, command) pairs, skipping blank lines and '#' comments."""
+    for lineno, raw in enumerate(stream, start=1):
+        line = raw.strip()
+        if line and not line.startswith("#"):
+            yield lineno, line
+
+
+def run_lines(shell, lines: Iterable[Tuple[int, str]], policy: Optional[AnswerPolicy] = None,
+              stop_on_error: bool = False) -> List[LineResult]:
+    """Run each line through shell.onecmd and return one LineResult per line."""
+    results = []
+    policy = policy or AnswerPolicy()
+    with answering(policy):
+        for lineno, line in lines:
+            started = time.perf_counter()
+            stop = False
+            try:
+                shell.onecmd(line)
+                status = shell.last_status
+            except SystemExit as e:  # 'exit' inside a script ends the run
+                status = e.code if isinstance(e.code, int) else 0
+                stop = True
+            except Exception as e:
+                console.print(f"[bold red]❌ Line {lineno}: {e}[/]")
+                status = 1
+            results.append(LineResult(lineno, line, status, time.perf_counter() - started))
+            if stop or (stop_on_error and status != 0):
+                break
+    return results
+
+
+def write_report(results: List[LineResult], stream):
+    """One JSON object per executed line: lineno, line, status, seconds."""
+    for result in results:
+        stream.write(json.dumps(result._asdict()) + "\n")
+
+
+def exit_status(results: List[LineResult]) -> int:
+    """0 if every line succeeded, otherwise the status of the last failing line."""
+    failed = [result.status for result in results if result.status != 0]
+    return failed[-1] if failed else 0
@@ -1,22 +1,19 @@
 import os
 import sys
-import psutil
 import shutil
 import shlex
+import subprocess
 import time
 from rich.console import Console
-from rich.prompt import Prompt, Confirm
-from rich.markdown import Markdown
+from answers import Prompt, Confirm, read_input
 from rich.table import Table
 from rich.panel import Panel
-from rich.spinner import Spinner
 from rich.style import Style
-from rich.progress import Progress, SpinnerColumn, TextColumn
 import platform
-from rich.prompt import Prompt, Confirm 
+from typing import List
+from undoops import undo_record
 
-from prompt_toolkit.shortcuts import input_dialog
-# from assistant import ask_gpt_assistant
+# psutil and the assistant (openai/dotenv) are imported inside the commands that need them
 
 console = Console()      
 SUCCESS_STYLE = Style(color="green", bold=True)
@@ -24,41 +21,88 @@ ERROR_STYLE = Style(color="red", bold=True)
 WARNING_STYLE = Style(color="yellow", bold=True)
 INFO_STYLE = Style(color="blue", bold=True)
 
+def report_error(self, message: str):
+    """Print an error and mark the running builtin as failed (non-zero exit status)."""
+    self.last_status = 1
+    console.print(message)
+
+def report_canceled(self, message: str):
+    """Print that an operation was declined; it did not happen, so the builtin fails (exit status 1)."""
+    self.last_status = 1
+    console.print(message)
+
+def run_system(self, command: str) -> int:
+    """os.system() that records the command's exit code as the builtin's status."""
+    from progress import hand_over
+    hand_over()  # The command writes to the terminal itself; no spinner may draw over it
+    if self.profile is not None:
+        # Under `profile <name>`: a child of our own, so the profile's limits can be set on it
+        from profiles import adopt, limit_options
+        process = subprocess.Popen(command, shell=True, **limit_options(self))  # sh and what it starts inherit the limits
+        adopt(self, process)
+        self.last_status = process.wait()
+        return self.last_status
+    status = os.system(command)
+    if hasattr(os, "waitstatus_to_exitcode") and os.name != "nt":
+        status = os.waitstatus_to_exitcode(status)
+    self.last_status = status
+    return status
+
+def wants_help(argv: List[str]) -> bool:
+    return "--help" in argv or "-h" in argv
+
+def join_args(argv: List[str]) -> str:
+    """Quote argv for the system shell (cmd.exe or sh) so arguments with spaces stay whole."""
+    return subprocess.list2cmdline(argv) if os.name == "nt" else shlex.join(argv)
+
 def show_loader(task_name, func, *args, **kwargs):
-    """Displays a spinner while executing a function."""
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[bold yellow]{task.fields[task_name]}...[/]"),
-        transient=True,
-    ) as progress:
-        task = progress.add_task("", task_name=task_name, total=None)
-        try:
-            result = func(*args, **kwargs)
-            time.sleep(0.5) 
-            return result
-        finally:
-            progress.remove_task(task)
+    """Runs a function, with a spinner if it takes long enough to need one."""
+    from progress import Activity
+    with Activity(console, task_name):
+        return func(*args, **kwargs)
             
-def do_cd(self, arg: str, command_history):
+def undo_save(path: str, deleting: bool = False) -> dict:
+    """Undo operation putting the file at `path` back as it is now, from the backup store."""
+    from backupstore import BackupStore
+    size = os.path.getsize(path)
+    object_id = BackupStore().save(path, deleting=deleting)
+    return {"op": "restore", "object": object_id, "path": os.path.abspath(path), "bytes": size}
+
+
+def undo_trash(path: str) -> dict:
+    """Move `path` to the trash; returns the undo operation that brings it back (a backup where there is no trash)."""
+    from trash import Trash
+    original = os.path.abspath(path)
+    item = Trash().move(path)  # A rename on the same filesystem, whatever the file's size
+    if item is not None:
+        return {"op": "untrash", "item": item, "path": original}
+    op = undo_save(path, deleting=True)
+    os.remove(path)
+    return op
+
+
+def do_cd(self, argv: List[str], command_history):
     """Change directory: cd <path>"""
 
-    if arg in ["--help", "-h"]:
+    if wants_help(argv):
         console.print("[bold cyan]Usage: cd <path>[/]\n[bold #FF8C00]Change the current working directory.")
         return
 
+    arg = argv[0] if argv else ""
+
     # If no directory is entered, prompt the user
     while not arg.strip():
         arg = Prompt.ask("[bold yellow]Please enter the directory path[/]").strip()
         if not arg:  # Prevent infinite loop if user presses Enter without input
-            console.print("[bold red]❌ Error: Directory path cannot be empty.[/]")
+            report_error(self, "[bold red]❌ Error: Directory path cannot be empty.[/]")
             return
 
     if not os.path.exists(arg):
-        console.print(f"[bold red]❌ Error: The directory '{arg}' does not exist.[/]")
+        report_error(self, f"[bold red]❌ Error: The directory '{arg}' does not exist.[/]")
         return
 
     if not os.path.isdir(arg):
-        console.print(f"[bold red]❌ Error: '{arg}' is not a directory.[/]")
+        report_error(self, f"[bold red]❌ Error: '{arg}' is not a directory.[/]")
         return
     
     try:
@@ -66,124 +110,171 @@ def do_cd(self, arg: str, command_history):
         os.chdir(arg)
         console.print(f"[bold cyan]📂 Current directory: [underline]{os.getcwd()}[/][/]") 
 
-        # Store the undo command in history
-        undo_info = {
-            "command": f'cd "{current_dir}"',
-            "message": f'Returned to the previous directory: "{current_dir}".'
-        }
+        # Store the undo record in history
+        undo_info = undo_record(f'Returned to the previous directory: "{current_dir}".',
+                                {"op": "chdir", "path": current_dir})
         command_history.append((f"cd {arg}", undo_info))
+        record_visit(self)
 
     except PermissionError:
-        console.print("[bold red]❌ Error: Permission denied. Unable to access this directory.[/]")
+        report_error(self, "[bold red]❌ Error: Permission denied. Unable to access this directory.[/]")
     except Exception as e:
-        console.print(f"[bold red]❌ Unexpected Error: {str(e)}[/]")
+        report_error(self, f"[bold red]❌ Unexpected Error: {str(e)}[/]")
                 
-def do_ls(self, arg: str):
-    """List files and directories with a loading indicator."""
-    if arg in ["--help", "-h"]:
-        console.print("[bold cyan]Usage: ls[/]\n[bold #FF8C00]List files and directories in the current directory.")
+def record_visit(self):
+    """Rank the new working directory in the frecency database used by z/jump."""
+    try:
+        self.frecency.visit(os.getcwd())
+    except OSError:
+        pass  # A read-only state directory must not make cd fail
+
+def do_z(self, argv: List[str], command_history):
+    """Jump to the best-ranked visited directory: z <part> [part ...]"""
+    if wants_help(argv):
+        console.print(
+            "[bold cyan]Usage: z [-l] <part> [part ...][/]\n"
+            "\nOptions:\n"
+            "  [green]-l[/]  List the matching directories with their scores instead of jumping\n"
+            "[bold #FF8C00]Change to the most frequently and recently visited directory whose path "
+            "contains every part, in order (e.g. 'z proj src').[/]"
+        )
         return
-    
-    directory = arg if arg else os.getcwd()
-    
+
+    terms = [a for a in argv if a != "-l"]
+    if "-l" in argv or not terms:
+        ranked = self.frecency.ranked(terms)[:20]
+        if not ranked:
+            report_error(self, "[bold yellow]⚠  No visited directories match.[/]")
+            return
+        table = Table(title="📂 Frecent Directories", header_style="bold cyan")
+        table.add_column("Score", justify="right", style="bold yellow")
+        table.add_column("Directory", style="bold magenta")
+        for score, path in ranked:
+            table.add_row(f"{score:.1f}", path)
+        console.print(table)
+        return
+
+    target = self.frecency.best(terms)
+    if target is None and len(terms) == 1 and os.path.isdir(os.path.expanduser(terms[0])):
+        target = os.path.expanduser(terms[0])  # Like z, a plain path works too
+    if target is None:
+        report_error(self, f"[bold red]❌ No visited directory matches '{' '.join(terms)}'.[/]")
+        return
+    do_cd(self, [target], command_history)
+
+LS_USAGE = (
+    "\nOptions:\n"
+    "  [green]-l[/]  Long format: mode, size, modification time\n"
+    "  [green]-a[/]  Include hidden files\n"
+    "  [green]-1[/]  One name per line instead of columns\n"
+    "  [green]-N[/]  Sort by name, numbers by value (file2 before file10)\n"
+    "  [green]-S[/]  Sort by size, largest first\n"
+    "  [green]-t[/]  Sort by modification time, newest first\n"
+    "  [green]-r[/]  Reverse the order\n"
+    "  [green]-U[/]  Don't sort: stream entries as the file system returns them\n"
+)
+
+def list_directory(self, argv: List[str], default):
+    """`ls` and `dir`: one listing engine, different defaults."""
+    from listing import parse_args, rows, write
+    try:
+        options, directory = parse_args(argv, default)
+    except ValueError as e:
+        report_error(self, f"[bold red]❌ Error: {e}[/]")
+        return
+    directory = directory or os.getcwd()
+
     if not os.path.exists(directory):
-        console.print(f"[bold red]❌ Error: The directory '{directory}' does not exist.[/]")
+        report_error(self, f"[bold red]❌ Error: The directory '{directory}' does not exist.[/]")
         return
-    
+
     if not os.path.isdir(directory):
-        console.print(f"[bold red]❌ Error: '{directory}' is not a directory.[/]")
+        report_error(self, f"[bold red]❌ Error: '{directory}' is not a directory.[/]")
         return
-    
-    console.print("[bold cyan]📂 Scanning directory...[/]")
+
     try:
-        files = os.listdir(directory)
-        if not files:
+        console.print("[bold green]📁 Files & Directories:[/]")
+        sys.stdout.flush()
+        count = write(rows(directory, options), options)
+        if not count:
             console.print("[bold yellow]⚠️ The directory is empty.[/]")
             return
-        
-        console.print("\n[bold green]📁 Files & Directories:[/]")
-        for file in sorted(files):
-            console.print(f"  - {file}")
-
-        console.print("[bold green]✅ Listing complete![/] 🎉")
+        console.print(f"[bold green]✅ Listing complete![/] 🎉 [dim]({count} entries)[/]")
 
     except PermissionError:
-        console.print("[bold red]❌ Error: Permission denied. Unable to list this directory.[/]")
+        report_error(self, "[bold red]❌ Error: Permission denied. Unable to list this directory.[/]")
     except Exception as e:
-        console.print(f"[bold red]❌ Unexpected Error: {str(e)}[/]")
-                
-def do_dir(self, arg: str):
-            """List files and directories"""
-            if arg in ["--help", "-h"]:
-                console.print("[bold cyan]Usage: ls[/]\n[bold #FF8C00]List files and directories in the current directory.")
-                return
-            
-            directory = arg if arg else os.getcwd()
-    
-            if not os.path.exists(directory):
-                console.print(f"[bold red]❌ Error: The directory '{directory}' does not exist.[/]")
-                return
-            
-            if not os.path.isdir(directory):
-                console.print(f"[bold red]❌ Error: '{directory}' is not a directory.[/]")
-                return
-    
-            try:
-                console.print("[bold cyan]📂 Scanning directory...[/]")
-                
-                with console.status("[bold yellow]Listing files...[/]"):
-                    time.sleep(1)  # Simulate loading time
-                    files = os.listdir(arg if arg else os.getcwd())
-
-                console.print("\n[bold green]📁 Files & Directories:[/]")
-                for file in files:
-                    console.print(f"  - {file}")
+        report_error(self, f"[bold red]❌ Unexpected Error: {str(e)}[/]")
 
-                console.print("[bold green]✅ Listing complete![/] 🎉")
-            except Exception as e:
-                console.print(f"[bold red]❌ Error: {str(e)}[/]")
+def do_ls(self, argv: List[str]):
+    """List files and directories, sorted by name."""
+    if wants_help(argv):
+        console.print("[bold cyan]Usage: ls [options] [directory][/]\n" + LS_USAGE +
+                      "[bold #FF8C00]List files and directories, sorted by name (-U streams them unsorted).")
+        return
+    from listing import LS_DEFAULTS
+    list_directory(self, argv, LS_DEFAULTS)
+
+def do_dir(self, argv: List[str]):
+    """List files and directories in long format, as the file system returns them."""
+    if wants_help(argv):
+        console.print("[bold cyan]Usage: dir [options] [directory][/]\n" + LS_USAGE +
+                      "[bold #FF8C00]List files and directories in long format, unsorted unless -N, -S or -t is given.")
+        return
+    from listing import DIR_DEFAULTS
+    list_directory(self, argv, DIR_DEFAULTS)
 
-def do_tree(self, arg: str):
-    """Display folder structure with interactive mode"""
+def do_tree(self, argv: List[str]):
+    """Display folder structure, drawn as it is read"""
 
-    if arg in ["--help", "-h"]:
+    if wants_help(argv):
         console.print(
-            "[bold cyan]Usage: tree <options> <directory>[/]\n"
+            "[bold cyan]Usage: tree [options] [directory][/]\n"
             "\nOptions:\n"
-            "  [green]/f[/]  Show files\n"
-            "  [green]/a[/]  Use ASCII characters\n"
+            "  [green]/f[/]          Show files\n"
+            "  [green]/a[/]          Use ASCII characters\n"
+            "  [green]-a[/]          Include hidden files and directories\n"
+            "  [green]-L n[/]        Descend at most n levels\n"
+            "  [green]-I pattern[/]  Leave out names matching a pattern, e.g. -I \"node_modules|*.pyc\"\n"
+            "  [green]-s[/]          Show sizes; a directory's is the total of everything under it\n"
+            "  [green]-J[/]          Print the tree as JSON (tree -J > tree.json to save it)\n"
             "[bold #FF8C00]Display folder structure.[/]"
         )
         return
 
+    from treewalk import TreeError, Walker, json_chunks, parse_args, text_lines, write
     try:
-        # Ask for the directory path if not provided
-        directory = arg if arg else Prompt.ask("Enter directory path", default=os.getcwd())
-
-        # Ask the user whether to include options
-        include_files = Confirm.ask("Include files in the tree output? (Use '/f' option)", default=False)
-        use_ascii = Confirm.ask("Use ASCII characters instead of Unicode? (Use '/a' option)", default=False)
-
-        # Construct the command with options
-        options = ""
-        if include_files:
-            options += "/f "
-        if use_ascii:
-            options += "/a "
-
-        command = f"tree {options}{directory}"
-        with Progress(SpinnerColumn(), TextColumn("[cyan]Building folder structure...[/]")) as progress:
-            task = progress.add_task("", total=None)
-            os.system(command)
-            progress.update(task, completed=True)
-
-        console.print(f"[bold green]✅ Executed:[/] {command}")
+        options, directory = parse_args(argv)
+    except TreeError as e:
+        report_error(self, f"[bold red]❌ Error: {e}[/]")
+        self.last_status = 2
+        return
+    directory = directory or "."
+    if not os.path.isdir(directory):
+        report_error(self, f"[bold red]❌ Error: '{directory}' is not a directory.[/]")
+        return
+
+    try:
+        sys.stdout.flush()
+        with Walker(options) as walker:
+            if options.json:
+                write(json_chunks(walker, directory), newline=False)
+                return
+            write(text_lines(walker, directory))
+        summary = f"{walker.directories} directories" + (f", {walker.files} files" if options.files else "")
+        if options.sizes:
+            from accounting import size
+            summary += f", {size(walker.totals.get(directory, 0))} in all"
+        console.print(f"\n[bold green]✅ {summary}[/]")
+        if walker.unreadable:
+            report_error(self, f"[bold yellow]⚠  {len(walker.unreadable)} directories could not be read, "
+                               f"e.g. {walker.unreadable[0]}[/]")
     except Exception as e:
-        console.print(f"[bold red]❌ Error: {str(e)}[/]")
+        report_error(self, f"[bold red]❌ Error: {str(e)}[/]")
     
-def do_taskkill(self, arg: str):
+def do_taskkill(self, argv: List[str]):
         """Kill a process by name or PID"""
-        if arg in ["--help", "-h"]:
+        if wants_help(argv):
             console.print(
                 "[bold cyan]Usage: taskkill /PID <id> /F or taskkill /IM <process_name> /F[/]\n"
                 "Options:\n"
@@ -196,7 +287,8 @@ def do_taskkill(self, arg: str):
         
         try:
             """Kill a process interactively"""
-            if not arg:
+            if not argv:
+                import psutil
                 processes = [p.info for p in psutil.process_iter(['pid', 'name'])]
 
                 if not processes:
@@ -224,28 +316,29 @@ def do_taskkill(self, arg: str):
                 pid = pid_map[choice]
 
                 if Confirm.ask(f"Are you sure you want to kill PID {pid} ({processes[int(choice) - 1]['name']})?"):
-                    os.system(f"taskkill /PID {pid} /F")
+                    run_system(self, f"taskkill /PID {pid} /F")
                     console.print(f"[bold red]Process {pid} terminated.[/]")
 
                 return
 
             # Validate arguments before executing the command
-            if not arg.startswith("/PID") and not arg.startswith("/IM"):
-                console.print("[bold red]❌ Invalid argument. Use --help to see correct usage.[/]")
+            if "/PID" not in argv and "/IM" not in argv:
+                report_error(self, "[bold red]❌ Invalid argument. Use --help to see correct usage.[/]")
                 return
 
-            os.system(f"taskkill {arg}")
+            arg = join_args(argv)
+            run_system(self, f"taskkill {arg}")
             console.print(f"[bold green]Executed:[/] taskkill {arg}")
 
         except KeyError:
-            console.print("[bold red]❌ Invalid selection. Please enter a valid number.[/]")
+            report_error(self, "[bold red]❌ Invalid selection. Please enter a valid number.[/]")
         except Exception as e:
-            console.print(f"[bold red]❌ Error: {str(e)}[/]")
+            report_error(self, f"[bold red]❌ Error: {str(e)}[/]")
         
-def do_ping(self, arg: str):
+def do_ping(self, argv: List[str]):
     """Test network connectivity with interactive mode and guided options"""
     
-    if arg in ["--help", "-h"]:
+    if wants_help(argv):
         console.print(
             "[bold cyan]Usage: ping <host> [options][/]\n"
             "[bold yellow]Options:[/]\n"
@@ -255,11 +348,21 @@ def do_ping(self, arg: str):
         )
         return
     try:
+        hosts = [a for a in argv if not a.startswith("-")]
+        if argv and hosts != argv:
+            # Flags given on the command line: run exactly what was typed
+            cmd = f"ping {join_args(argv)}"
+            console.print(f"[bold green]✅ Executing:[/] {cmd}")
+            show_loader("Pinging", run_system, self, cmd)
+            return
+
+        arg = join_args(hosts)
+
         # Interactive mode: Ask for host if not provided
         while not arg.strip():
             arg = Prompt.ask("[bold yellow]Enter the host to ping (e.g., google.com)[/]").strip()
             if not arg:
-                console.print("[bold red]❌ Error:[/] Hostname cannot be empty.")
+                report_error(self, "[bold red]❌ Error:[/] Hostname cannot be empty.")
                 return
 
         # Ask if the user wants to customize options
@@ -282,13 +385,13 @@ def do_ping(self, arg: str):
 
         # Execute the command
         console.print(f"[bold green]✅ Executing:[/] {cmd}")
-        show_loader("Pinging", os.system, cmd)
+        show_loader("Pinging", run_system, self, cmd)
     except Exception as e:
-        console.print(f"[bold red]❌ Error:[/] {str(e)}")
+        report_error(self, f"[bold red]❌ Error:[/] {str(e)}")
 
-def do_nslookup(self, arg: str):
+def do_nslookup(self, argv: List[str]):
         """Get DNS information for a domain"""
-        if arg in ["--help", "-h"]:
+        if wants_help(argv):
             console.print(
                 "[bold cyan]Usage: nslookup <domain>[/]\n"
                 "[bold #FF8C00]Get IP address and DNS records for a domain."
@@ -296,21 +399,22 @@ def do_nslookup(self, arg: str):
             return
         
         try:
+            arg = join_args(argv)
             if not arg:
                 console.print("[bold yellow]Enter a domain to query:[/]")
-                arg = input().strip()
+                arg = read_input().strip()
                 if not arg:
-                    console.print("[bold red]❌ Error: Domain cannot be empty.[/]")
+                    report_error(self, "[bold red]❌ Error: Domain cannot be empty.[/]")
                     return
             
-            show_loader("Looking up DNS", os.system, f"nslookup {arg}")
+            show_loader("Looking up DNS", run_system, self, f"nslookup {arg}")
             console.print(f"[bold green]✅ Executed:[/] nslookup {arg}")
         except Exception as e:
-            console.print(f"[bold red]❌ Error: {str(e)}[/]")
+            report_error(self, f"[bold red]❌ Error: {str(e)}[/]")
         
-def do_whoami(self, arg: str):
+def do_whoami(self, argv: List[str]):
         """Display the current user"""
-        if arg in ["--help", "-h"]:
+        if wants_help(argv):
             console.print(
                 "[bold cyan]Usage: whoami[/]\n"
                 "[bold #FF8C00]Shows the currently logged-in user."
@@ -318,14 +422,14 @@ def do_whoami(self, arg: str):
             return
         
         try:
-            os.system("whoami")
+            run_system(self, "whoami")
             console.print("[bold green]✅ Executed:[/] whoami")
         except Exception as e:
-            console.print(f"[bold red]❌ Error: {str(e)}[/]")
+            report_error(self, f"[bold red]❌ Error: {str(e)}[/]")
 
-def do_hostname(self, arg: str):
+def do_hostname(self, argv: List[str]):
         """Show the computer’s hostname"""
-        if arg in ["--help", "-h"]:
+        if wants_help(argv):
             console.print(
                 "[bold cyan]Usage: hostname[/]\n"
                 "[bold #FF8C00]Displays the name of the computer."
@@ -333,24 +437,26 @@ def do_hostname(self, arg: str):
             return
         
         try:
-            os.system("hostname")
+            run_system(self, "hostname")
             console.print("[bold green]✅ Executed:[/] hostname")
         except Exception as e:
-            console.print(f"[bold red]❌ Error: {str(e)}[/]")
+            report_error(self, f"[bold red]❌ Error: {str(e)}[/]")
 
-def do_systeminfo(self, arg: str):
+def do_systeminfo(self, argv: List[str]):
     """Get detailed system information with enhanced UI"""
 
     valid_sections = {"OS": "OS Name", "Memory": "Total Physical Memory", "CPU": "Processor"}
     
     # Help message
-    if arg in ["--help", "-h"]:
+    if wants_help(argv):
         console.print(
             "[bold cyan]Usage: systeminfo [OS|Memory|CPU|All][/]\n"
             "[bold #FF8C00]Displays detailed system information, including OS version, memory, and CPU details.[/]"
         )
         return
 
+    import psutil
+
     # Retrieve system information
     system_info = {
         "OS": platform.system() + " " + platform.release(),
@@ -358,14 +464,13 @@ def do_systeminfo(self, arg: str):
         "CPU": platform.processor(),
     }
 
+    arg = argv[0] if argv else ""
+
     # If a valid argument is provided, fetch information directly
     if arg.strip():
         if arg in valid_sections or arg == "All":
             console.print("\n[bold cyan]🔍 Gathering system information...[/]")
 
-            with console.status("[bold yellow]Loading system details...[/]"):
-                time.sleep(1)  # Simulate loading time
-
             table = Table(title="🖥️ System Information", show_lines=True)
             table.add_column("Category", style="bold cyan", justify="left")
             table.add_column("Details", style="bold white", justify="left")
@@ -379,7 +484,7 @@ def do_systeminfo(self, arg: str):
             console.print(table)
             console.print("[bold green]✅ System information retrieved successfully![/] 🎉")
         else:
-            console.print(f"[bold red]❌ Invalid argument '{arg}'. Use --help to see valid options.[/]")
+            report_error(self, f"[bold red]❌ Invalid argument '{arg}'. Use --help to see valid options.[/]")
         return
 
     # Interactive mode when no argument is provided
@@ -390,9 +495,6 @@ def do_systeminfo(self, arg: str):
 
         console.print("\n[bold cyan]🔍 Gathering system information...[/]")
 
-        with console.status("[bold yellow]Loading system details...[/]"):
-            time.sleep(1.5)  # Simulate loading time
-
         table = Table(title="🖥️ System Information", show_lines=True)
         table.add_column("Category", style="bold cyan", justify="left")
         table.add_column("Details", style="bold white", justify="left")
@@ -406,14 +508,14 @@ def do_systeminfo(self, arg: str):
         console.print(table)
         console.print("[bold green]✅ System information retrieved successfully![/] 🎉")
     except Exception as e:
-        console.print(f"[bold red]❌ Error: {str(e)}[/]")
+        report_error(self, f"[bold red]❌ Error: {str(e)}[/]")
 
 
-def do_tasklist(self, arg: str):
+def do_tasklist(self, argv: List[str]):
     """List running processes with optional filtering"""
 
     # Help message
-    if arg in ["--help", "-h"]:
+    if wants_help(argv):
         console.print(
             "[bold cyan]Usage: tasklist <options>[/]\n"
             "\nOptions:\n"
@@ -426,15 +528,16 @@ def do_tasklist(self, arg: str):
 
     try:
         # Check if an argument is provided for direct execution
-        if arg.strip():
+        if argv:
+            arg = join_args(argv)
             # Validate allowed options
             allowed_options = ["/v", "/svc", "/fi"]
-            if any(opt in arg for opt in allowed_options):
-                os.system(f'tasklist {arg}')
+            if any(opt in argv for opt in allowed_options):
+                run_system(self, f'tasklist {arg}')
                 console.print(f"[bold green]✅ Executed:[/] tasklist {arg}")
                 return
             else:
-                console.print(f"[bold red]❌ Invalid argument '{arg}'. Use --help to see valid options.[/]")
+                report_error(self, f"[bold red]❌ Invalid argument '{arg}'. Use --help to see valid options.[/]")
                 return
 
         # Interactive mode when no argument is given
@@ -443,6 +546,8 @@ def do_tasklist(self, arg: str):
         # Allow user to filter processes
         filter_by = Prompt.ask("Filter by", choices=["name", "memory", "cpu", "all"], default="all")
 
+        import psutil
+
         processes = [p.info for p in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_info'])]
 
         if filter_by == "name":
@@ -463,26 +568,23 @@ def do_tasklist(self, arg: str):
         table.add_column("Memory (MB)", justify="right", style="bold green")
         table.add_column("CPU (%)", justify="right", style="bold yellow")
 
-        with Progress(SpinnerColumn(), TextColumn("[cyan]Fetching process list...[/]")) as progress:
-            task = progress.add_task("", total=None)
-            for proc in processes[:15]:  # Limit to first 15 results
-                table.add_row(
-                    str(proc['pid']),
-                    proc['name'],
-                    f"{proc['memory_info'].rss / (1024 ** 2):.2f}" if proc['memory_info'] else "N/A",
-                    f"{proc['cpu_percent']:.2f}" if proc.get('cpu_percent') else "N/A"
-                )
-            progress.update(task, completed=True)
+        for proc in processes[:15]:  # Limit to first 15 results
+            table.add_row(
+                str(proc['pid']),
+                proc['name'],
+                f"{proc['memory_info'].rss / (1024 ** 2):.2f}" if proc['memory_info'] else "N/A",
+                f"{proc['cpu_percent']:.2f}" if proc.get('cpu_percent') else "N/A"
+            )
 
         console.print(table)
         console.print("[bold green]✅ Process list retrieved successfully![/] 🎉")
 
     except Exception as e:
-        console.print(f"[bold red]❌ Error: {str(e)}[/]")
+        report_error(self, f"[bold red]❌ Error: {str(e)}[/]")
         
-def do_ipconfig(self, arg: str):
+def do_ipconfig(self, argv: List[str]):
         """Show network configuration"""
-        if arg in ["--help", "-h"]:
+        if wants_help(argv):
             console.print(
                 "[bold cyan]Usage: ipconfig <options> [/]\n"
                 "\nOptions:\n"
@@ -494,38 +596,40 @@ def do_ipconfig(self, arg: str):
             return
         
         try:
-            os.system(f"ipconfig {arg}")
-            console.print(f"[bold green]✅ Executed:[/] ipconfig {arg}")
+            command = f"ipconfig {join_args(argv)}".rstrip()
+            run_system(self, command)
+            console.print(f"[bold green]✅ Executed:[/] {command}")
         except Exception as e:
-            console.print(f"[bold red]❌ Error: {str(e)}[/]")
+            report_error(self, f"[bold red]❌ Error: {str(e)}[/]")
 
-def do_tracert(self, arg: str):
+def do_tracert(self, argv: List[str]):
         """Trace the route packets take to a destination"""
-        if arg in ["--help", "-h"]:
+        if wants_help(argv):
             console.print(
                 "[bold cyan]Usage: tracert <destination>[/]\n"
                 "[bold #FF8C00]Traces the path packets take to reach a destination."
             )
             return
         try:
+            arg = join_args(argv)
             if not arg:
                 console.print("[bold yellow]Enter a destination to trace (e.g., google.com):[/]")
-                arg = input().strip()
+                arg = read_input().strip()
                 if not arg:
-                    console.print("[bold red]❌ Error: Destination cannot be empty.[/]")
+                    report_error(self, "[bold red]❌ Error: Destination cannot be empty.[/]")
                     return
 
-            show_loader(f"Tracing route to {arg}", os.system, f"tracert {arg}")
+            show_loader(f"Tracing route to {arg}", run_system, self, f"tracert {arg}")
             console.print(f"[bold green]✅ Executed: tracert {arg}[/]")
         except Exception as e:
-            console.print(f"[bold red]❌ Error: {str(e)}[/]")
+            report_error(self, f"[bold red]❌ Error: {str(e)}[/]")
 
-def do_netstat(self, arg: str):
+def do_netstat(self, argv: List[str]):
     """Display active network connections interactively or with a given filter"""
     
     try:
         # ✅ Handle --help or -h flag
-        if arg in ["--help", "-h"]:
+        if wants_help(argv):
             console.print(
                 "[bold cyan]Usage: netstat <options>[/]\n\n"
                 "Options:\n"
@@ -540,42 +644,36 @@ def do_netstat(self, arg: str):
         def run_netstat(command: str):
             """Execute netstat with a progress indicator and error handling"""
             try:
-                with Progress(
-                    SpinnerColumn(), TextColumn("[cyan]Running netstat...[/]"), transient=True
-                ) as progress:
-                    progress.add_task("Executing", total=None)
-                    time.sleep(0.5)  # Small delay for better UI
-                    os.system(command)
+                show_loader("Running netstat", run_system, self, command)
                 
                 console.print(f"[bold green]✅ Executed: {command}[/]")
             
             except Exception as e:
-                console.print(f"[bold red]❌ Error executing netstat: {str(e)}[/]")
+                report_error(self, f"[bold red]❌ Error executing netstat: {str(e)}[/]")
 
         # ✅ Non-Interactive Mode (if argument is provided)
-        if arg:
-            safe_arg = shlex.quote(arg)  # Prevents potential shell injection
-            run_netstat(f"netstat {safe_arg}")
+        if argv:
+            run_netstat(f"netstat {join_args(argv)}")  # Quoted per argument, so nothing is run by the shell
             return
         
         # ✅ Interactive Mode (if no argument is provided)
         while True:
             console.print("[bold yellow]Enter filter (e.g., -p tcp) or press Enter to continue:[/]")
-            filter_opt = input().strip()
+            filter_opt = read_input().strip()
 
-            safe_filter = shlex.quote(filter_opt)  # Secure user input
-            run_netstat(f"netstat {safe_filter}")
+            safe_filter = join_args(shlex.split(filter_opt))  # Secure user input
+            run_netstat(f"netstat {safe_filter}".rstrip())
 
             console.print("[bold cyan]Run again with a different filter? (y/n)[/]")
-            if input().strip().lower() != 'y':
+            if read_input().strip().lower() != 'y':
                 break
     
     except Exception as e:
-        console.print(f"[bold red]❌ Unexpected error: {str(e)}[/]")
+        report_error(self, f"[bold red]❌ Unexpected error: {str(e)}[/]")
 
-def do_diskpart(self, arg: str):
+def do_diskpart(self, argv: List[str]):
         """Manage disk partitions"""
-        if arg in ["--help", "-h"]:
+        if wants_help(argv):
             console.print(
                 "[bold cyan]Usage: diskpart [/]\n"
                 "[bold #FF8C00]Opens the disk partition management tool."
@@ -583,17 +681,17 @@ def do_diskpart(self, arg: str):
             return
         try:
             if not Confirm.ask("[bold red]⚠ Warning: Disk partitioning can cause data loss! Continue? (y/n)[/]"):
-                console.print("[bold red]❎ Aborted.[/]")
+                report_canceled(self, "[bold red]❎ Aborted.[/]")
                 return
 
-            show_loader("Opening disk partition tool", os.system, "diskpart")
+            show_loader("Opening disk partition tool", run_system, self, "diskpart")
             console.print("[bold green]✅ Executed: diskpart[/]")
         except Exception as e:
-            console.print(f"[bold red]❌ Error: {str(e)}[/]")
+            report_error(self, f"[bold red]❌ Error: {str(e)}[/]")
         
-def do_chkdsk(self, arg: str):
+def do_chkdsk(self, argv: List[str]):
         """Check disk for errors interactively if no argument is given"""
-        if arg in ["--help", "-h"]:
+        if wants_help(argv):
             console.print(
                 "[bold cyan]Usage: chkdsk <drive> <options> [/]\n"
                 "\nOptions:\n"
@@ -604,6 +702,8 @@ def do_chkdsk(self, arg: str):
             return
         
         try:
+            arg = join_args(argv)
+
             # Interactive mode if no argument is given
             if not arg:
                 console.print("[bold yellow]Interactive Mode: Let's configure your chkdsk command![/]")
@@ -618,19 +718,19 @@ def do_chkdsk(self, arg: str):
                 if Confirm.ask("Do you want to locate bad sectors and recover readable data? (/r)"):
                     options.append("/r")
 
-                arg = f"{drive} {' '.join(options)}"
+                arg = join_args([drive] + options)
 
-            show_loader(f"Running chkdsk on {arg}", os.system, f"chkdsk {arg}")
+            show_loader(f"Running chkdsk on {arg}", run_system, self, f"chkdsk {arg}")
             console.print(f"[bold green]✅ Executed: chkdsk {arg}[/]")
         except Exception as e:
-            console.print(f"[bold red]❌ Error: {str(e)}[/]")
+            report_error(self, f"[bold red]❌ Error: {str(e)}[/]")
 
-def do_wmic(self, arg: str):
+def do_wmic(self, argv: List[str]):
     """Retrieve disk information interactively or with a specified query"""
 
     try:
         # ✅ Handle --help or -h flag
-        if arg in ["--help", "-h"]:
+        if wants_help(argv):
             console.print(
                 "[bold cyan]Usage: wmic logicaldisk get <options>[/]\n\n"
                 "Options:\n"
@@ -645,28 +745,23 @@ def do_wmic(self, arg: str):
         def run_wmic(command: str):
             """Execute WMIC with a progress indicator and error handling"""
             try:
-                with Progress(
-                    SpinnerColumn(), TextColumn("[cyan]Fetching disk information...[/]"), transient=True
-                ) as progress:
-                    progress.add_task("Executing", total=None)
-                    time.sleep(0.5)  # Small delay for better UI
-                    os.system(command)
+                show_loader("Fetching disk information", run_system, self, command)
                 
                 console.print(f"[bold green]✅ Executed: {command}[/]")
 
             except Exception as e:
-                console.print(f"[bold red]❌ Error executing WMIC: {str(e)}[/]")
+                report_error(self, f"[bold red]❌ Error executing WMIC: {str(e)}[/]")
 
         # ✅ Non-Interactive Mode (if argument is provided)
-        if arg:
-            safe_arg = shlex.quote(arg)  # Prevents potential shell injection
+        if argv:
+            safe_arg = shlex.quote(" ".join(argv))  # Prevents potential shell injection
             run_wmic(f"wmic logicaldisk get {safe_arg}")
             return
 
         # ✅ Interactive Mode (if no argument is provided)
         while True:
             console.print("[bold yellow]Enter properties to retrieve (e.g., size, caption) or press Enter for default:[/]")
-            user_input = input().strip()
+            user_input = read_input().strip()
             if not user_input:
                 user_input = "size, caption"  # Default properties
 
@@ -674,27 +769,30 @@ def do_wmic(self, arg: str):
             run_wmic(f"wmic logicaldisk get {safe_query}")
 
             console.print("[bold cyan]Run again with a different query? (y/n)[/]")
-            if input().strip().lower() != 'y':
+            if read_input().strip().lower() != 'y':
                 break
 
     except Exception as e:
-        console.print(f"[bold red]❌ Unexpected error: {str(e)}[/]")
+        report_error(self, f"[bold red]❌ Unexpected error: {str(e)}[/]")
         
-def do_touch(self, arg: str, command_history):
+def do_touch(self, argv: List[str], command_history):
     """Create an empty file with interactive mode"""
-    if arg in ["--help", "-h"]:
+    if wants_help(argv):
         console.print("[bold cyan]Usage: touch <filename>[/]\n[bold #FF8C00]Create an empty file.")
         return
     try:
+        arg = argv[0] if argv else ""
+
         # Interactive mode if no filename is given
         while not arg.strip():
             arg = Prompt.ask("[bold yellow]Please enter the filename to create[/]").strip()
             if not arg:  # Prevent infinite loop if user presses Enter without input
-                console.print("[bold red]❌ Error: Filename cannot be empty.[/]")
+                report_error(self, "[bold red]❌ Error: Filename cannot be empty.[/]")
                 return
 
         # Handle case where file already exists
-        if os.path.exists(arg):
+        existed = os.path.exists(arg)
+        if existed:
             choice = Prompt.ask(
                 f"[bold yellow]File '{arg}' already exists. What do you want to do?[/]",
                 choices=["overwrite", "cancel", "new"],
@@ -702,7 +800,7 @@ def do_touch(self, arg: str, command_history):
             )
 
             if choice == "cancel":
-                console.print("[bold cyan]❎ Operation canceled.[/]")
+                report_canceled(self, "[bold cyan]❎ Operation canceled.[/]")
                 return
             elif choice == "new":
                 base, ext = os.path.splitext(arg)
@@ -712,63 +810,62 @@ def do_touch(self, arg: str, command_history):
                     counter += 1
                     new_arg = f"{base}_{counter}{ext}"
                 arg = new_arg
+                existed = False
                 console.print(f"[bold green]📄 Creating new file as '{arg}' instead.[/]")
 
+        # Overwriting: keep the old contents so undo can put them back
+        previous = undo_save(arg) if existed else None
+
         with open(arg, "w") as f:
             pass
         console.print(f"[bold green]✅ Created file: {arg}[/]")
 
-        # Store the undo command in history
-        undo_info = {
-            "command": f'del "{arg}"' if os.name == "nt" else f'rm "{arg}"',
-            "message": f'Deleted file "{arg}"'
-        }
-        command_history.append((f"touch {arg}", undo_info))
+        # Store the undo record in history
+        if previous is not None:
+            command_history.append((f"touch {arg}", undo_record(f'Restored file "{arg}"', previous)))
+        elif not existed:
+            undo_info = undo_record(f'Deleted file "{arg}"', {"op": "remove", "path": os.path.abspath(arg)})
+            command_history.append((f"touch {arg}", undo_info))
     except Exception as e:
-        console.print(f"[bold red]❌ Error creating file: {str(e)}[/]")
+        report_error(self, f"[bold red]❌ Error creating file: {str(e)}[/]")
             
-def do_append(self, arg: str, command_history):
+def do_append(self, argv: List[str], command_history):
         """Append text to a file"""
 
         # Contextual Help System
-        if arg in ["--help", "-h"]:
+        if wants_help(argv):
             console.print("[bold cyan]Usage: append <filename> <text>[/]\n[bold #FF8C00]Append text to the specified file.[/]")
             return
         try:
-            parts = shlex.split(arg)
-            if len(parts) < 2:
-                console.print("[bold red]❌ Usage: append <filename> <text>[/]")
+            if len(argv) < 2:
+                report_error(self, "[bold red]❌ Usage: append <filename> <text>[/]")
                 return
             
-            filename, text = parts[0], " ".join(parts[1:])
+            filename, text = argv[0], " ".join(argv[1:])
             
-            # Backup the file before appending
-            backup_path = f"backup_{filename}"
-            shutil.copy(filename, backup_path)
+            # Remember where the file ended: undo cuts it back there instead of restoring a copy
+            length = os.path.getsize(filename)
             
             with open(filename, "a") as f:
                 f.write(text + "\n")
             console.print(f"[bold green]✅ Appended to file: [cyan]{filename}[/][/]")
             
-            # Store the undo command in history
-            undo_info = f'copy "{backup_path}" "{filename}"'
-            undo_info = {
-            "command":  f'copy "{backup_path}" "{filename}"',
-            "message":  f'Restored previous version of "{filename}" before append operation.'
-            }
-            command_history.append((f"append {arg}", undo_info))
+            # Store the undo record in history
+            undo_info = undo_record(f'Restored previous version of "{filename}" before append operation.',
+                                    {"op": "truncate", "path": os.path.abspath(filename), "length": length})
+            command_history.append((f"append {join_args(argv)}", undo_info))
         except Exception as e:
-            console.print(f"[bold red]❌ Error appending to file: {str(e)}[/]")
+            report_error(self, f"[bold red]❌ Error appending to file: {str(e)}[/]")
     
-def do_mkdir(self, arg: str, command_history):
+def do_mkdir(self, argv: List[str], command_history):
     """Create a new directory interactively or via command: mkdir <dirname>"""
-    if arg in ["--help", "-h"]:
+    if wants_help(argv):
         console.print("[bold cyan]Usage: mkdir <dirname>[/]\n[bold #FF8C00]Create a new directory.[/]")
         return
     
     try: 
         # Interactive mode if no arguments provided
-        if not arg.strip():
+        if not argv:
             console.print("[bold yellow]📂 Interactive Directory Creation Mode Enabled[/]")
 
             while True:
@@ -789,89 +886,92 @@ def do_mkdir(self, arg: str, command_history):
                             shutil.rmtree(dirname)  # Remove existing directory
                             console.print(f"[bold red]⚠️ Overwriting existing directory: {dirname}[/]")
                         except Exception as e:
-                            console.print(f"[bold red]❌ Error removing existing directory: {str(e)}[/]")
+                            report_error(self, f"[bold red]❌ Error removing existing directory: {str(e)}[/]")
                             return
                     elif choice == "r":
                         continue  # Ask for a new name
                     elif choice == "c":
-                        console.print("[bold red]❌ Operation cancelled.[/]")
+                        report_error(self, "[bold red]❌ Operation cancelled.[/]")
                         return
                 break  # Exit loop if the name is valid
         else:
-            dirname = arg
+            dirname = argv[0]
 
             # Check if directory exists in non-interactive mode
             if os.path.exists(dirname):
-                console.print(f"[bold red]❌ Error: Directory '{dirname}' already exists.[/]")
+                report_error(self, f"[bold red]❌ Error: Directory '{dirname}' already exists.[/]")
                 return
 
+        # Undo removes the topmost directory this creates, which may be a missing parent
+        created = os.path.abspath(dirname)
+        while not os.path.exists(os.path.dirname(created)):
+            created = os.path.dirname(created)
+
         os.makedirs(dirname, exist_ok=True)
         console.print(f"[bold green]✅ Created directory: {dirname}[/]")
 
-        # Store the undo command in history
-        undo_info = {
-            "command": f'rd /s /q "{dirname}"' if os.name == "nt" else f'rm -r "{dirname}"',
-            "message": f'Directory removed: {dirname}'
-        }
+        # Store the undo record in history
+        undo_info = undo_record(f'Directory removed: {dirname}', {"op": "remove", "path": created})
         command_history.append((f"mkdir {dirname}", undo_info))
     except Exception as e:
-        console.print(f"[bold red]❌ Error: {str(e)}[/]")
+        report_error(self, f"[bold red]❌ Error: {str(e)}[/]")
 
-def do_rm(self, arg: str, command_history):
+def do_rm(self, argv: List[str], command_history):
     """Delete a file with interactive mode"""
     
-    if arg in ["--help", "-h"]:
+    if wants_help(argv):
         console.print("[bold cyan]Usage: rm <filename>[/]\n[bold #FF8C00]Delete a file.")
         return
     
     try:
+        arg = argv[0] if argv else ""
+
         # Interactive mode if no filename is provided
         while not arg.strip():
             arg = Prompt.ask("[bold yellow]Please enter the filename to delete[/]").strip()
             if not arg:
-                console.print("[bold red]❌ Error: Filename cannot be empty.[/]")
+                report_error(self, "[bold red]❌ Error: Filename cannot be empty.[/]")
                 return
         
         if not os.path.exists(arg):
-            console.print(f"[bold red]❌ Error: File '{arg}' not found.[/]")
+            report_error(self, f"[bold red]❌ Error: File '{arg}' not found.[/]")
             return
         
         if not Confirm.ask(f"[bold yellow]Are you sure you want to delete '{arg}'?[/]"):
-            console.print("[bold cyan]❎ Deletion canceled.[/]")
+            report_canceled(self, "[bold cyan]❎ Deletion canceled.[/]")
             return
         
+        if os.path.isdir(arg) and not os.path.islink(arg):
+            report_error(self, f"[bold red]❌ Error: '{arg}' is a directory; use rmdir.[/]")
+            return
+
         def delete_file():
-            backup_path = f"{arg}.bak"
-            shutil.copy(arg, backup_path)
-            os.remove(arg)
-            command_history.append((
-                f"rm {arg}",
-                {"command": f'cp "{backup_path}" "{arg}"' if os.name != "nt" else f'copy "{backup_path}" "{arg}"',
-                "message": f'Restored file: {arg}'}
-            ))
+            command_history.append((f"rm {arg}", undo_record(f'Restored file: {arg}', undo_trash(arg))))
 
         show_loader("Deleting file", delete_file)
         console.print(f"[bold green]✅ Deleted file: {arg}[/]")
     except Exception as e:
-        console.print(f"[bold red]❌ Error: {str(e)}[/]")
+        report_error(self, f"[bold red]❌ Error: {str(e)}[/]")
     
-def do_rmdir(self, arg: str, command_history):
+def do_rmdir(self, argv: List[str], command_history):
     """Delete a directory"""
 
-    if arg in ["--help", "-h"]:
+    if wants_help(argv):
         console.print("[bold cyan]Usage: rmdir <dirname>[/]\n[bold #FF8C00]Delete a directory.")
         return 
 
     try:
+        arg = argv[0] if argv else ""
+
         # If no directory is entered, prompt the user
         while not arg.strip():
             arg = Prompt.ask("[bold yellow]Please enter the directory name to delete[/]").strip()
             if not arg:  # Prevent infinite loop if user presses Enter without input
-                console.print("[bold red]❌ Error: Directory name cannot be empty.[/]")
+                report_error(self, "[bold red]❌ Error: Directory name cannot be empty.[/]")
                 return
 
         if not os.path.exists(arg) or not os.path.isdir(arg):
-            console.print(f"[bold red]❌ Error: Directory '{arg}' not found.[/]")
+            report_error(self, f"[bold red]❌ Error: Directory '{arg}' not found.[/]")
             return
 
         # Interactive prompt before deletion
@@ -882,41 +982,50 @@ def do_rmdir(self, arg: str, command_history):
         )
 
         if choice.lower() == "no":
-            console.print("[bold cyan]❎ Deletion canceled.[/]")
+            report_canceled(self, "[bold cyan]❎ Deletion canceled.[/]")
             return
 
         def delete_directory():
+            from trash import Trash
+            original = os.path.abspath(arg)
+            item = Trash().move(arg)  # One rename, however big the tree
+            if item is not None:
+                undo_info = undo_record(f'Restored directory: {arg}', {"op": "untrash", "item": item, "path": original})
+                command_history.append((f"rmdir {arg}", undo_info))
+                return
+
+            # No trash on this filesystem: only a requested backup copy keeps it undoable
             backup_path = f"{arg}_backup"
             if choice == "backup":
                 shutil.copytree(arg, backup_path)
                 console.print(f"[bold green]📂 Backup created: {backup_path}[/]")
             shutil.rmtree(arg)
-            command_history.append((
-                f"rmdir {arg}",
-                {"command": f'mv "{backup_path}" "{arg}"' if os.name != "nt" else f'robocopy "{backup_path}" "{arg}" /E && rmdir /s /q "{backup_path}"',
-                "message": f'Restored directory: {arg}'}
-            ))
+            if choice == "backup":
+                undo_info = undo_record(f'Restored directory: {arg}',
+                                        {"op": "rename", "src": os.path.abspath(backup_path), "dst": original})
+                undo_info["artifacts"] = [os.path.abspath(backup_path)]
+                command_history.append((f"rmdir {arg}", undo_info))
 
         show_loader("Deleting directory", delete_directory)
         console.print(f"[bold green]✅ Deleted directory: {arg}[/]")
     except Exception as e:
-        console.print(f"[bold red]❌ Error: {str(e)}[/]")
+        report_error(self, f"[bold red]❌ Error: {str(e)}[/]")
 
-def do_rename(self, arg: str, command_history):
+def do_rename(self, argv: List[str], command_history):
         """Rename a file or directory interactively or via command: rename <old_name> <new_name>"""
-        if arg in ["--help", "-h"]:
+        if wants_help(argv):
             console.print("[bold cyan]Usage: rename <old> <new>[/]\n[bold #FF8C00]Rename a file or directory.")
             return
 
         try:
             # Interactive mode if no arguments provided
-            if not arg.strip():
+            if not argv:
                 console.print("[bold yellow]🔍 Interactive Rename Mode Enabled[/]")
 
                 # List available files/directories
                 items = os.listdir()
                 if not items:
-                    console.print("[bold red]❌ No files or directories found in the current directory.[/]")
+                    report_error(self, "[bold red]❌ No files or directories found in the current directory.[/]")
                     return
 
                 # Display options in a table
@@ -938,55 +1047,47 @@ def do_rename(self, arg: str, command_history):
 
                 # Confirm before renaming
                 if not Confirm.ask(f"Rename [cyan]{old_name}[/] to [green]{new_name}[/]?"):
-                    console.print("[bold red]❌ Operation cancelled.[/]")
+                    report_error(self, "[bold red]❌ Operation cancelled.[/]")
                     return
             else:
-                try:
-                    parts = shlex.split(arg)
-                    if len(parts) != 2:
-                        console.print("[bold red]❌ Usage: rename <old_name> <new_name>[/]")
-                        return
-                    
-                    old_name, new_name = parts
-                except Exception:
-                    console.print("[bold red]❌ Invalid input. Use rename <old_name> <new_name>[/]")
+                if len(argv) != 2:
+                    report_error(self, "[bold red]❌ Usage: rename <old_name> <new_name>[/]")
                     return
 
+                old_name, new_name = argv
+
             # Perform the rename operation
             os.rename(old_name, new_name)
             console.print(f"[bold green]✅ Renamed: [cyan]{old_name}[/] -> [cyan]{new_name}[/][/]")
 
-            # Store undo command
-            undo_info = {
-                    "command":  f'rename "{new_name}" "{old_name}"',
-                    "message":  f'Renamed "{new_name}" to "{old_name}"'
-                }
-            command_history.append((f"rename {arg}", undo_info))
+            # Store the undo record
+            undo_info = undo_record(f'Renamed "{new_name}" to "{old_name}"',
+                                    {"op": "rename", "src": os.path.abspath(new_name), "dst": os.path.abspath(old_name)})
+            command_history.append((f"rename {join_args([old_name, new_name])}", undo_info))
 
         except Exception as e:
-                console.print(f"[bold red]❌ Error renaming: {str(e)}[/]")
+                report_error(self, f"[bold red]❌ Error renaming: {str(e)}[/]")
 
-def do_move(self, arg: str, command_history):
+def do_move(self, argv: List[str], command_history):
         """Move a file (interactive mode when no arguments are provided)"""
-        if arg in ["--help", "-h"]:
+        if wants_help(argv):
             console.print("[bold cyan]Usage: move <source> <destination>[/]\n[bold #FF8C00]Move a file.[/]")
             return
 
         try:
             # Interactive mode if no argument is given
-            if not arg:
+            if not argv:
                 console.print("[bold yellow]Interactive Mode: Let's move a file![/]")
                 source = Prompt.ask("[bold cyan]Enter the source file path[/]")
                 destination = Prompt.ask("[bold cyan]Enter the destination path[/]")
             else:
-                args = arg.split()
-                if len(args) != 2:
-                    console.print("[bold red]❌ Usage: move <source> <destination>[/]")
+                if len(argv) != 2:
+                    report_error(self, "[bold red]❌ Usage: move <source> <destination>[/]")
                     return
-                source, destination = args
+                source, destination = argv
 
             if not os.path.exists(source):
-                console.print(f"[bold red]❌ Error: Source file '{source}' not found.[/]")
+                report_error(self, f"[bold red]❌ Error: Source file '{source}' not found.[/]")
                 return
 
             if os.path.exists(destination):
@@ -997,32 +1098,37 @@ def do_move(self, arg: str, command_history):
                 )
 
                 if choice == "cancel":
-                    console.print("[bold cyan]❎ Move canceled.[/]")
+                    report_canceled(self, "[bold cyan]❎ Move canceled.[/]")
                     return
                 elif choice == "rename":
                     new_name = Prompt.ask("[bold yellow]Enter a new name for the moved file[/]")
                     destination = os.path.join(os.path.dirname(destination), new_name)
 
-            with Progress(SpinnerColumn(), TextColumn("[cyan]Moving file...[/]")) as progress:
-                task = progress.add_task("", total=None)
-            
-                shutil.move(source, destination)
-                progress.update(task, completed=True)
-                console.print(f"[bold green]✅ Moved '{source}' to '{destination}'[/]")
+            # Across file systems a move is a copy: its bytes are shown as they arrive
+            from progress import Activity, file_size
+            moved_size = os.path.getsize(source) if os.path.isfile(source) else None
+            landing = os.path.join(destination, os.path.basename(source)) if os.path.isdir(destination) else destination
+            with Activity(console, "Moving file", total=moved_size, unit="bytes",
+                          completed=file_size(landing) if moved_size else None):
+
+                # Overwriting: the old destination goes to the trash, so undo can bring it back too
+                ops = []
+                if os.path.isfile(destination):
+                    ops.append(undo_trash(destination))
+
                 full_source = os.path.abspath(source)
-                full_destination = os.path.abspath(destination)
-                undo_info = {
-                    "command": f'move "{full_destination}" "{full_source}"' if os.name == "nt" else f'mv "{full_destination}" "{full_source}"',
-                    "message": f'Restored "{source}" back to its original location.'
-                }
+                full_destination = os.path.abspath(shutil.move(source, destination))
+                console.print(f"[bold green]✅ Moved '{source}' to '{destination}'[/]")
+                ops.append({"op": "rename", "src": full_destination, "dst": full_source})
+                undo_info = undo_record(f'Restored "{source}" back to its original location.', *ops)
 
-                command_history.append((f"move {source} {destination}", undo_info))
+                command_history.append((f"move {join_args([source, destination])}", undo_info))
         except Exception as e:
-            console.print(f"[bold red]❌ Error: {str(e)}[/]")
+            report_error(self, f"[bold red]❌ Error: {str(e)}[/]")
 
-def do_copy(self, arg: str, command_history):
+def do_copy(self, argv: List[str], command_history):
     """Copy a file (interactive mode when no arguments are provided)."""
-    if arg in ["--help", "-h"]:
+    if wants_help(argv):
         console.print("[bold cyan]Usage: copy <source> <destination>[/]\n[bold #FF8C00]Copy a file.[/]")
         return
 
@@ -1031,71 +1137,526 @@ def do_copy(self, arg: str, command_history):
         destinations = []
 
         # Interactive mode if no argument is given
-        if not arg:
+        if not argv:
             console.print("[bold yellow]Interactive Mode: Let's copy a file![/]")
             source = Prompt.ask("[bold cyan]Enter the source file path[/]")
             destination = Prompt.ask("[bold cyan]Enter the destination path[/]")
             destinations = [destination]  # Ensure destinations is a list
         else:
-            args = arg.split()
-            if len(args) < 2:
-                console.print("[bold red]❌ Usage: copy <source> <destination>[/]")
+            if len(argv) < 2:
+                report_error(self, "[bold red]❌ Usage: copy <source> <destination>[/]")
                 return
-            source = args[0]
-            destinations = args[1:]  # All remaining arguments are treated as destinations
+            source = argv[0]
+            destinations = argv[1:]  # All remaining arguments are treated as destinations
 
         # Validate source file
         if not source or not os.path.exists(source):
-            console.print(f"[bold red]❌ Error: Source file '{source}' not found.[/]")
+            report_error(self, f"[bold red]❌ Error: Source file '{source}' not found.[/]")
             return
 
-        # Copy files to destinations
-        for destination in destinations:
-            # Check if destination already exists
-            if os.path.exists(destination):
-                overwrite = Confirm.ask(f"[bold yellow]File '{destination}' already exists. Overwrite?[/]")
-                if not overwrite:
-                    new_name = Prompt.ask("[bold yellow]Enter a new name for the copied file[/]")
-                    destination = os.path.join(os.path.dirname(destination), new_name)
-
-            # Copy the file with progress indication
-            with Progress(SpinnerColumn(), TextColumn("[cyan]Copying file...[/]"), transient=True) as progress:
-                task = progress.add_task("", total=1)  # Set total to 1 for completion tracking
-                shutil.copy(source, destination)
-                progress.update(task, completed=1)  # Mark the task as completed
-                console.print(f"[bold green]✅ Copied '{source}' to '{destination}'[/]")
-
-                # Add undo command to history
-                undo_info = {
-                    "command": f'del "{destination}"' if os.name == "nt" else f'rm "{destination}"',
-                    "message": f'Removed copied file from: "{destination}".'
-                }
-                command_history.append((f"copy {source} {destination}", undo_info))
+        # Copy files to destinations; one undo record reverts every copy made
+        from progress import Activity, file_size
+        ops, copied = [], []
+        try:
+            for destination in destinations:
+                # Check if destination already exists
+                if os.path.exists(destination):
+                    overwrite = Confirm.ask(f"[bold yellow]File '{destination}' already exists. Overwrite?[/]")
+                    if not overwrite:
+                        new_name = Prompt.ask("[bold yellow]Enter a new name for the copied file[/]")
+                        destination = os.path.join(os.path.dirname(destination), new_name)
+
+                # Copy the file; a slow copy shows its bytes as they land in the target
+                target = os.path.join(destination, os.path.basename(source)) if os.path.isdir(destination) else destination
+                previous = undo_save(target) if os.path.isfile(target) else None
+                with Activity(console, "Copying file", total=os.path.getsize(source), unit="bytes", completed=file_size(target)):
+                    shutil.copy(source, target)
+                    console.print(f"[bold green]✅ Copied '{source}' to '{destination}'[/]")
+                    ops.append(previous or {"op": "remove", "path": os.path.abspath(target)})
+                    copied.append(destination)
+        finally:
+            if ops:
+                undo_info = undo_record(f'Removed copied files from: {join_args(copied)}.', *ops)
+                command_history.append((f"copy {join_args([source] + copied)}", undo_info))
 
     except Exception as e:
-        console.print(f"[bold red]❌ Error copying '{source}' to '{destination}': {str(e)}[/]")
+        report_error(self, f"[bold red]❌ Error copying '{source}' to '{destination}': {str(e)}[/]")
             
-def do_exit(self, arg: str) -> bool:
+def do_which(self, argv: List[str]):
+    """Locate a command on PATH using the shell's executable index"""
+    if wants_help(argv):
+        console.print(
+            "[bold cyan]Usage: which [-a] <command> ...[/]\n"
+            "\nOptions:\n"
+            "  [green]-a[/]  List every matching executable on PATH, not just the first\n"
+            "[bold #FF8C00]Show which program runs for a command name.[/]"
+        )
+        return
+
+    show_all = "-a" in argv
+    names = [a for a in argv if a != "-a"]
+    if not names:
+        report_error(self, "[bold red]❌ Usage: which [-a] <command>[/]")
+        return
+
+    for name in names:
+        found = False
+        if name in self.commands:
+            console.print(f"[bold cyan]{name}: shell built-in command[/]")
+            found = True
+            if not show_all:
+                continue
+        for path in self.executables.which(name, all_matches=show_all):
+            console.print(path)
+            found = True
+        if not found:
+            report_error(self, f"[bold red]❌ {name} not found[/]")
+
+def do_history(self, argv: List[str]):
+    """Search the persistent command history: history [options] [text]"""
+    if wants_help(argv):
+        console.print(
+            "[bold cyan]Usage: history [-f] [-d] [-x] [-s <status>] [-n <count>] [-a] [-c] [text][/]\n"
+            "\nOptions:\n"
+            "  [green]-f[/]           Fuzzy: the characters of text appear in order (e.g. 'gcm' finds 'git commit -m')\n"
+            "  [green]-d[/]           Only commands run in the current directory\n"
+            "  [green]-x[/]           Only commands that failed\n"
+            "  [green]-s <status>[/]  Only commands that exited with this status\n"
+            "  [green]-n <count>[/]   Show this many entries (default 25)\n"
+            "  [green]-a[/]           Show every run, not just the latest of each command\n"
+            "  [green]-c[/]           Compact the history database\n"
+            "[bold #FF8C00]Commands typed in every session are kept, with their directory, exit status and duration.[/]"
+        )
+        return
+
+    options, words = {}, []
+    index = 0
+    while index < len(argv):
+        word = argv[index]
+        if word in ("-s", "-n"):
+            if index + 1 >= len(argv) or not argv[index + 1].lstrip("-").isdigit():
+                report_error(self, f"[bold red]❌ {word} needs a number.[/]")
+                return
+            options[word] = int(argv[index + 1])
+            index += 2
+            continue
+        if word in ("-f", "-d", "-x", "-a", "-c"):
+            options[word] = True
+        else:
+            words.append(word)
+        index += 1
+
+    store = self.history_store
+    if "-c" in options:
+        removed = store.compact()
+        console.print(f"[bold green]✅ History compacted ({removed} old runs removed, {len(store)} kept).[/]")
+        return
+
+    entries = store.search(
+        " ".join(words),
+        fuzzy="-f" in options,
+        cwd=os.getcwd() if "-d" in options else None,
+        status=options.get("-s"),
+        failed="-x" in options,
+        limit=options.get("-n", 25),
+        unique="-a" not in options,
+    )
+    if not entries:
+        console.print("[bold yellow]⚠  No matching commands in history.[/]")
+        return
+
+    table = Table(title="📜 Command History", header_style="bold cyan")
+    table.add_column("#", justify="right", style="dim")
+    table.add_column("When", style="bold blue")
+    table.add_column("Status", justify="right")
+    table.add_column("Time", justify="right", style="bold yellow")
+    table.add_column("Directory", style="dim")
+    table.add_column("Command", style="bold magenta")
+    for entry in reversed(entries):  # Oldest first, so the latest ends up next to the prompt
+        status = f"[green]{entry.status}[/]" if entry.status == 0 else f"[red]{entry.status}[/]"
+        table.add_row(
+            str(entry.id),
+            time.strftime("%Y-%m-%d %H:%M", time.localtime(entry.started)),
+            status,
+            f"{entry.duration:.2f}s",
+            entry.cwd,
+            entry.command,
+        )
+    console.print(table)
+
+def do_last(self, argv: List[str]):
+    """Show an earlier command's output again: last [n] [-l] [-f <text>]"""
+    if wants_help(argv):
+        console.print(
+            "[bold cyan]Usage: last [n] [-l] [-f <text>][/]\n"
+            "\nOptions:\n"
+            "  [green]n[/]           The n-th most recent command (default 1, the last one)\n"
+            "  [green]-l[/]          List the commands whose output is kept\n"
+            "  [green]-f <text>[/]   Only the lines containing text (ignoring case)\n"
+            "[bold #FF8C00]Output is replayed from memory; the command is not run again.[/]"
+        )
+        return
+
+    words, needle, listing = [], None, False
+    index = 0
+    while index < len(argv):
+        if argv[index] == "-f":
+            if index + 1 >= len(argv):
+                report_error(self, "[bold red]❌ -f needs the text to look for.[/]")
+                return
+            needle = argv[index + 1].lower()
+            index += 2
+            continue
+        if argv[index] == "-l":
+            listing = True
+        else:
+            words.append(argv[index])
+        index += 1
+
+    scrollback = self.scrollback
+    if listing:
+        finished = [entry for entry in scrollback.entries if entry.status is not None]
+        if not finished:
+            console.print("[bold yellow]⚠  No output kept yet.[/]")
+            return
+        table = Table(title="🧾 Kept Output", header_style="bold cyan")
+        table.add_column("n", justify="right", style="dim")
+        table.add_column("Status", justify="right")
+        table.add_column("Size", justify="right", style="bold yellow")
+        table.add_column("Command", style="bold magenta")
+        for n, entry in zip(range(len(finished), 0, -1), finished):
+            status = f"[green]{entry.status}[/]" if entry.status == 0 else f"[red]{entry.status}[/]"
+            size = f"{entry.size:,} B" + (" (cut)" if entry.truncated else "")
+            table.add_row(str(n), status, size, entry.command)
+        console.print(table)
+        return
+
+    if words and not (words[0].isdigit() and int(words[0]) > 0):
+        report_error(self, "[bold red]❌ Usage: last [n] — n counts back from the last command (1).[/]")
+        return
+    entry = scrollback.recent(int(words[0]) if words else 1)
+    if entry is None:
+        report_error(self, "[bold red]❌ No kept output that far back (see 'last -l').[/]")
+        return
+
+    sys.stdout.flush()
+    if needle is None:
+        from outputpump import binary_stream
+        out = binary_stream(sys.stdout)
+        out.write(scrollback.output(entry))
+        out.flush()
+        return
+    matches = [line for line in scrollback.text(entry).splitlines() if needle in line.lower()]
+    if not matches:
+        report_error(self, f"[bold yellow]⚠  No line of '{entry.command}' contains '{argv[argv.index('-f') + 1]}'.[/]")
+        return
+    sys.stdout.write("\n".join(matches) + "\n")
+    sys.stdout.flush()
+
+def do_parallel(self, argv: List[str]):
+    """Run a command for many items at once: parallel [-j n] [-r retries] [-f file | -g glob] <command ...>"""
+    if wants_help(argv):
+        console.print(
+            "[bold cyan]Usage: parallel [-j n] [-r retries] [-f file | -g glob] <command ...>[/]\n"
+            "\nOptions (before the command):\n"
+            "  [green]-j n[/]        Items run at once\n"
+            "  [green]-r n[/]        Extra attempts for a failing item (default 1)\n"
+            "  [green]-f file[/]     One item per line; -f - reads them from stdin\n"
+            "  [green]-g glob[/]     The files matching a pattern, e.g. -g \"logs/*.txt\"\n"
+            "[bold #FF8C00]{} in the command is replaced by the item, otherwise the item is appended.\n"
+            "Items can also be piped in: ls | parallel copy {} backup/{}[/]"
+        )
+        return
+    from outputpump import binary_stream
+    from parallel import ParallelError, Runner, parse_args, read_items, report
+
+    try:
+        jobs, retries, source, template = parse_args(argv)
+        if source is None:
+            raise ParallelError("Give the items with -f <file>, -f - (stdin) or -g <glob>, or pipe them in")
+        items = read_items(source)
+        runner = Runner(self, template, jobs, retries)
+    except ParallelError as e:
+        report_error(self, f"[bold red]❌ {e}[/]")
+        self.last_status = 2
+        return
+
+    results, started = [], time.perf_counter()
+    out = binary_stream(sys.stdout)
+    try:
+        for result in runner.run(items):
+            results.append(result._replace(output=b""))  # Shown once: only the outcome is kept for the summary
+            outcome = "[green]✅" if result.status == 0 else f"[red]❌ exit {result.status}"
+            retried = f", {result.attempts} attempts" if result.attempts > 1 else ""
+            console.print(f"[bold cyan]── {result.index}. {result.item}[/]  {outcome} {result.seconds:.2f}s{retried}[/]")
+            sys.stdout.flush()
+            out.write(result.output)
+            out.flush()
+    except KeyboardInterrupt:
+        console.print("\n[bold yellow]⚠  Stopped; items not started yet were skipped.[/]")
+    report(console, results, time.perf_counter() - started, jobs)
+    self.last_status = 1 if any(result.status != 0 for result in results) else 0
+
+def job_status(status: int) -> int:
+    """A job's exit code as a shell status: 128 + signal for a job ended by a signal."""
+    return status if status >= 0 else 128 - status
+
+def do_jobs(self, argv: List[str]):
+    """List background jobs: jobs"""
+    if wants_help(argv):
+        console.print(
+            "[bold cyan]Usage: jobs[/]\n"
+            "[bold #FF8C00]List background jobs. End a line with & to start one; fg, bg, kill and wait take %n.[/]"
+        )
+        return
+    jobs = self.job_table.jobs
+    if not jobs:
+        console.print("[bold yellow]⚠  No background jobs.[/]")
+        return
+    table = Table(title="🧵 Background Jobs", header_style="bold cyan")
+    table.add_column("Job", justify="right", style="bold yellow")
+    table.add_column("State")
+    table.add_column("PID", justify="right", style="dim")
+    table.add_column("Time", justify="right")
+    table.add_column("Output", justify="right", style="bold green")
+    table.add_column("Command", style="bold magenta")
+    now = time.time()
+    for job in jobs.values():
+        color = "cyan" if job.running else "green" if job.status == 0 else "red"
+        elapsed = (job.ended or now) - job.started
+        output = f"{job.dropped + len(job.output):,} B"
+        table.add_row(f"%{job.number}", f"[{color}]{job.state}[/]", str(job.pid), f"{elapsed:.0f}s", output, job.command)
+    console.print(table)
+
+def do_fg(self, argv: List[str]):
+    """Bring a background job to the foreground: fg [%n]"""
+    if wants_help(argv):
+        console.print(
+            "[bold cyan]Usage: fg [%n][/]\n"
+            "[bold #FF8C00]Show a job's output so far, then follow it until it ends (the last job by default).\n"
+            "Ctrl+C interrupts the job; a second Ctrl+C leaves it running in the background.[/]"
+        )
+        return
+    import queue
+    from jobs import JobError
+    from outputpump import binary_stream
+
+    table = self.job_table
+    try:
+        job = table.find(argv[0] if argv else None)
+    except JobError as e:
+        report_error(self, f"[bold red]❌ {e}[/]")
+        return
+
+    console.print(f"[bold cyan]{job.command}[/]")
+    listener = queue.Queue()
+    with job.lock:
+        backlog, dropped = bytes(job.output), job.dropped
+        if job.running:
+            job.listener = listener
+    if dropped:
+        console.print(f"[dim]… {dropped:,} earlier bytes were not kept[/]")
+    sys.stdout.flush()
+    out = binary_stream(sys.stdout)
+    out.write(backlog)
+    out.flush()
+
+    if job.running:
+        if job.stopped:
+            table.resume(job)
+        interrupted = False
+        while True:
+            try:
+                data = listener.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            except KeyboardInterrupt:
+                if interrupted:
+                    with job.lock:
+                        job.listener = None
+                    console.print(f"\n[bold yellow]⚠  %{job.number} left running in the background[/]")
+                    return
+                interrupted = True
+                table.interrupt(job)
+                continue
+            if data is None:
+                break
+            out.write(data)
+            out.flush()
+
+    table.remove(job)  # Shown: nothing left to announce
+    self.last_status = job_status(job.status)
+
+def do_bg(self, argv: List[str]):
+    """Resume a stopped background job: bg [%n]"""
+    if wants_help(argv):
+        console.print("[bold cyan]Usage: bg [%n][/]\n[bold #FF8C00]Let a job stopped with 'kill -STOP' run again, in the background.[/]")
+        return
+    from jobs import JobError
+    try:
+        job = self.job_table.find(argv[0] if argv else None)
+    except JobError as e:
+        report_error(self, f"[bold red]❌ {e}[/]")
+        return
+    if not job.running:
+        report_error(self, f"[bold red]❌ %{job.number} has already finished ({job.state}).[/]")
+        return
+    if job.stopped:
+        self.job_table.resume(job)
+    console.print(f"[bold green]▶ %{job.number}[/] {job.command} &")
+
+def do_kill(self, argv: List[str]):
+    """End or pause background jobs or processes: kill [-9] [-STOP] [-CONT] <%n|pid>..."""
+    if wants_help(argv):
+        console.print(
+            "[bold cyan]Usage: kill [-9] [-STOP] [-CONT] <%n|pid>...[/]\n"
+            "\nOptions:\n"
+            "  [green]-9[/]      Kill at once instead of asking the job to end\n"
+            "  [green]-STOP[/]   Pause the job (bg or fg resumes it)\n"
+            "  [green]-CONT[/]   Resume a paused job\n"
+            "[bold #FF8C00]A job's child processes get the same signal.[/]"
+        )
+        return
+    import psutil
+    from jobs import JobError
+
+    force, stop, resume = "-9" in argv, "-STOP" in argv, "-CONT" in argv
+    targets = [arg for arg in argv if arg not in ("-9", "-STOP", "-CONT")]
+    if not targets:
+        report_error(self, "[bold red]❌ Usage: kill [-9] [-STOP] [-CONT] <%n|pid>...[/]")
+        return
+    table = self.job_table
+    for target in targets:
+        try:
+            if target.startswith("%"):
+                job = table.find(target)
+                if not job.running:
+                    report_error(self, f"[bold red]❌ %{job.number} has already finished ({job.state}).[/]")
+                    continue
+                if stop:
+                    table.suspend(job)
+                elif resume:
+                    table.resume(job)
+                else:
+                    table.terminate(job, force=force)
+                action = "stopped" if stop else "resumed" if resume else "killed" if force else "terminated"
+                console.print(f"[bold green]✅ %{job.number} {action}:[/] {job.command}")
+            elif target.isdigit():
+                process = psutil.Process(int(target))
+                if stop:
+                    process.suspend()
+                elif resume:
+                    process.resume()
+                else:
+                    process.kill() if force else process.terminate()
+                console.print(f"[bold green]✅ Signalled process {target}[/]")
+            else:
+                report_error(self, f"[bold red]❌ '{target}' is neither a job (%n) nor a process id.[/]")
+        except JobError as e:
+            report_error(self, f"[bold red]❌ {e}[/]")
+        except psutil.NoSuchProcess:
+            report_error(self, f"[bold red]❌ No process {target}.[/]")
+        except psutil.AccessDenied:
+            report_error(self, f"[bold red]❌ Access denied to process {target}.[/]")
+
+def do_wait(self, argv: List[str]):
+    """Wait for background jobs to finish: wait [%n...]"""
+    if wants_help(argv):
+        console.print(
+            "[bold cyan]Usage: wait [%n...][/]\n"
+            "[bold #FF8C00]Wait until the given jobs (or all of them) have finished; the status is the last one's.[/]"
+        )
+        return
+    from jobs import JobError
+    table = self.job_table
+    try:
+        jobs = [table.find(arg) for arg in argv] if argv else [job for job in table.jobs.values() if job.running]
+    except JobError as e:
+        report_error(self, f"[bold red]❌ {e}[/]")
+        return
+    try:
+        for job in jobs:
+            while table.wait(job, timeout=0.1) is None:
+                pass
+    except KeyboardInterrupt:
+        console.print("\n[bold yellow]⚠  Stopped waiting; the jobs keep running.[/]")
+        self.last_status = 130
+        return
+    if jobs:
+        self.last_status = job_status(jobs[-1].status)
+    self.announce_jobs()
+
+def do_time(self, argv: List[str]):
+    """Run a command and report its time, CPU, peak memory and I/O: time <command ...> | time -on | time -off"""
+    if wants_help(argv[:1]) or not argv:
+        console.print(
+            "[bold cyan]Usage: time <command ...>[/]  or  [bold cyan]time -on[/] / [bold cyan]time -off[/]\n"
+            "\nReports wall time, CPU time (the shell's own for builtins, the children's for external commands),\n"
+            "peak resident memory and bytes read and written after the command finishes.\n"
+            "[bold #FF8C00]time -on reports it after every command until time -off (or start the shell with MYCLI_TIME=1).[/]"
+        )
+        console.print(f"Always-on timing is {'[green]on' if self.time_commands else '[dim]off'}[/]")
+        return
+    if argv == ["-on"] or argv == ["-off"]:
+        self.time_commands = argv[0] == "-on"
+        console.print(f"[bold green]✅ Timing every command is {'on' if self.time_commands else 'off'}[/]")
+        return
+    # Reached from a pipeline stage or `parallel`; a typed `time ...` line is timed whole by onecmd
+    self.run_timed(shlex.join(argv))
+
+def do_profile(self, argv: List[str]):
+    """List execution profiles, or run a command under one: profile [<name> <command ...>]"""
+    from profiles import ProfileError, describe, get_profile, load_profiles, run
+    if wants_help(argv[:1]):
+        console.print(
+            "[bold cyan]Usage: profile <name> <command ...>[/]   e.g. profile bulk chkdsk C:\n"
+            "\nRuns the command with the profile's CPU priority (nice), I/O class (ionice), CPU affinity,\n"
+            "per-process memory and CPU-time limits, and a timeout that kills everything it started.\n"
+            "[bold #FF8C00]Profiles are added or changed in profiles.json in the state directory (~/.mycli).[/]"
+        )
+        return
+    try:
+        if len(argv) >= 2:
+            self.last_status = run(self, get_profile(argv[0]), shlex.join(argv[1:]))  # A pipeline stage
+            return
+        profiles = load_profiles()
+        if argv:
+            profiles = {argv[0]: get_profile(argv[0])}
+    except ProfileError as e:
+        report_error(self, f"[bold red]❌ {e}[/]")
+        self.last_status = 2
+        return
+    table = Table(title="🎚  Execution Profiles", header_style="bold cyan")
+    table.add_column("Profile", style="bold magenta")
+    table.add_column("Settings")
+    table.add_column("Description", style="dim")
+    for name, profile in sorted(profiles.items()):
+        table.add_row(name, describe(profile), profile.description)
+    console.print(table)
+
+def do_exit(self, argv: List[str]) -> bool:
         """Exit the shell"""
         console.print(Panel.fit("👋 Goodbye!", style="bold magenta"))
         sys.exit(0)
         return True
 
-def do_help(self, arg: str):
+def do_help(self, argv: List[str]):
         """Show available commands or details for a specific command"""
+        arg = argv[0] if argv else ""
         if arg:
             if arg in self.commands:
                 console.print(f"[bold cyan]{arg}: {self.commands[arg]}[/]")
             else:
-                console.print(f"[bold red]❌ No help available for '{arg}'[/]")
+                report_error(self, f"[bold red]❌ No help available for '{arg}'[/]")
         else:
             console.print("[bold cyan]Available commands:[/]")
             for cmd, desc in self.commands.items():
                 console.print(f"- [bold magenta]{cmd}[/]: {desc}")
 
-def do_ask(self, arg):
+def do_ask(self, argv: List[str]):
     """Start a continuous conversation with the Expert AI Agent"""
     from assistant import ask_gpt_assistant, clear_conversation
+    from rich.markdown import Markdown
     
     console.print("[bold cyan]🤖 Expert AI Agent Activated[/]")
     console.print("[yellow]Type 'exit', 'quit', or 'stop' to end the conversation[/]")
@@ -1148,7 +1709,7 @@ def do_ask(self, arg):
             console.print("\n[yellow]⏹️  Conversation interrupted.[/]")
             break
         except Exception as e:
-            console.print(f"[red]❌ Error: {e}[/]")
+            report_error(self, f"[red]❌ Error: {e}[/]")
             break
     
     # Clear conversation at end
@@ -0,0 +1,250 @@
+# daemon.py
+"""
+Warm daemon mode: `mycli serve` and its thin client `mycli exec`.
+
+The server keeps one fully initialized PowerShell in memory and listens on a
+Unix domain socket. Every connection is handled in a forked child, so each
+client gets its own working directory and undo history while sharing the
+already imported modules and indexes of the parent. The undo history is kept
+in memory for as long as the connection lasts: `undo` takes back what earlier
+lines of the same connection did, and whatever it still holds (trashed files,
+backups) is freed when the connection closes.
+
+Wire format: the client sends one JSON object per line
+({"line": ..., "cwd": ...}); the server answers each with a stream of frames,
+a 1-byte type plus a 4-byte big-endian length, then the payload:
+    b"o"  output bytes (stdout and stderr of the command, in order)
+    b"x"  exit status, as ASCII digits; ends the reply to that request
+
+The exit status is the shell's last_status for the line: the system
+command's return code, 1 for a failed builtin, 127 for an unknown command.
+
+`mycli exec` opens a new connection per call, so nothing survives between
+calls: `mycli exec undo` finds nothing to undo. A client that sends several
+lines on one connection can undo them.
+Prompts are answered by an AnswerPolicy (`exec --yes` / `--no`, otherwise
+only a prompt's own default), so a builtin that needs an answer fails
+instead of hanging.
+
+The client side only uses the standard library so `mycli exec` starts fast.
+"""
+
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+from contextlib import contextmanager
+
+FRAME_HEADER = struct.Struct(">cI")
+OUTPUT, STATUS = b"o", b"x"
+
+
+def default_socket_path() -> str:
+    """MYCLI_SOCKET if set, otherwise a socket inside the state directory."""
+    if os.environ.get("MYCLI_SOCKET"):
+        return os.environ["MYCLI_SOCKET"]
+    from appdata import data_path
+    return data_path("mycli.sock")
+
+
+def send_frame(sock, kind: bytes, payload: bytes = b""):
+    sock.sendall(FRAME_HEADER.pack(kind, len(payload)) + payload)
+
+
+def _recv_exact(sock, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("daemon closed the connection")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_frame(sock):
+    kind, length = FRAME_HEADER.unpack(_recv_exact(sock, FRAME_HEADER.size))
+    return kind, _recv_exact(sock, length) if length else b""
+
+
+# -- client ----------------------------------------------------------------
+
+def exec_line(line: str, socket_path: str = None, out=None, assume=None) -> int:
+    """Send `line` to the daemon, stream its output to `out`, and return the exit status.
+
+    `assume` answers the command's confirmations: True (--yes), False (--no) or None.
+    """
+    out = out or sys.stdout.buffer
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path or default_socket_path())
+        request = {"line": line, "cwd": os.getcwd(), "assume": assume}
+        sock.sendall(json.dumps(request).encode("utf-8") + b"\n")
+        sock.shutdown(socket.SHUT_WR)
+
+        while True:
+            kind, payload = recv_frame(sock)
+            if kind == OUTPUT:
+                out.write(payload)
+                out.flush()
+            elif kind == STATUS:
+                return int(payload or b"0")
+    finally:
+        sock.close()
+
+
+def exec_main(argv) -> int:
+    """Entry point for `mycli exec`, parsed before typer/rich are imported."""
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="mycli exec", description="Run a line in a running `mycli serve` daemon")
+    parser.add_argument("--socket", default=None, help="Daemon socket path (default: $MYCLI_SOCKET or ~/.mycli/mycli.sock)")
+    answer = parser.add_mutually_exclusive_group()
+    answer.add_argument("--yes", "-y", action="store_true", help="Answer yes to every confirmation")
+    answer.add_argument("--no", "-n", action="store_true", help="Answer no to every confirmation")
+    parser.add_argument("line", nargs=argparse.REMAINDER, help="Command line to run")
+    options = parser.parse_args(argv)
+    if not options.line:
+        parser.error("a command line is required")
+
+    if not hasattr(socket, "AF_UNIX"):
+        sys.stderr.write("❌ mycli exec needs Unix domain sockets, which this platform does not provide\n")
+        return 2
+    try:
+        assume = True if options.yes else False if options.no else None
+        return exec_line(" ".join(options.line), options.socket, assume=assume)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sys.stderr.write("❌ No mycli daemon is listening. Start one with 'mycli serve'.\n")
+        return 2
+    except ConnectionError as e:
+        sys.stderr.write(f"❌ {e}\n")
+        return 1
+
+
+# -- server ----------------------------------------------------------------
+
+def run_request(shell, request: dict, sock) -> int:
+    """Run one line in this (forked) process with fds 1/2 piped to the client."""
+    line = request.get("line", "")
+    cwd = request.get("cwd")
+    if cwd:
+        try:
+            os.chdir(cwd)
+        except OSError as e:
+            send_frame(sock, OUTPUT, f"❌ Cannot enter '{cwd}': {e}\n".encode("utf-8"))
+            return 1
+
+    read_fd, write_fd = os.pipe()
+    saved = {fd: os.dup(fd) for fd in (0, 1, 2)}
+    devnull = os.open(os.devnull, os.O_RDONLY)
+
+    def pump():
+        connected = True
+        while True:
+            data = os.read(read_fd, 65536)
+            if not data:
+                break
+            if connected:
+                try:
+                    send_frame(sock, OUTPUT, data)
+                except OSError:
+                    connected = False  # Keep draining so the command never blocks on a full pipe
+
+    pump_thread = threading.Thread(target=pump, daemon=True)
+    pump_thread.start()
+
+    shell.keep_scrollback = False
+    status = 0
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(devnull, 0)
+    os.dup2(write_fd, 1)
+    os.dup2(write_fd, 2)
+    try:
+        from answers import AnswerPolicy, answering
+        with answering(AnswerPolicy(request.get("assume"))):
+            shell.onecmd(line)
+        status = shell.last_status
+    except SystemExit as e:
+        status = e.code if isinstance(e.code, int) else 0
+    except Exception as e:
+        print(f"❌ Unexpected error: {e}")
+        status = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd, copy in saved.items():
+            os.dup2(copy, fd)
+            os.close(copy)
+        os.close(devnull)
+        os.close(write_fd)
+        pump_thread.join()
+        os.close(read_fd)
+    return status
+
+
+@contextmanager
+def connection_session(shell):
+    """Give the (forked) shell an undo history of its own for one connection, freed when it closes."""
+    from journal import UndoList, release_all
+    shell.command_history = UndoList()
+    shell.redo_stack = []
+    try:
+        yield
+    finally:
+        release_all([undo_info for _, undo_info in shell.command_history] +
+                    [redo_info for _, redo_info in shell.redo_stack])
+
+
+def serve(shell_factory, socket_path: str = None, max_clients: int = 64):
+    """Build a shell once and answer `mycli exec` requests on a Unix socket until interrupted."""
+    import socketserver
+
+    if not hasattr(socketserver, "ForkingMixIn") or not hasattr(socket, "AF_UNIX"):
+        raise OSError("daemon mode needs fork() and Unix domain sockets")
+
+    socket_path = socket_path or default_socket_path()
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+            raise OSError(f"a daemon is already listening on {socket_path}")
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(socket_path)  # Stale socket left by a daemon that died
+        finally:
+            probe.close()
+
+    shell = shell_factory()
+    shell.warm_up()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            with connection_session(shell):
+                for raw in self.rfile:
+                    try:
+                        request = json.loads(raw)
+                    except ValueError:
+                        send_frame(self.connection, OUTPUT, b"\xe2\x9d\x8c Malformed request\n")
+                        send_frame(self.connection, STATUS, b"2")
+                        continue
+                    status = run_request(shell, request, self.connection)
+                    send_frame(self.connection, STATUS, str(status).encode("ascii"))
+
+    class Server(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+        pass
+
+    Server.max_children = max_clients
+    old_umask = os.umask(0o177)  # Socket is private to the user who started the daemon
+    try:
+        server = Server(socket_path, Handler)
+    finally:
+        os.umask(old_umask)
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
@@ -0,0 +1,227 @@
+# dircache.py
+"""
+Directory listings for path completion, cached per directory by mtime.
+
+`complete_while_typing` asks for completions on every keystroke. A cached
+listing is reused for as long as the directory's mtime is unchanged, so a
+keystroke costs one stat() and a bisect into the sorted names instead of
+re-listing the directory. Listings come from os.scandir, whose entries already
+know whether they are directories on most platforms.
+
+The stat and the scandir run on a Scan thread, one per directory at a time,
+never on the caller's. On a slow NFS/SMB mount a completion request can stop
+waiting (new keystroke, deadline) while the scan carries on and fills the
+cache for the next keystroke, instead of being restarted from scratch.
+"""
+
+import bisect
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterator, List, NamedTuple, Optional
+
+RACY_WINDOW_NS = 1_000_000_000  # Same idea as the PATH index: recent changes may be invisible to mtime
+BATCH = 256  # Entries handed to waiting requests at a time while a scan is running
+POLL = 0.05  # Seconds between cancellation checks while waiting for a scan
+
+
+class Entry(NamedTuple):
+    name: str
+    is_dir: bool
+
+
+class Listing(NamedTuple):
+    mtime_ns: int
+    racy: bool
+    keys: List[str]       # Sorted match keys (lower-cased on Windows)
+    entries: List[Entry]  # In the same order as keys
+
+
+def _key(name: str) -> str:
+    return name.lower() if os.name == "nt" else name
+
+
+def _visible(entry: Entry, prefix: str) -> bool:
+    """Dot-files are only offered once the prefix itself starts with a dot."""
+    return prefix.startswith(".") or not entry.name.startswith(".")
+
+
+class Scan:
+    """Revalidation (and, if needed, listing) of one directory, running on its own thread."""
+
+    def __init__(self, directory: str, cached: Optional[Listing], on_listing: Callable[[str, Listing], None],
+                 on_done: Callable[["Scan"], None]):
+        self.directory = directory
+        self.entries: List[Entry] = []  # Grows in batches while scandir runs
+        self.listing: Optional[Listing] = None  # Set once the directory is known, changed or not
+        self.done = False
+        self._cached = cached
+        self._on_listing = on_listing
+        self._on_done = on_done
+        self._cond = threading.Condition()
+        threading.Thread(target=self._run, name=f"scan {directory}", daemon=True).start()
+
+    def _run(self):
+        try:
+            mtime_ns = os.stat(self.directory).st_mtime_ns
+            cached = self._cached
+            if cached is not None and cached.mtime_ns == mtime_ns and not cached.racy:
+                self._finish(cached)
+                return
+
+            scanned_at_ns = time.time_ns()
+            batch = []
+            with os.scandir(self.directory) as it:
+                for dir_entry in it:
+                    try:
+                        is_dir = dir_entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    batch.append(Entry(dir_entry.name, is_dir))
+                    if len(batch) >= BATCH:
+                        self._publish(batch)
+                        batch = []
+
+            # The last batch is published together with `done`, so a listing that fits in one
+            # batch is never seen half-way and always reaches readers sorted
+            entries = sorted(self.entries + batch, key=lambda entry: _key(entry.name))
+            listing = Listing(mtime_ns, scanned_at_ns - mtime_ns < RACY_WINDOW_NS,
+                              [_key(entry.name) for entry in entries], entries)
+            self._on_listing(self.directory, listing)
+            self._finish(listing, batch)
+        except OSError:
+            self._finish(None)
+
+    def _publish(self, batch: List[Entry]):
+        with self._cond:
+            self.entries.extend(batch)
+            self._cond.notify_all()
+
+    def _finish(self, listing: Optional[Listing], tail: List[Entry] = ()):
+        with self._cond:
+            self.entries.extend(tail)
+            self.listing = listing
+            self.done = True
+            self._cond.notify_all()
+        self._on_done(self)
+
+    def wait(self, seen: int, until: Optional[float] = None) -> bool:
+        """Block until there are more than `seen` entries, the scan is done, or `until` (monotonic) passes.
+
+        Waits in short slices so callers can check for cancellation; returns True if something changed.
+        """
+        with self._cond:
+            if len(self.entries) > seen or self.done:
+                return True
+            timeout = POLL if until is None else min(POLL, until - time.monotonic())
+            if timeout > 0:
+                self._cond.wait(timeout)
+            return len(self.entries) > seen or self.done
+
+
+class DirectoryCache:
+    """LRU of sorted directory listings, each revalidated against the directory's mtime."""
+
+    def __init__(self, max_dirs: int = 64):
+        self.max_dirs = max_dirs
+        self._listings: "OrderedDict[str, Listing]" = OrderedDict()
+        self._scans = {}  # directory -> Scan still running
+        self._lock = threading.Lock()
+        self.scans = 0  # Number of directory listings performed, for tests and profiling
+
+    def _store(self, directory: str, listing: Listing):
+        with self._lock:
+            self.scans += 1
+            self._listings[directory] = listing
+            self._listings.move_to_end(directory)
+            while len(self._listings) > self.max_dirs:
+                self._listings.popitem(last=False)
+
+    def scan(self, directory: str) -> Scan:
+        """The running Scan of `directory`, or a new one revalidating its cached listing."""
+        directory = os.path.abspath(directory)
+        with self._lock:
+            running = self._scans.get(directory)
+            if running is not None and not running.done:
+                return running
+            scan = Scan(directory, self._listings.get(directory), self._store, self._forget)
+            if not scan.done:
+                self._scans[directory] = scan
+            return scan
+
+    def _forget(self, scan: Scan):
+        """Drop a finished scan so its unsorted copy of the entries can be freed."""
+        with self._lock:
+            if self._scans.get(scan.directory) is scan:
+                del self._scans[scan.directory]
+
+    def listing(self, directory: str) -> Optional[Listing]:
+        """The listing of `directory`, rescanned only if it changed; None if unreadable."""
+        scan = self.scan(directory)
+        while not scan.done:
+            scan.wait(len(scan.entries))
+        return scan.listing
+
+    def complete(self, directory: str, prefix: str, limit: Optional[int] = None) -> List[Entry]:
+        """Entries of `directory` whose name starts with `prefix`, sorted, at most `limit` of them."""
+        listing = self.listing(directory)
+        return self._matches(listing, prefix, limit) if listing is not None else []
+
+    def stream(self, directory: str, prefix: str, limit: Optional[int] = None,
+               deadline: Optional[float] = None, cancelled: Callable[[], bool] = lambda: False) -> Iterator[Entry]:
+        """Yield matching entries as soon as they are known, giving up at `deadline` or once cancelled.
+
+        A directory that is unchanged, or small enough to be listed at once,
+        comes back sorted from the cache. A slow listing is streamed in scan
+        order; if the deadline passes before anything arrived, the previous
+        (possibly stale) listing is used rather than nothing.
+        """
+        key = _key(prefix)
+        scan = self.scan(directory)
+        seen = count = 0
+        while not cancelled():
+            scan.wait(seen, deadline)
+            done = scan.done  # Read before the entries: every entry is published before done is set
+            if done and seen == 0:
+                if scan.listing is not None:
+                    yield from self._matches(scan.listing, prefix, limit)
+                return
+            batch = scan.entries[seen:]
+            seen += len(batch)
+            for entry in batch:
+                if _key(entry.name).startswith(key) and _visible(entry, prefix):
+                    if cancelled():
+                        return
+                    yield entry
+                    count += 1
+                    if limit is not None and count >= limit:
+                        return
+            if done:
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                if seen == 0:
+                    stale = self._listings.get(scan.directory)
+                    if stale is not None:
+                        yield from self._matches(stale, prefix, limit)
+                return
+
+    @staticmethod
+    def _matches(listing: Listing, prefix: str, limit: Optional[int]) -> List[Entry]:
+        key = _key(prefix)
+        start = bisect.bisect_left(listing.keys, key)
+        matches = []
+        for index in range(start, len(listing.keys)):
+            if not listing.keys[index].startswith(key) or (limit is not None and len(matches) >= limit):
+                break
+            entry = listing.entries[index]
+            if _visible(entry, prefix):
+                matches.append(entry)
+        return matches
+
+    def invalidate(self, directory: Optional[str] = None):
+        with self._lock:
+            if directory is None:
+                self._listings.clear()
+            else:
+                self._listings.pop(os.path.abspath(directory), None)
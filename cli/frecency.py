@@ -0,0 +1,167 @@
+# frecency.py
+"""
+Frecency database behind `z`/`jump`: directories ranked by how often and how
+recently they were visited.
+
+Works like z/zoxide. Every visit adds one to a directory's rank and stamps its
+last-visit time; a lookup weighs the rank by age (x4 within the hour, x2
+within the day, /2 within the week, /4 after that). Once the ranks add up to
+more than MAX_TOTAL every rank is aged by AGING, forgetting directories that
+fall below one, and at most MAX_ENTRIES directories are kept, so the file
+stays a few tens of kilobytes and a lookup is a single pass over it in memory.
+
+The database is a JSON file in the state directory, rewritten atomically on
+each visit. Another shell's writes are picked up by comparing the file's mtime
+before each lookup and visit. A lookup first keeps the lower-cased paths that
+contain the rarest-looking (longest) term, a C-level substring test, and only
+checks the order of the terms and scores the survivors.
+"""
+
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from appdata import data_path, read_json, write_json_atomic
+
+MAX_TOTAL = 9000  # Sum of ranks that triggers aging (z's _Z_MAX_SCORE)
+AGING = 0.99  # Factor applied to every rank when MAX_TOTAL is exceeded
+MAX_ENTRIES = 1000  # Directories kept; the lowest ranked beyond this are dropped
+
+HOUR, DAY, WEEK = 3600, 86400, 604800
+
+
+def frecency(rank: float, last_visit: float, now: float) -> float:
+    """Score of a directory: its visit rank weighted by how long ago the last visit was."""
+    age = now - last_visit
+    if age < HOUR:
+        return rank * 4
+    if age < DAY:
+        return rank * 2
+    if age < WEEK:
+        return rank / 2
+    return rank / 4
+
+
+def _key(path: str) -> str:
+    return os.path.normcase(os.path.normpath(path))
+
+
+class FrecencyDB:
+    """Visited directories with their rank and last visit time, persisted in the state directory."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or data_path("frecency.json")
+        self._entries: Dict[str, List] = {}  # normcased path -> [path, rank, last visit]
+        self._keys: List[str] = []  # Keys in the same order as _lower
+        self._lower: List[str] = []  # Lower-cased paths, searched by ranked()
+        self._mtime_ns = None
+
+    def __len__(self) -> int:
+        self._reload()
+        return len(self._entries)
+
+    def _reload(self):
+        """Re-read the file if another shell (or this one) changed it since it was loaded."""
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        if mtime_ns == self._mtime_ns:
+            return
+        data = read_json(self.path, {}) if mtime_ns is not None else {}
+        entries = {}
+        for record in data.get("entries", ()) if isinstance(data, dict) else ():
+            try:
+                path, rank, last_visit = record
+                entries[_key(path)] = [path, float(rank), float(last_visit)]
+            except (TypeError, ValueError):
+                continue  # Skip a damaged record rather than losing the whole database
+        self._entries = entries
+        self._mtime_ns = mtime_ns
+        self._index()
+
+    def _index(self):
+        self._keys = list(self._entries)
+        self._lower = [self._entries[key][0].lower() for key in self._keys]
+
+    def _save(self):
+        write_json_atomic(self.path, {"version": 1, "entries": list(self._entries.values())})
+        try:
+            self._mtime_ns = os.stat(self.path).st_mtime_ns
+        except OSError:
+            self._mtime_ns = None
+        self._index()
+
+    def _age(self):
+        """Age every rank once the total is too high and keep at most MAX_ENTRIES directories."""
+        if sum(rank for _, rank, _ in self._entries.values()) > MAX_TOTAL:
+            for key, entry in list(self._entries.items()):
+                entry[1] *= AGING
+                if entry[1] < 1:
+                    del self._entries[key]
+        if len(self._entries) > MAX_ENTRIES:
+            now = time.time()
+            ranked = sorted(self._entries, key=lambda key: frecency(*self._entries[key][1:], now), reverse=True)
+            for key in ranked[MAX_ENTRIES:]:
+                del self._entries[key]
+
+    def visit(self, directory: str, now: Optional[float] = None):
+        """Record a visit to `directory` (an absolute path)."""
+        self._reload()
+        now = time.time() if now is None else now
+        directory = os.path.normpath(directory)
+        entry = self._entries.get(_key(directory))
+        if entry is None:
+            self._entries[_key(directory)] = [directory, 1.0, now]
+        else:
+            entry[0], entry[1], entry[2] = directory, entry[1] + 1, now
+        self._age()
+        self._save()
+
+    def forget(self, directory: str):
+        """Drop `directory`, e.g. because it no longer exists."""
+        self._reload()
+        if self._entries.pop(_key(directory), None) is not None:
+            self._save()
+
+    def ranked(self, terms: Sequence[str] = (), now: Optional[float] = None) -> List[Tuple[float, str]]:
+        """(score, path) of the directories matching `terms`, best first.
+
+        Like z, every term must appear in the path (ignoring case), in the
+        order given; directories whose own name contains the last term come
+        before those matching only higher up the path.
+        """
+        self._reload()
+        now = time.time() if now is None else now
+        terms = [term.lower() for term in terms if term]
+        last = terms[-1] if terms else ""
+        lower = self._lower
+        if terms:
+            longest = max(terms, key=len)
+            candidates = [index for index, path in enumerate(lower) if longest in path]
+        else:
+            candidates = range(len(lower))
+        results = []
+        for index in candidates:
+            path = lower[index]
+            position = 0
+            for term in terms:
+                position = path.find(term, position)
+                if position < 0:
+                    break
+                position += len(term)
+            else:
+                original, rank, last_visit = self._entries[self._keys[index]]
+                name = path.rstrip("/" + os.sep)
+                name = name[max(name.rfind("/"), name.rfind(os.sep)) + 1:]
+                results.append((last in name, frecency(rank, last_visit, now), original))
+        results.sort(reverse=True)
+        return [(score, path) for _, score, path in results]
+
+    def best(self, terms: Sequence[str] = ()) -> Optional[str]:
+        """The best existing directory for `terms`; directories that have vanished are forgotten."""
+        for _, path in self.ranked(terms):
+            if os.path.isdir(path):
+                return path
+            self.forget(path)
+        return None
@@ -0,0 +1,261 @@
+# historydb.py
+"""
+Persistent command history shared by every shell session.
+
+Stored in SQLite (WAL mode, so several shells can append at once while others
+read) in the state directory:
+
+    commands  one row per distinct command line (the deduplicated view), with
+              how often it ran, its latest run and a bitmask of its characters
+    runs      append-only log of every execution: cwd, exit status, duration
+    commands_fts
+              FTS5 trigram index over command lines, so substring search
+              uses the index instead of scanning (when SQLite has FTS5)
+
+Reverse search is newest first and stops as soon as it has enough distinct
+commands. Fuzzy search cannot use the trigram index, so it walks the
+(last_run, chars) index and only runs LIKE on lines that contain every
+character of the query. compact() trims the run log to MAX_RUNS and drops commands nobody
+ran since; it also runs on its own every COMPACT_EVERY appends.
+"""
+
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, NamedTuple, Optional
+
+from prompt_toolkit.history import History
+
+from appdata import data_path
+
+MAX_RUNS = 1_000_000  # Runs kept by compaction; the oldest go first
+COMPACT_EVERY = 1000  # Appends between checks whether compaction is due
+LOAD_LIMIT = 10_000  # Distinct commands loaded for arrow-key and Ctrl-R history
+BUSY_TIMEOUT_MS = 5000  # How long a writer waits for another shell's transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS commands (
+    id INTEGER PRIMARY KEY,
+    text TEXT NOT NULL UNIQUE,
+    count INTEGER NOT NULL DEFAULT 0,
+    last_run INTEGER NOT NULL DEFAULT 0,
+    chars INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS commands_recent ON commands(last_run, chars);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    command_id INTEGER NOT NULL REFERENCES commands(id),
+    cwd TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    duration REAL NOT NULL,
+    started REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_command ON runs(command_id);
+CREATE INDEX IF NOT EXISTS runs_cwd ON runs(cwd, id);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS commands_fts USING fts5(
+    text, content='commands', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS commands_fts_insert AFTER INSERT ON commands BEGIN
+    INSERT INTO commands_fts(rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS commands_fts_delete AFTER DELETE ON commands BEGIN
+    INSERT INTO commands_fts(commands_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+
+class HistoryEntry(NamedTuple):
+    id: int
+    command: str
+    cwd: str
+    status: int
+    duration: float
+    started: float
+
+
+def char_mask(text: str) -> int:
+    """Bitmask of the characters in `text` (ignoring case): letters and digits get a bit each, the rest share 26."""
+    mask = 0
+    for char in set(text.lower()):
+        code = ord(char)
+        if 97 <= code <= 122:
+            mask |= 1 << (code - 97)
+        elif 48 <= code <= 57:
+            mask |= 1 << (code - 22)
+        else:
+            mask |= 1 << (36 + code % 26)
+    return mask
+
+
+def like_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class HistoryDB:
+    """Command history in SQLite; safe to share between threads and between shell processes."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or data_path("history.sqlite3")
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000,
+                                   isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")  # WAL stays consistent; a power cut may lose the last lines
+        self._db.executescript(SCHEMA)
+        try:
+            self._db.executescript(FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False  # SQLite without FTS5/trigram: substring search scans instead
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def append(self, command: str, cwd: str = "", status: int = 0, duration: float = 0.0,
+               started: Optional[float] = None) -> int:
+        """Log one execution of `command`; returns the run's id."""
+        started = time.time() if started is None else started
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("INSERT OR IGNORE INTO commands(text, chars) VALUES (?, ?)", (command, char_mask(command)))
+                (command_id,) = self._db.execute("SELECT id FROM commands WHERE text = ?", (command,)).fetchone()
+                run_id = self._db.execute(
+                    "INSERT INTO runs(command_id, cwd, status, duration, started) VALUES (?, ?, ?, ?, ?)",
+                    (command_id, cwd, status, duration, started),
+                ).lastrowid
+                self._db.execute("UPDATE commands SET count = count + 1, last_run = ? WHERE id = ?", (run_id, command_id))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        if run_id % COMPACT_EVERY == 0:
+            self.compact(vacuum=False, only_if_due=True)
+        return run_id
+
+    def recent_commands(self, limit: int = LOAD_LIMIT) -> List[str]:
+        """Distinct command lines, most recently run first."""
+        with self._lock:
+            rows = self._db.execute("SELECT text FROM commands ORDER BY last_run DESC LIMIT ?", (limit,)).fetchall()
+        return [text for (text,) in rows]
+
+    def search(self, text: str = "", fuzzy: bool = False, cwd: Optional[str] = None,
+               status: Optional[int] = None, failed: bool = False, limit: int = 50,
+               unique: bool = True) -> List[HistoryEntry]:
+        """Runs whose command contains `text` (or its characters in order if `fuzzy`), newest first.
+
+        `cwd`, `status` and `failed` filter on the run; `unique` keeps only the
+        newest run of each command line.
+        """
+        where, params = [], []
+        if text:
+            if fuzzy:
+                mask = char_mask(text)
+                where.append("(c.chars & ?) = ? AND c.text LIKE ? ESCAPE '\\'")
+                params.extend((mask, mask, "%" + "%".join(like_escape(char) for char in text) + "%"))
+            elif self.fts and len(text) >= 3:
+                # A trigram phrase query is a case-insensitive substring match answered from the index
+                where.append("c.id IN (SELECT rowid FROM commands_fts WHERE commands_fts MATCH ?)")
+                params.append('"' + text.replace('"', '""') + '"')
+            else:
+                where.append("c.text LIKE ? ESCAPE '\\'")
+                params.append(f"%{like_escape(text)}%")
+        run_filters = cwd is not None or status is not None or failed
+        if cwd is not None:
+            where.append("r.cwd = ?")
+            params.append(cwd)
+        if status is not None:
+            where.append("r.status = ?")
+            params.append(status)
+        if failed:
+            where.append("r.status != 0")
+
+        if unique and not run_filters:
+            # Newest run of each command: walk the commands table by last_run
+            query = ("SELECT r.id, c.text, r.cwd, r.status, r.duration, r.started "
+                     "FROM commands c JOIN runs r ON r.id = c.last_run")
+            order = " ORDER BY c.last_run DESC"
+        else:
+            query = ("SELECT r.id, c.text, r.cwd, r.status, r.duration, r.started "
+                     "FROM runs r JOIN commands c ON c.id = r.command_id")
+            order = " ORDER BY r.id DESC"
+        query += (" WHERE " + " AND ".join(where) if where else "") + order
+        if not (unique and run_filters):
+            query += f" LIMIT {int(limit)}"
+
+        results, seen = [], set()
+        with self._lock:
+            for row in self._db.execute(query, params):
+                entry = HistoryEntry(*row)
+                if unique and run_filters:
+                    # Several runs of one command can pass the filters; keep the newest
+                    if entry.command in seen:
+                        continue
+                    seen.add(entry.command)
+                results.append(entry)
+                if len(results) >= limit:
+                    break
+        return results
+
+    def __len__(self) -> int:
+        """Number of runs logged."""
+        with self._lock:
+            return self._db.execute("SELECT count(*) FROM runs").fetchone()[0]
+
+    def compact(self, max_runs: int = MAX_RUNS, vacuum: bool = True, only_if_due: bool = False) -> int:
+        """Drop all but the newest `max_runs` runs and the commands left without runs; returns runs removed."""
+        with self._lock:
+            oldest, newest = self._db.execute("SELECT min(id), max(id) FROM runs").fetchone()
+            if newest is None or (only_if_due and newest - oldest < max_runs):
+                return 0
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                removed = self._db.execute("DELETE FROM runs WHERE id <= ?", (newest - max_runs,)).rowcount
+                self._db.execute("DELETE FROM commands WHERE id NOT IN (SELECT DISTINCT command_id FROM runs)")
+                # Commands whose latest run is gone still keep the count of the runs left
+                self._db.execute("UPDATE commands SET count = (SELECT count(*) FROM runs WHERE command_id = commands.id)")
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            if self.fts:
+                self._db.execute("INSERT INTO commands_fts(commands_fts) VALUES ('optimize')")
+            if vacuum:
+                self._db.execute("VACUUM")
+            return removed
+
+
+class PromptHistory(History):
+    """prompt_toolkit history backed by a HistoryDB.
+
+    Arrow keys and Ctrl-R see the LOAD_LIMIT most recent distinct commands.
+    Lines are written to the database by the shell once they have run (with
+    their cwd, status and duration), not here.
+    """
+
+    def __init__(self, db: HistoryDB):
+        super().__init__()
+        self.db = db
+
+    def load_history_strings(self) -> Iterable[str]:
+        try:
+            yield from self.db.recent_commands()
+        except sqlite3.Error:
+            return  # A locked or damaged database must not stop the prompt
+
+    def store_string(self, string: str) -> None:
+        pass
+
+
+def record(db: HistoryDB, line: str, cwd: str, status: int, duration: float, started: float):
+    """Append a finished line, ignoring blank lines and lines starting with a space (like HISTCONTROL=ignorespace)."""
+    if not line.strip() or line[:1].isspace():
+        return
+    try:
+        db.append(line.strip(), cwd, status, duration, started)
+    except sqlite3.Error:
+        pass  # History is best effort; the command itself already ran
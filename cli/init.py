@@ -2,93 +2,166 @@
 from rich.panel import Panel
 from rich.text import Text
 from rich.console import Console
-from rich.prompt import Prompt
 from prompt_toolkit.history import InMemoryHistory
 
 from prompt_toolkit.completion import  Completion, Completer  
 import os
+import time
+
+from dircache import DirectoryCache
 
 console = Console()
 
+MAX_COMPLETIONS = 200  # Candidates yielded per keystroke; the menu cannot show more anyway
+MAX_FRECENT = 10  # Frecent directories offered after `cd`, `z` and `jump`
+JUMP_COMMANDS = ("z", "jump")
+DEFAULT_DEADLINE = 0.5  # Seconds a completion may wait on the filesystem before giving up with what it has
+
+
+def completion_deadline() -> float:
+    """MYCLI_COMPLETION_DEADLINE (seconds) if set to a number, otherwise DEFAULT_DEADLINE."""
+    try:
+        return float(os.environ["MYCLI_COMPLETION_DEADLINE"])
+    except (KeyError, ValueError):
+        return DEFAULT_DEADLINE
+
+
+def split_last_word(text: str):
+    """Split the word under the cursor off `text`, honouring quotes.
+
+    Returns (raw word as typed, word with quotes removed, open quote or "",
+    True if it is the first word on the line).
+    """
+    quote = ""
+    start = 0
+    first = True
+    seen_word = False
+    for index, char in enumerate(text):
+        if quote:
+            if char == quote:
+                quote = ""
+        elif char in "\"'":
+            quote = char
+            seen_word = True
+        elif char.isspace():
+            if seen_word:
+                first = False
+                seen_word = False
+            start = index + 1
+        else:
+            seen_word = True
+    raw = text[start:]
+    value = raw.replace('"', "").replace("'", "")
+    return raw, value, quote, first
+
+
+def quote_path(path: str, quote: str, is_dir: bool) -> str:
+    """Completion text for `path`, quoted if it needs to be; directories leave the quote open."""
+    if not quote and any(char.isspace() for char in path):
+        quote = '"'
+    if not quote:
+        return path
+    return f"{quote}{path}" if is_dir else f"{quote}{path}{quote}"
+
+
 class ContextAwareCompleter(Completer):
-    def __init__(self, commands):
+    """Command and path completion, safe to run on prompt_toolkit's completion thread.
+
+    Each request takes a generation number; a newer keystroke bumps it, and the
+    older request stops at its next check instead of finishing work nobody
+    will see. Path candidates are yielded as the directory scan finds them and
+    the request gives up at its deadline with whatever it found by then.
+    """
+
+    def __init__(self, commands, executables=None, directories=None, deadline=None, frecency=None):
         self.commands = commands  # Dictionary of available commands
+        self.executables = executables  # ExecutableIndex of the programs on PATH
+        self.frecency = frecency  # FrecencyDB ranking visited directories for cd/z/jump
+        self.directories = directories or DirectoryCache()  # Listings reused until a directory's mtime changes
+        self.deadline = completion_deadline() if deadline is None else deadline
+        self._generation = 0
 
     def get_completions(self, document, complete_event):
         """Provide suggestions based on the command context"""
-        text_before_cursor = document.text_before_cursor.strip()
-        words = text_before_cursor.split()
-
-        if not words:
+        self._generation += 1
+        generation = self._generation
+        cancelled = lambda: self._generation != generation  # noqa: E731
+        text_before_cursor = document.text_before_cursor
+        if not text_before_cursor.strip():
             return  # No input yet
 
-        # If typing first word, suggest commands
-        if len(words) == 1:
+        raw, word, quote, first = split_last_word(text_before_cursor)
+
+        # If typing first word, suggest commands (unless it is clearly a path such as ./script)
+        if first and not quote and os.sep not in word and "/" not in word:
+            count = 0
             for command in self.commands.keys():
-                if command.startswith(words[0]):
-                    yield Completion(command, start_position=-len(words[0]))
+                if cancelled():
+                    return
+                if command.startswith(word):
+                    yield Completion(command, start_position=-len(raw))
+                    count += 1
+            if self.executables is not None:
+                for command in self.executables.with_prefix(word, limit=MAX_COMPLETIONS - count):
+                    if cancelled():
+                        return
+                    if command not in self.commands:
+                        yield Completion(command, start_position=-len(raw))
+            return
 
-        # If typing arguments, suggest files and directories
-        else:
-            current_dir = os.getcwd()
-            try:
-                for item in os.listdir(current_dir):
-                    if item.startswith(words[-1]):  # Filter matching input
-                        yield Completion(item, start_position=-len(words[-1]))
-            except Exception:
-                pass
+        command, _, rest = text_before_cursor.lstrip().partition(" ")
+        if self.frecency is not None and command in JUMP_COMMANDS:
+            # z matches every typed part, so a candidate replaces all of them
+            rest = rest.lstrip()
+            terms = [term for term in rest.replace('"', "").replace("'", "").split() if term != "-l"]
+            yield from self.frecent_completions(terms, len(rest))
+            return
+
+        # Otherwise complete a path, relative to the cwd or nested (src/mod, ~/proj, "My Docs/")
+        yield from self.path_completions(raw, word, quote, cancelled)
+        if self.frecency is not None and command == "cd" and word and os.sep not in word and "/" not in word:
+            if not cancelled():
+                yield from self.frecent_completions([word], len(raw))
+
+    def frecent_completions(self, terms, replace: int):
+        """Visited directories matching `terms`, best ranked first."""
+        for _, path in self.frecency.ranked(terms)[:MAX_FRECENT]:
+            yield Completion(
+                quote_path(path, "", False),
+                start_position=-replace,
+                display=path,
+                display_meta="frecent",
+            )
+
+    def path_completions(self, raw: str, word: str, quote: str, cancelled=lambda: False):
+        head, prefix = os.path.split(word)
+        directory = os.path.expanduser(head) if head else os.curdir
+        deadline = time.monotonic() + self.deadline
+        for entry in self.directories.stream(directory, prefix, limit=MAX_COMPLETIONS,
+                                             deadline=deadline, cancelled=cancelled):
+            path = os.path.join(head, entry.name) if head else entry.name
+            if entry.is_dir:
+                path += os.sep
+            yield Completion(
+                quote_path(path, quote, entry.is_dir),
+                start_position=-len(raw),
+                display=entry.name + (os.sep if entry.is_dir else ""),
+            )
             
-def initialize_powershell():
-    commands = {
-        # File & Directory Operations
-        "cd": "Change directory: cd <path> and use 'cd ..' to navigate back to the previous directory",
-        "ls": "List files and directories",
-        "dir": "List files and directories (Windows alternative to 'ls')",
-        "touch": "Create an empty file: touch <filename>",
-        "mkdir": "Create a new directory: mkdir <dirname>",
-        "rmdir": "Delete a directory: rmdir <dirname>",
-        "rm": "Delete a file: rm <filename>",
-        "rename": "Rename a file or directory: rename <old> <new>",
-        "copy": "Copy a file: copy <source> <destination>",
-        "move": "Move a file: move <source> <destination>",
-        "tree": "Display folder structure in tree format",
-
-        # System Information & Management
-        "whoami": "Display the current user",
-        "hostname": "Show the computer’s hostname",
-        "systeminfo": "Get detailed system information",
-        "tasklist": "List running processes",
-        "taskkill": "Kill a process by name or PID: taskkill /PID <id> /F",
-
-        # Networking & IP Management
-        "ipconfig": "Show network configuration",
-        "ping": "Test network connectivity: ping <host>",
-        "tracert": "Trace the route packets take to a destination",
-        "netstat": "Display active network connections",
-        "nslookup": "Get DNS information for a domain: nslookup <domain>",
-
-        # Disk & Storage Commands
-        "diskpart": "Manage disk partitions",
-        "chkdsk": "Check disk for errors",
-        "wmic": "Windows Management Instrumentation Command-line: wmic logical disk get",
-        
-        # Shell & Exit Commands
-        "exit": "Exit the shell",
-        "help": "Show available commands or details for a specific command using '<command> --help'.",
-        "undo": "Undo the last command",
-        "ask": "Ask the CLI assistant a question about commands or usage. Type 'ask' to start.",
-    }
-    
-    completer = ContextAwareCompleter(commands)
+def initialize_powershell(commands, executables=None, frecency=None, history=None):
+    """Build the interactive pieces of the shell (completer, banner, line history).
+
+    Only needed once the first prompt is drawn, so PowerShell calls this lazily
+    rather than from __init__.
+    """
+    completer = ContextAwareCompleter(commands, executables, frecency=frecency)
     intro = Panel.fit(
         Text("🚀 Welcome to PowerCLI!\nType 'help' for commands", justify="center"),
         style="bold magenta"
     )
     
     return {
-        "commands": commands,
         "completer": completer,
         "intro": intro,
-        "command_history": [],
-        "history": InMemoryHistory(),
+        "history": history if history is not None else InMemoryHistory(),
     }
@@ -0,0 +1,292 @@
+# jobs.py
+"""
+Background jobs: `ping -t host &`, then `jobs`, `fg %1`, `bg %1`, `kill %1`, `wait`.
+
+Every job is a child process started in a session (process group) of its own,
+so Ctrl+C at the prompt reaches only the foreground command. External
+commands are started directly. Builtins and pipelines run in a child shell:
+this file run as a script, which gives the line to PowerShell.onecmd. Nobody
+can answer a background job's questions, so only a prompt's own default is
+taken; a builtin that needs a real answer (rm's "Are you sure?") fails, and
+the job ends with a non-zero status.
+
+The child shell keeps its undo records in memory and writes them, when the
+line is done, to a file next to the starting shell's journal,
+"<journal>.job<n>". The starting shell takes them over before it runs its
+next line, so `undo` there reverts what the job did. Until then the file
+counts as a reference when the backup store is collected, and if the
+starting shell dies first, the next shell adopts the file with its journal.
+
+A reader thread per job moves the child's output (stdout and stderr
+together) into the job's buffer. The buffer keeps the last OUTPUT_CAP bytes,
+so a job left running for days stays bounded. While a job is in the
+foreground its output is also handed to `fg` as it arrives. When a job ends
+it is queued for a notification, which the shell prints before the next
+prompt. Finished jobs stay in the table, with their output, until `fg` shows
+them or more than KEEP_FINISHED have piled up.
+"""
+
+import atexit
+import os
+import queue
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+from registry import SHELL_INTERNALS
+
+OUTPUT_CAP = 1024 * 1024  # Bytes of output kept per job: the most recent ones
+READ_SIZE = 64 * 1024
+KEEP_FINISHED = 20  # Finished jobs kept (oldest forgotten first) until fg shows them
+UNDO_RECORDS_ENV = "MYCLI_JOB_UNDO"  # Tells a child shell where to leave its undo records
+
+
+class JobError(Exception):
+    """A job could not be started or found."""
+
+
+def background_line(line: str) -> Optional[str]:
+    """The command of a line ending in a lone `&`, or None if it does not ask for a background job."""
+    stripped = line.rstrip()
+    if not stripped.endswith("&") or stripped.endswith("&&") or stripped.endswith("\\&"):
+        return None
+    if stripped.count('"') % 2 or stripped.count("'") % 2:
+        return None  # The & is inside an unterminated quote
+    return stripped[:-1].rstrip()
+
+
+class Job:
+    """A background command: its process, captured output and state."""
+
+    def __init__(self, number: int, command: str, process: subprocess.Popen):
+        self.number = number
+        self.command = command
+        self.process = process
+        self.started = time.time()
+        self.ended: Optional[float] = None
+        self.stopped = False
+        self.output = bytearray()
+        self.dropped = 0  # Bytes of output that fell out of the buffer
+        self.listener: Optional[queue.Queue] = None  # Set while `fg` shows the output live
+        self.lock = threading.Lock()
+        self.done = threading.Event()  # Set once the job has ended and all its output is in
+        self.undo_path: Optional[str] = None  # Where a child shell leaves its undo records
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    @property
+    def running(self) -> bool:
+        return self.ended is None
+
+    @property
+    def status(self) -> Optional[int]:
+        return self.process.returncode if self.ended is not None else None
+
+    @property
+    def state(self) -> str:
+        if self.running:
+            return "Stopped" if self.stopped else "Running"
+        if self.status == 0:
+            return "Done"
+        return f"Exit {self.status}" if self.status > 0 else f"Killed ({-self.status})"
+
+    def captured(self) -> bytes:
+        with self.lock:
+            return bytes(self.output)
+
+    def _add(self, data: bytes):
+        with self.lock:
+            self.output += data
+            if len(self.output) > OUTPUT_CAP:
+                excess = len(self.output) - OUTPUT_CAP
+                del self.output[:excess]
+                self.dropped += excess
+            if self.listener is not None:
+                self.listener.put(data)
+
+
+def _child_command(shell, command: str) -> List[str]:
+    """How to start `command` on its own: directly if it is a program, else in a child shell."""
+    argv = shlex.split(command)
+    if not argv:
+        raise JobError("Nothing to run in the background")
+    name = argv[0]
+    if _needs_shell(shell, command):
+        return [sys.executable, os.path.abspath(__file__), command]
+    if os.name == "nt" and name.lower() in SHELL_INTERNALS:
+        return ["cmd.exe", "/c", *argv]
+    if shell.is_system_command(name):
+        return argv
+    raise JobError(f"Unknown command: '{name}'")
+
+
+def _needs_shell(shell, command: str) -> bool:
+    from pipeline import parse_pipeline
+    return shlex.split(command)[0] in shell.dispatch or parse_pipeline(command) is not None
+
+
+def _process_tree(job: Job):
+    import psutil
+    try:
+        parent = psutil.Process(job.pid)
+        return [parent] + parent.children(recursive=True)
+    except psutil.NoSuchProcess:
+        return []
+
+
+class JobTable:
+    """The shell's background jobs, numbered from 1 like %1, %2 in other shells."""
+
+    def __init__(self):
+        self.jobs: Dict[int, Job] = {}
+        self._finished: "queue.Queue[Job]" = queue.Queue()  # Ended, not yet announced
+        self._undo_ready: "queue.Queue[Job]" = queue.Queue()  # Ended child shells, undo records not yet taken
+        atexit.register(self.close)
+
+    def start(self, shell, command: str) -> Job:
+        argv = _child_command(shell, command)
+        number = max(self.jobs, default=0) + 1
+        options = {"start_new_session": True} if os.name != "nt" else \
+            {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+        undo_path = None
+        if _needs_shell(shell, command):
+            from journal import job_records_path
+            undo_path = job_records_path(shell.command_history, number)
+            options["env"] = dict(os.environ, **{UNDO_RECORDS_ENV: undo_path})
+        try:
+            process = subprocess.Popen(argv, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT, **options)
+        except OSError as e:
+            raise JobError(f"Cannot start '{command}': {e.strerror or e}")
+        job = Job(number, command, process)
+        job.undo_path = undo_path
+        self.jobs[job.number] = job
+        threading.Thread(target=self._collect, args=(job,), name=f"job {job.number}", daemon=True).start()
+        self._forget_finished()
+        return job
+
+    def _collect(self, job: Job):
+        """Read a job's output until it closes, then record how the job ended."""
+        fd = job.process.stdout.fileno()
+        try:
+            while True:
+                data = os.read(fd, READ_SIZE)
+                if not data:
+                    break
+                job._add(data)
+        except OSError:
+            pass
+        finally:
+            job.process.stdout.close()
+            job.process.wait()
+            with job.lock:
+                job.ended = time.time()
+                if job.listener is not None:
+                    job.listener.put(None)
+            job.done.set()
+            self._finished.put(job)
+            if job.undo_path is not None:
+                self._undo_ready.put(job)
+
+    def take_undo(self) -> List[tuple]:
+        """(command, undo_info) pairs left by child shells that ended since the last call, oldest job first."""
+        from journal import take_job_records
+        records = []
+        while True:
+            try:
+                job = self._undo_ready.get_nowait()
+            except queue.Empty:
+                return records
+            records += take_job_records(job.undo_path)
+
+    def _forget_finished(self):
+        finished = [job for job in self.jobs.values() if not job.running]
+        for job in finished[:max(0, len(finished) - KEEP_FINISHED)]:
+            del self.jobs[job.number]
+
+    def find(self, spec: Optional[str] = None) -> Job:
+        """The job named by %n (or n); without one, the most recent job."""
+        if spec is None:
+            if not self.jobs:
+                raise JobError("No jobs")
+            return self.jobs[max(self.jobs)]
+        number = spec[1:] if spec.startswith("%") else spec
+        if not number.isdigit() or int(number) not in self.jobs:
+            raise JobError(f"No such job: {spec}")
+        return self.jobs[int(number)]
+
+    def finished(self) -> List[Job]:
+        """Jobs that ended since the last call, to announce."""
+        jobs = []
+        while True:
+            try:
+                jobs.append(self._finished.get_nowait())
+            except queue.Empty:
+                return jobs
+
+    def remove(self, job: Job):
+        self.jobs.pop(job.number, None)
+
+    # Signals, to the job's whole process tree
+
+    def suspend(self, job: Job):
+        for process in _process_tree(job):
+            process.suspend()
+        job.stopped = True
+
+    def resume(self, job: Job):
+        for process in reversed(_process_tree(job)):
+            process.resume()
+        job.stopped = False
+
+    def terminate(self, job: Job, force: bool = False):
+        tree = _process_tree(job)
+        for process in reversed(tree):  # Children first, so none is left orphaned
+            try:
+                process.kill() if force else process.terminate()
+                if job.stopped:
+                    process.resume()  # A stopped process only acts on SIGTERM once it runs
+            except Exception:
+                pass  # Already gone
+
+    def interrupt(self, job: Job):
+        """What Ctrl+C does to a foreground job."""
+        import signal
+        if os.name == "nt":
+            job.process.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            os.killpg(job.pid, signal.SIGINT)
+
+    def wait(self, job: Job, timeout: Optional[float] = None) -> Optional[int]:
+        """The job's exit status once it has ended, or None if it is still running after `timeout`."""
+        return job.status if job.done.wait(timeout) else None
+
+    def close(self):
+        """End every job still running, as a terminal closing would."""
+        for job in list(self.jobs.values()):
+            if job.running:
+                self.terminate(job)
+
+
+if __name__ == "__main__":
+    # A background builtin or pipeline: run the line in a shell of its own, taking only prompts' defaults,
+    # and hand its undo records back to the shell that started it
+    from answers import AnswerPolicy, answering
+    from journal import UndoList, write_job_records
+    from main import PowerShell
+
+    shell = PowerShell()
+    shell.keep_scrollback = False
+    shell.command_history = UndoList()
+    try:
+        with answering(AnswerPolicy()):
+            shell.onecmd(sys.argv[1])
+    finally:
+        if os.environ.get(UNDO_RECORDS_ENV):
+            write_job_records(os.environ[UNDO_RECORDS_ENV], list(shell.command_history))
+    sys.exit(shell.last_status)
@@ -0,0 +1,572 @@
+# journal.py
+"""
+Crash-safe undo journal.
+
+The shell's undo history (`command_history`) is a list of
+(command, undo_info) pairs. UndoJournal keeps that list interface but writes
+every change to a write-ahead log before it is made, so the history survives
+`exit`, a crash or a killed terminal and is picked up by the next shell.
+
+Each session appends to its own journal file under <state dir>/undo, held
+with an exclusive file lock. A record is a fixed 20-byte header followed by a
+JSON payload:
+
+    magic  b"UJ"   2 bytes
+    kind   u8      PUSH or POP
+    flags  u8      reserved, 0
+    length u32     payload bytes
+    crc    u32     crc32 of kind, seq and payload
+    seq    u64     entry number (POP names the entry it removes)
+
+On startup, journals whose lock can be taken belong to sessions that are gone.
+They are replayed, oldest first, into the new session's journal and deleted.
+Replay stops at the first torn or corrupt record, so a crash mid-write loses
+at most that record. The log is rewritten with only the live entries once
+popped records make up most of it.
+
+Entries may own backup artifacts (undo_info["artifacts"], absolute paths),
+trashed items and objects in the backup store (the "untrash" and "restore"
+operations of undoops). Artifacts count towards the byte cap, and so do the
+sizes of the files saved to the store (a restore operation's "bytes"). When
+an entry is evicted for going over the count or size cap, its artifacts and
+trashed items are deleted and the store drops the objects that no journal
+refers to any more.
+
+Records appended between begin_group() and end_group() become a single
+entry, so everything one command line did is undone as a unit.
+
+The redo records of a session restore from the store too, so keep_redo()
+writes them next to the journal, to "<journal>.redo". Collecting the store
+counts those as references, whichever session collects. The next shell
+releases a dead session's redo records along with adopting its journal.
+In-memory histories (UndoList) are counted by collections in their own
+process.
+
+Background builtins run in child shells, which leave their undo records in
+"<journal>.job<n>-<time>" files for the shell that started them
+(write_job_records, take_job_records). Those count as references too, and
+the next shell adopts them along with a dead session's journal.
+"""
+
+import json
+import os
+import shutil
+import struct
+import time
+import weakref
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from appdata import data_path, read_json, write_json_atomic
+from undoops import held_objects, held_trash_items, merge, ops_of
+
+HEADER = struct.Struct("<2sBBIIQ")
+MAGIC = b"UJ"
+PUSH, POP = 1, 2
+
+FSYNC_POLICIES = ("always", "batch", "never")
+FSYNC_INTERVAL = 1.0  # Seconds between fsyncs under the "batch" policy
+DEFAULT_MAX_ENTRIES = 500
+DEFAULT_MAX_BYTES = 1 << 30  # Payloads plus the backup artifacts they own
+COMPACT_MIN_BYTES = 64 * 1024  # Never rewrite a log smaller than this
+WINDOWS_LOCK_OFFSET = 0x7FFFFFFE  # Byte locked on Windows, where locks are mandatory
+REDO_SUFFIX = ".redo"
+JOB_SUFFIX = ".job"
+
+_in_memory: "weakref.WeakValueDictionary" = weakref.WeakValueDictionary()  # id -> this process's UndoLists
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ[name])
+    except (KeyError, ValueError):
+        return default
+
+
+def fsync_policy() -> str:
+    """MYCLI_UNDO_FSYNC: "always" (default) syncs every record, "batch" at most once a second, "never" leaves it to the OS."""
+    policy = os.environ.get("MYCLI_UNDO_FSYNC", "always").lower()
+    return policy if policy in FSYNC_POLICIES else "always"
+
+
+def _lock(f) -> bool:
+    """Take an exclusive, non-blocking lock on an open journal; False if another session holds it."""
+    try:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(WINDOWS_LOCK_OFFSET)  # Past any real data, so other sessions can still read the journal
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def encode(kind: int, seq: int, payload: bytes = b"") -> bytes:
+    crc = zlib.crc32(payload, zlib.crc32(struct.pack("<BQ", kind, seq)))
+    return HEADER.pack(MAGIC, kind, 0, len(payload), crc, seq) + payload
+
+
+def decode(data: bytes) -> Iterator[Tuple[int, int, bytes]]:
+    """(kind, seq, payload) of each intact record, stopping at the first torn or corrupt one."""
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        magic, kind, _, length, crc, seq = HEADER.unpack_from(data, offset)
+        end = offset + HEADER.size + length
+        if magic != MAGIC or kind not in (PUSH, POP) or end > len(data):
+            return
+        payload = data[offset + HEADER.size:end]
+        if zlib.crc32(payload, zlib.crc32(struct.pack("<BQ", kind, seq))) != crc:
+            return
+        yield kind, seq, payload
+        offset = end
+
+
+def replay(data: bytes) -> "Dict[int, bytes]":
+    """Live entries (seq -> payload) in a journal's contents, in the order they were pushed."""
+    entries: Dict[int, bytes] = {}
+    for kind, seq, payload in decode(data):
+        if kind == PUSH:
+            entries[seq] = payload
+        else:
+            entries.pop(seq, None)
+    return entries
+
+
+def artifact_size(paths) -> int:
+    total = 0
+    for path in paths:
+        try:
+            if os.path.isdir(path) and not os.path.islink(path):
+                for root, _, files in os.walk(path):
+                    for name in files:
+                        try:
+                            total += os.lstat(os.path.join(root, name)).st_size
+                        except OSError:
+                            pass
+            else:
+                total += os.lstat(path).st_size
+        except OSError:
+            pass
+    return total
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def remove_artifacts(undo_info) -> None:
+    """Delete the backup files or directories an undo record owns."""
+    if not isinstance(undo_info, dict):
+        return
+    for path in undo_info.get("artifacts", ()):
+        try:
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def release(undo_info, directory: Optional[str] = None) -> None:
+    """Free what an undo record held once it is gone: backup files, trashed items, unshared store objects."""
+    release_all([undo_info], directory)
+
+
+def release_all(records, directory: Optional[str] = None) -> None:
+    """release() for many records, deleting their trashed items and collecting the store once."""
+    items, objects = [], False
+    for undo_info in records:
+        remove_artifacts(undo_info)
+        items.extend(held_trash_items(undo_info))
+        objects = objects or any(True for _ in held_objects(undo_info))
+    if items:
+        from trash import Trash
+        Trash().discard(items)  # Still in the trash only if the record was evicted rather than undone
+    if objects:
+        collect_backups(directory)
+
+
+def job_records_path(history, number: int) -> str:
+    """Where the child shell running background job `number` leaves its undo records for `history`."""
+    base = getattr(history, "path", None)
+    if base is None:  # An in-memory history: no journal to sit next to
+        directory = data_path("undo")
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"{os.getpid()}-{id(history)}.memory")
+    return f"{base}{JOB_SUFFIX}{number}-{time.time_ns()}"
+
+
+def write_job_records(path: str, records: List[Tuple[str, object]]):
+    write_json_atomic(path, records)
+
+
+def take_job_records(path: str) -> List[Tuple[str, object]]:
+    """The undo records a background job left, removing the file (none if it was killed before writing them)."""
+    records = [tuple(record) for record in read_json(path, [])]
+    _remove_quietly(path)
+    return records
+
+
+def _journal_of(name: str) -> Optional[str]:
+    """The journal a redo or job records file belongs to, by name."""
+    end = name.find(".journal" + REDO_SUFFIX)
+    if end < 0:
+        end = name.find(".journal" + JOB_SUFFIX)
+    return name[:end + len(".journal")] if end >= 0 else None
+
+
+def referenced_objects(directory: Optional[str] = None) -> set:
+    """Backup store objects that the undo and redo records of every journal, running or not, restore from.
+
+    Also those of the in-memory histories of this process.
+    """
+    directory = directory or data_path("undo")
+    referenced = set()
+    for name in os.listdir(directory) if os.path.isdir(directory) else ():
+        journal = _journal_of(name)
+        if journal is not None:
+            if os.path.exists(os.path.join(directory, journal)):  # Else its session was adopted
+                for _, undo_info in read_json(os.path.join(directory, name), []):
+                    referenced.update(held_objects(undo_info))
+            continue
+        if not name.endswith(".journal"):
+            continue
+        try:
+            with open(os.path.join(directory, name), "rb") as f:
+                data = f.read()
+        except OSError:
+            continue
+        for payload in replay(data).values():
+            _, undo_info = json.loads(payload.decode("utf-8"))
+            referenced.update(held_objects(undo_info))
+    for history in list(_in_memory.values()):
+        for _, undo_info in list(history) + list(history.redo):
+            referenced.update(held_objects(undo_info))
+    return referenced
+
+
+def collect_backups(directory: Optional[str] = None) -> int:
+    """Garbage-collect the backup store against the records of every journal."""
+    from backupstore import BackupStore
+    return BackupStore().collect_garbage(referenced_objects(directory))
+
+
+class UndoGroups:
+    """Transaction groups: appends between begin_group() and end_group() are kept as one entry.
+
+    Groups nest; only the outermost one stores what they collected.
+    """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._group: List[Tuple[str, object]] = []  # Records collected by the open groups
+        self._starts: List[int] = []  # Where each open group's records begin in _group
+        self.redo: List[Tuple[str, object]] = []  # The session's redo stack, as last given to keep_redo()
+
+    def keep_redo(self, records: List[Tuple[str, object]]):
+        """Hold on to the session's (command, redo record) pairs, so collecting the store spares their objects."""
+        self.redo = list(records)
+
+    def begin_group(self):
+        self._starts.append(len(self._group))
+
+    def end_group(self, command: str) -> bool:
+        """Close the innermost group, storing what it collected under `command`; True if it recorded anything."""
+        start = self._starts.pop()
+        if self._starts:
+            return len(self._group) > start  # The enclosing group stores them
+        group, self._group = self._group, []
+        if not group:
+            return False
+        self._commit(group[0] if len(group) == 1 else (command, merge([undo_info for _, undo_info in group])))
+        return True
+
+    def discard_group(self) -> list:
+        """Close the innermost group without keeping it; returns the undo records it collected."""
+        start = self._starts.pop()
+        discarded, self._group = self._group[start:], self._group[:start]
+        return [undo_info for _, undo_info in discarded]
+
+    def append(self, item: Tuple[str, object]):
+        if self._starts:
+            self._group.append(item)
+        else:
+            self._commit(item)
+
+    def append_many(self, items: List[Tuple[str, object]]):
+        """Append several entries at once (one sync for a journal)."""
+        if self._starts:
+            self._group.extend(items)
+        else:
+            self._commit_many(items)
+
+
+class UndoList(UndoGroups, list):
+    """Undo history kept in memory only, for sessions that cannot or must not write a journal."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        _in_memory[id(self)] = self  # Counted by referenced_objects() while it lives
+
+    def _commit(self, item):
+        list.append(self, item)
+
+    def _commit_many(self, items):
+        list.extend(self, items)
+
+    def pop_many(self, count: int) -> list:
+        count = min(max(count, 0), len(self))
+        popped = self[len(self) - count:][::-1]
+        del self[len(self) - count:]
+        return popped
+
+
+class UndoJournal(UndoGroups):
+    """List of (command, undo_info) pairs backed by a write-ahead log.
+
+    Supports what the shell does with its undo history: append, pop, len,
+    truth, iteration and indexing, plus transaction groups and pop_many().
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_entries: Optional[int] = None,
+                 max_bytes: Optional[int] = None, fsync: Optional[str] = None):
+        super().__init__()
+        self.directory = directory or data_path("undo")
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_entries = max_entries if max_entries is not None else _env_int("MYCLI_UNDO_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)
+        self.max_bytes = max_bytes if max_bytes is not None else _env_int("MYCLI_UNDO_MAX_BYTES", DEFAULT_MAX_BYTES)
+        self.fsync = fsync or fsync_policy()
+        self.path = os.path.join(self.directory, f"{os.getpid()}-{time.time_ns()}.journal")
+        self._entries: List[Tuple[int, str, object, int, int]] = []  # (seq, command, undo_info, size, record bytes)
+        self._seq = 0
+        self._log_bytes = 0  # Size of the log file
+        self._live_bytes = 0  # Size the log would have if it held only the live entries
+        self._last_sync = 0.0
+        self.recovered = 0  # Entries adopted from earlier sessions
+        self._file = None
+
+        orphans = self._claim_orphans()
+        self._file = self._open_locked(self.path)
+        self._file.truncate(0)
+        jobs = []  # Undo records that background jobs of the dead sessions left
+        for orphan_path, orphan in orphans:
+            for payload in replay(orphan.read()).values():
+                self._push(*json.loads(payload.decode("utf-8")), sync=False)
+                self.recovered += 1
+            prefix = os.path.basename(orphan_path) + JOB_SUFFIX
+            names = [name for name in os.listdir(self.directory) if name.startswith(prefix)]
+            jobs += [os.path.join(self.directory, name) for name in names if name.endswith(".tmp")]  # Torn writes
+            for name in sorted((name for name in names if not name.endswith(".tmp")),
+                               key=lambda name: int(name.rsplit("-", 1)[-1])):  # In the order the jobs started
+                jobs.append(os.path.join(self.directory, name))
+                for command, undo_info in read_json(jobs[-1], []):
+                    self._push(command, undo_info, sync=False)
+                    self.recovered += 1
+        self._sync(force=True)
+        for path in jobs:
+            _remove_quietly(path)
+        stale_redo = []  # Dead sessions' redo stacks: nobody can redo them any more
+        for orphan_path, orphan in orphans:
+            stale_redo += [redo_info for _, redo_info in read_json(orphan_path + REDO_SUFFIX, [])]
+            _remove_quietly(orphan_path + REDO_SUFFIX)
+            if os.name == "nt":
+                orphan.close()  # Windows cannot delete an open file
+                _remove_quietly(orphan_path)
+            else:
+                _remove_quietly(orphan_path)  # Removed while still locked, so nobody else can adopt it
+                orphan.close()
+        self._enforce_caps()
+        for undo_info in stale_redo:
+            remove_artifacts(undo_info)
+        trashed = [item for undo_info in stale_redo for item in held_trash_items(undo_info)]
+        if trashed:
+            from trash import Trash
+            Trash().discard(trashed)
+        if orphans and os.path.isdir(data_path("backups")):
+            collect_backups(self.directory)  # Objects of records popped before a crash, or only redo could use
+
+    def keep_redo(self, records: List[Tuple[str, object]]):
+        """Write the session's redo records next to the journal, where every collection of the store reads them."""
+        super().keep_redo(records)
+        if records:
+            write_json_atomic(self.path + REDO_SUFFIX, self.redo)
+        else:
+            _remove_quietly(self.path + REDO_SUFFIX)
+
+    @staticmethod
+    def _open_locked(path: str):
+        f = open(path, "a+b")
+        if not _lock(f):
+            f.close()
+            raise OSError(f"undo journal {path} is in use")
+        return f
+
+    def _claim_orphans(self):
+        """Lock and open the journals of sessions that no longer run, oldest first."""
+        candidates = []
+        for name in os.listdir(self.directory):
+            if not name.endswith((".journal", ".journal.tmp")):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                candidates.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+        orphans = []
+        for _, path in sorted(candidates):
+            try:
+                f = open(path, "r+b")
+            except OSError:
+                continue
+            if not _lock(f):
+                f.close()  # A running shell's journal
+                continue
+            try:
+                # Another new shell may have adopted and deleted it between our open and our lock
+                still_there = os.path.samestat(os.fstat(f.fileno()), os.stat(path))
+            except OSError:
+                still_there = False
+            if not still_there:
+                f.close()
+            elif path.endswith(".tmp"):
+                f.close()  # Left by a compaction that crashed before its rename; the journal itself is intact
+                _remove_quietly(path)
+            else:
+                f.seek(0)
+                orphans.append((path, f))
+        return orphans
+
+    # Log writing
+
+    def _write(self, record: bytes, sync: bool = True):
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(record)
+        self._log_bytes += len(record)
+        if sync:
+            self._sync()
+
+    def _sync(self, force: bool = False):
+        self._file.flush()
+        if self.fsync == "never" and not force:
+            return
+        now = time.monotonic()
+        if force or self.fsync == "always" or now - self._last_sync >= FSYNC_INTERVAL:
+            os.fsync(self._file.fileno())
+            self._last_sync = now
+
+    def _push(self, command, undo_info, sync: bool = True):
+        self._write(self._add(command, undo_info), sync)
+
+    def _add(self, command, undo_info) -> bytes:
+        """Make (command, undo_info) the newest entry; returns the PUSH record the log needs."""
+        self._seq += 1
+        payload = json.dumps([command, undo_info], separators=(",", ":")).encode("utf-8")
+        size = len(payload)
+        if isinstance(undo_info, dict):
+            if undo_info.get("artifacts"):
+                size += artifact_size(undo_info["artifacts"])
+            size += sum(op.get("bytes", 0) for op in ops_of(undo_info) if op["op"] == "restore")
+        record = encode(PUSH, self._seq, payload)
+        self._entries.append((self._seq, command, undo_info, size, len(record)))
+        self._live_bytes += len(record)
+        return record
+
+    def _drop(self, index: int) -> Tuple[str, object]:
+        seq, command, undo_info, _, record_bytes = self._entries.pop(index)
+        self._live_bytes -= record_bytes
+        self._write(encode(POP, seq))
+        return command, undo_info
+
+    def _enforce_caps(self):
+        """Evict the oldest entries, and their backups, until both caps are met."""
+        total = sum(entry[3] for entry in self._entries)
+        while self._entries and (len(self._entries) > self.max_entries or total > self.max_bytes):
+            total -= self._entries[0][3]
+            _, undo_info = self._drop(0)
+            release(undo_info, self.directory)
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        """Rewrite the log with only the live entries once it is mostly popped records."""
+        if self._log_bytes <= COMPACT_MIN_BYTES or self._log_bytes < 2 * self._live_bytes:
+            return
+        tmp_path = f"{self.path}.tmp"
+        tmp = self._open_locked(tmp_path)  # Locked before the rename, so the name is never unlocked
+        tmp.truncate(0)
+        records = b"".join(encode(PUSH, seq, json.dumps([c, u], separators=(",", ":")).encode("utf-8"))
+                           for seq, c, u, _, _ in self._entries)
+        tmp.write(records)
+        tmp.flush()
+        os.fsync(tmp.fileno())
+        if os.name == "nt":
+            self._file.close()  # Windows cannot replace an open file
+        os.replace(tmp_path, self.path)
+        if os.name != "nt":
+            self._file.close()
+        self._file = tmp
+        self._log_bytes = len(records)
+
+    # List interface
+
+    def _commit(self, item: Tuple[str, object]):
+        command, undo_info = item
+        self._push(command, undo_info)
+        self._enforce_caps()
+
+    def _commit_many(self, items: List[Tuple[str, object]]):
+        if items:
+            self._write(b"".join([self._add(command, undo_info) for command, undo_info in items]))
+            self._enforce_caps()
+
+    def pop(self, index: int = -1) -> Tuple[str, object]:
+        if not self._entries:
+            raise IndexError("pop from empty undo journal")
+        return self._drop(index)
+
+    def pop_many(self, count: int) -> List[Tuple[str, object]]:
+        """Remove the newest `count` entries with a single sync; returns them newest first."""
+        popped, records = [], []
+        for _ in range(min(max(count, 0), len(self._entries))):
+            seq, command, undo_info, _, record_bytes = self._entries.pop()
+            self._live_bytes -= record_bytes
+            records.append(encode(POP, seq))
+            popped.append((command, undo_info))
+        if popped:
+            self._write(b"".join(records))
+            self._maybe_compact()
+        return popped
+
+    def clear(self):
+        while self._entries:
+            self._drop(-1)
+        self._maybe_compact()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __bool__(self) -> bool:
+        return bool(self._entries)
+
+    def __iter__(self):
+        return iter([entry[1:3] for entry in self._entries])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [entry[1:3] for entry in self._entries[index]]
+        return self._entries[index][1:3]
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def close(self):
+        """Sync and release the journal; the next shell adopts it."""
+        if self._file is not None and not self._file.closed:
+            self._sync(force=True)
+            self._file.close()
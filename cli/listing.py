@@ -0,0 +1,224 @@
+# listing.py
+"""
+The listing engine behind `ls` and `dir` (and their pipeline records).
+
+    -l  long format: mode, size, modification time, name
+    -a  include hidden entries (dot files; the hidden attribute on Windows)
+    -1  one name per line instead of columns
+    -N  sort by name, naturally: file2 before file10 (ls's default)
+    -S  sort by size, largest first
+    -t  sort by modification time, newest first
+    -r  reverse the order
+    -U  no sorting: entries as the file system returns them (dir's default)
+
+Entries come from os.scandir. A DirEntry knows whether it is a directory
+without a stat() on most platforms, and on Windows it carries the whole
+lstat() result, so a long listing costs nothing extra there. Elsewhere -l, -S
+and -t take one lstat() per entry, made once and kept with the entry.
+
+Unsorted listings are streamed: an entry is printed as soon as scandir
+returns it, and columns are laid out for COLUMN_BATCH names at a time, so a
+directory with a million entries starts printing at once and memory stays
+bounded. A sorted listing has to see every entry first; it keeps only the
+sort key and the row.
+"""
+
+import os
+import re
+import stat
+import sys
+import time
+from operator import itemgetter
+from typing import Iterator, List, NamedTuple, Optional
+
+COLUMN_BATCH = 1024  # Names laid out in columns together
+WRITE_SIZE = 64 * 1024  # Bytes of output gathered per write to a file or pipe
+TERMINAL_WRITE_SIZE = 4 * 1024  # Smaller on a terminal, so a long listing scrolls steadily
+COLUMN_GAP = 2
+NUMBER = re.compile(r"(\d+)")
+HIDDEN = getattr(stat, "FILE_ATTRIBUTE_HIDDEN", 2)
+
+BLUE, RESET = "\x1b[1;34m", "\x1b[0m"  # Directories, on a terminal
+
+
+class ListOptions(NamedTuple):
+    long: bool = False
+    all: bool = False
+    one_per_line: bool = False
+    sort: Optional[str] = "name"  # "name", "size", "time" or None (as scandir returns them)
+    reverse: bool = False
+
+
+LS_DEFAULTS = ListOptions()  # Names in columns, sorted naturally
+DIR_DEFAULTS = ListOptions(long=True, sort=None)  # Long rows, as the file system returns them, streamed
+
+
+def parse_args(argv: List[str], default: ListOptions) -> "tuple[ListOptions, Optional[str]]":
+    """(options, directory or None) from `ls`/`dir` arguments; combined flags such as -la work too."""
+    options, directory = default._asdict(), None
+    sorts = {"N": "name", "S": "size", "t": "time", "U": None}
+    for word in argv:
+        if len(word) < 2 or word[0] != "-":
+            directory = word
+            continue
+        for letter in word[1:]:
+            if letter == "l":
+                options["long"] = True
+            elif letter == "a":
+                options["all"] = True
+            elif letter == "1":
+                options["one_per_line"] = True
+            elif letter == "r":
+                options["reverse"] = True
+            elif letter in sorts:
+                options["sort"] = sorts[letter]
+            else:
+                raise ValueError(f"Unknown option -{letter}")
+    return ListOptions(**options), directory
+
+
+def _padded(match) -> str:
+    digits = match.group().lstrip("0") or "0"
+    return f"{len(digits):03d}{digits}"  # Longer numbers are larger: "0012" < "00210"
+
+
+def natural_key(name: str) -> str:
+    """Sort key ordering digit runs by value and the rest case-insensitively: file2 < File10.
+
+    A string, not a list of parts, so sorting a million names compares C strings.
+    """
+    return NUMBER.sub(_padded, name.casefold())
+
+
+def _hidden(entry: os.DirEntry) -> bool:
+    if entry.name.startswith("."):
+        return True
+    if os.name == "nt":
+        try:
+            return bool(entry.stat(follow_symlinks=False).st_file_attributes & HIDDEN)
+        except OSError:
+            return False
+    return False
+
+
+def _entries(directory: str, options: ListOptions) -> Iterator[os.DirEntry]:
+    with os.scandir(directory) as scan:
+        for entry in scan:
+            if options.all or not _hidden(entry):
+                yield entry
+
+
+def _is_dir(entry: os.DirEntry) -> bool:
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+
+def _long_row(entry: os.DirEntry, info: Optional[os.stat_result]) -> str:
+    name = entry.name + ("/" if _is_dir(entry) else "")
+    if info is None:
+        return f"{'?' * 10} {'?':>12} {'?':16} {name}"
+    if stat.S_ISLNK(info.st_mode):
+        try:
+            name += f" -> {os.readlink(entry.path)}"
+        except OSError:
+            pass
+    modified = time.strftime("%Y-%m-%d %H:%M", time.localtime(info.st_mtime))
+    return f"{stat.filemode(info.st_mode)} {info.st_size:>12} {modified} {name}"
+
+
+def _lstat(entry: os.DirEntry) -> Optional[os.stat_result]:
+    try:
+        return entry.stat(follow_symlinks=False)  # Cached in the entry; free on Windows
+    except OSError:
+        return None  # Removed since scandir listed it
+
+
+class Row(NamedTuple):
+    text: str  # Plain text: a name, or a long-format line
+    is_dir: bool
+
+
+def rows(directory: str, options: ListOptions) -> Iterator[Row]:
+    """The listing's rows, in the order asked for; streamed straight from scandir when unsorted."""
+    needs_stat = options.long or options.sort in ("size", "time")
+
+    def row(entry: os.DirEntry, info) -> Row:
+        return Row(_long_row(entry, info) if options.long else entry.name, _is_dir(entry))
+
+    if options.sort is None:
+        entries = (row(entry, _lstat(entry) if needs_stat else None) for entry in _entries(directory, options))
+        if not options.reverse:
+            return entries
+        return reversed(list(entries))
+
+    keyed = []
+    for entry in _entries(directory, options):
+        info = _lstat(entry) if needs_stat else None
+        if options.sort == "size":
+            key = (-(info.st_size if info else 0), natural_key(entry.name))
+        elif options.sort == "time":
+            key = (-(info.st_mtime if info else 0), natural_key(entry.name))
+        else:
+            key = natural_key(entry.name)
+        keyed.append((key, row(entry, info)))
+    keyed.sort(key=itemgetter(0), reverse=options.reverse)
+    return map(itemgetter(1), keyed)
+
+
+def _paint(row: Row, width: int, color: bool) -> str:
+    text = row.text.ljust(width) if width else row.text
+    if not color or not row.is_dir:
+        return text
+    return f"{BLUE}{text}{RESET}"
+
+
+def _columns(batch: List[Row], width: int, color: bool) -> List[str]:
+    """Lay names out down then across, as ls does, in as many columns as fit the width."""
+    widest = max(len(row.text) for row in batch) + COLUMN_GAP
+    count = max(1, width // widest)
+    height = -(-len(batch) // count)
+    lines = []
+    for line in range(height):
+        cells = [batch[index] for index in range(line, len(batch), height)]
+        lines.append("".join(_paint(cell, widest if index < len(cells) - 1 else 0, color) for index, cell in enumerate(cells)))
+    return lines
+
+
+def write(listing: Iterator[Row], options: ListOptions, out=None, width: Optional[int] = None) -> int:
+    """Print rows to `out` (sys.stdout), in columns on a terminal unless -l or -1; returns how many there were."""
+    out = out or sys.stdout
+    terminal = hasattr(out, "isatty") and out.isatty()
+    columns = terminal and not options.long and not options.one_per_line
+    if width is None:
+        width = os.get_terminal_size(out.fileno()).columns if terminal else 80
+    threshold = TERMINAL_WRITE_SIZE if terminal else WRITE_SIZE
+    count, pending, size, batch = 0, [], 0, []
+
+    def emit(lines: List[str], force: bool = False):
+        nonlocal pending, size
+        pending.extend(lines)
+        size += sum(len(line) + 1 for line in lines)
+        if pending and (force or size >= threshold):
+            out.write("\n".join(pending) + "\n")
+            if terminal:
+                out.flush()
+            pending, size = [], 0
+
+    for row in listing:
+        count += 1
+        if columns:
+            batch.append(row)
+            if len(batch) >= COLUMN_BATCH:
+                emit(_columns(batch, width, terminal), force=True)
+                batch = []
+            continue
+        line = _paint(row, 0, True) if terminal and row.is_dir else row.text
+        pending.append(line)
+        size += len(line) + 1
+        if size >= threshold or count == 1:  # The first row shows at once
+            emit([], force=True)
+    emit(_columns(batch, width, terminal) if batch else [], force=True)
+    out.flush()
+    return count
@@ -1,28 +1,47 @@
 import os
 import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# `mycli exec` is a thin client for the daemon: answer it before typer and rich are imported
+if __name__ == "__main__" and sys.argv[1:2] == ["exec"]:
+    from daemon import exec_main
+    sys.exit(exec_main(sys.argv[2:]))
+
+# The profiler has to be hooked in before the heavy imports below, i.e. before typer parses argv
+if "--startup-profile" in sys.argv:
+    import startup_profile
+    startup_profile.enable()
+else:
+    startup_profile = None
+
 import shlex
 import subprocess
-import re
-from typing import List
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import time
+from contextlib import contextmanager
+from functools import cached_property
+from typing import List, Optional
 
 import typer
 import cmd
-from prompt_toolkit import prompt
-import difflib
-import shutil 
 
-from rich import print as rprint
 from rich.console import Console
 from rich.style import Style
-from rich.prompt import Prompt, Confirm 
+from answers import Prompt, Confirm
+
+from registry import COMMANDS, SHELL_INTERNALS, compile_dispatch, lazy_commands, lazy_import
 
-from init import initialize_powershell
-from commands import (do_cd, do_ls, do_dir, do_tree, do_taskkill, do_tasklist, do_systeminfo, do_whoami, do_hostname, do_touch, do_mkdir, do_rmdir, do_rm, do_rename, do_copy, do_move, do_ping, do_nslookup, do_ipconfig, do_tracert, do_netstat, do_diskpart, do_chkdsk, do_wmic, do_append, do_exit, do_help,  do_ask) 
+# Builtins are imported from commands.py the first time each one runs
+(do_cd, do_z, do_history, do_last, do_parallel, do_jobs, do_fg, do_bg, do_kill, do_wait, do_time, do_profile, do_ls, do_dir, do_tree, do_taskkill, do_tasklist, do_systeminfo, do_whoami, do_hostname, do_touch, do_mkdir, do_rmdir, do_rm, do_rename, do_copy, do_move, do_ping, do_nslookup, do_ipconfig, do_tracert, do_netstat, do_diskpart, do_chkdsk, do_wmic, do_append, do_which, do_exit, do_help, do_ask) = lazy_import(
+    "commands",
+    "do_cd", "do_z", "do_history", "do_last", "do_parallel", "do_jobs", "do_fg", "do_bg", "do_kill", "do_wait", "do_time", "do_profile", "do_ls", "do_dir", "do_tree", "do_taskkill", "do_tasklist", "do_systeminfo", "do_whoami", "do_hostname", "do_touch", "do_mkdir", "do_rmdir", "do_rm", "do_rename", "do_copy", "do_move", "do_ping", "do_nslookup", "do_ipconfig", "do_tracert", "do_netstat", "do_diskpart", "do_chkdsk", "do_wmic", "do_append", "do_which", "do_exit", "do_help", "do_ask",
+)
 
 app = typer.Typer()
 console = Console()
 
+if startup_profile is not None:
+    startup_profile.mark("imports done")
+
 # Rich Configuration
 SUCCESS_STYLE = Style(color="green", bold=True)
 ERROR_STYLE = Style(color="red", bold=True)
@@ -37,63 +56,230 @@ class PowerShell(cmd.Cmd):
 
     def __init__(self):
         super().__init__()
-        init_data = initialize_powershell()
-        self.commands = init_data["commands"]
-        self.completer = init_data["completer"]
-        self.intro = init_data["intro"]
-        self.command_history = init_data["command_history"]
-        self.history = init_data["history"]
-        self.valid_flags = {
-            "taskkill": ["/PID", "/F", "/IM"],
-            "tasklist": ["/fi", "/v", "/svc", "/fo", "/nh"],
-            "ipconfig": ["/all", "/release", "/renew"],
-            "ping": ["-t", "-n", "-l", "-w", "-4", "-6"],
-            "netstat": ["-a", "-b", "-e", "-n", "-o", "-p", "-r", "-s"],
-            "nslookup": ["-querytype", "-timeout", "-debug", "-retry"],
-            "diskpart": ["/s"],
-            "chkdsk": ["/f", "/r", "/x"],
-            "wmic": ["/output"],
-        }
+        self.commands = dict(COMMANDS)
+        self.last_status = 0  # Exit status of the last line, like $? in a POSIX shell
+        self.redo_stack = []  # (command, redo record) pairs undone this session, the next redo last
+        self._open_groups = 0  # Nesting depth of undo_group()
+        self.keep_scrollback = True  # Off for daemon requests and background jobs, which nobody scrolls back through
+        self.time_commands = os.environ.get("MYCLI_TIME") == "1"  # `time -on`: report resources after every line
+        self.profile = None  # Execution profile of the line running, from `profile <name> <command ...>`
+
+    @cached_property
+    def command_history(self):
+        """Undo records, journaled to disk so they survive exit and crashes (kept in memory if no journal can be written)."""
+        from journal import UndoJournal, UndoList
+        try:
+            history = UndoJournal()
+        except OSError as e:
+            console.print(f"[bold yellow]⚠  Undo history will not be kept after exit: {e}[/]")
+            history = UndoList()
+        for _ in range(self._open_groups):
+            history.begin_group()  # Opened by the lines now running, before anything needed the history
+        return history
+
+    @cached_property
+    def _interactive(self):
+        """Completer, banner and line history; built when the first prompt is drawn."""
+        from init import initialize_powershell
+        from prompt_toolkit.history import ThreadedHistory
+        from historydb import PromptHistory
+        return initialize_powershell(self.commands, self.executables, self.frecency,
+                                     ThreadedHistory(PromptHistory(self.history_store)))
+
+    @property
+    def completer(self):
+        return self._interactive["completer"]
+
+    @property
+    def intro(self):
+        return self._interactive["intro"]
+
+    @property
+    def history(self):
+        return self._interactive["history"]
     
+    @cached_property
+    def executables(self):
+        """Index of the executables on PATH, loaded from disk on first use."""
+        from pathindex import ExecutableIndex
+        return ExecutableIndex()
+
+    @cached_property
+    def frecency(self):
+        """Visited directories ranked for z/jump and cd completion, loaded on first use."""
+        from frecency import FrecencyDB
+        return FrecencyDB()
+
+    @cached_property
+    def scrollback(self):
+        """Output of the last commands, for `last`."""
+        from scrollback import Scrollback
+        return Scrollback()
+
+    @cached_property
+    def job_table(self):
+        """Background jobs started with a trailing &."""
+        from jobs import JobTable
+        return JobTable()
+
+    def announce_jobs(self):
+        """Report background jobs that ended since the last prompt."""
+        if "job_table" not in self.__dict__:
+            return
+        for job in self.job_table.finished():
+            if self.job_table.jobs.get(job.number) is not job:
+                continue  # Already shown by fg
+            color = "green" if job.status == 0 else "red"
+            console.print(f"[bold {color}]\\[%{job.number}] {job.state}[/]  {job.command}  [dim](fg %{job.number} shows its output)[/]")
+
+    def adopt_job_undo(self):
+        """Take over the undo records of background builtins that have ended, so undo here reverts them."""
+        if "job_table" not in self.__dict__:
+            return
+        records = self.job_table.take_undo()
+        if records:
+            self.command_history.append_many(records)
+            self.clear_redo()  # Like any new command
+
+    @cached_property
+    def history_store(self):
+        """Command history shared by every session, with each line's cwd, status and duration."""
+        from historydb import HistoryDB
+        return HistoryDB()
+
+    @cached_property
+    def suggestions(self):
+        """Fuzzy index over builtins and PATH executables for 'Did you mean' prompts."""
+        from suggest import CommandSuggester
+        return CommandSuggester(self.commands, self.executables)
+
     def get_system_commands(self) -> List[str]:
-        """Get available system commands with caching"""
-        paths = os.getenv("PATH", "").split(os.pathsep)
-        commands = {"cls", "help", "exit", "cd", "dir", "copy", "del", "mkdir", "rmdir", "echo", "type"}
-        
-        for path in filter(os.path.isdir, paths):
-            try:
-                commands.update(
-                    f.split(".")[0] 
-                    for f in os.listdir(path) 
-                    if f.endswith((".exe", ".bat", ".cmd"))
-                )
-            except PermissionError:
-                continue
-                
+        """Get available system commands from the cached PATH index"""
+        commands = set(SHELL_INTERNALS) if os.name == "nt" else set()
+        commands.update(self.executables.names())
         return list(commands)
 
+    def warm_up(self):
+        """Import every builtin and load the PATH and suggestion indexes up front (used by daemon mode)."""
+        for command in lazy_commands():
+            command.load()
+        self.executables.refresh(force=True)
+        self.suggestions.programs.sync(self.executables.names())
+
+    def is_system_command(self, cmd: str) -> bool:
+        """True if `cmd` can be run by the system shell."""
+        if os.path.dirname(cmd):
+            from pathindex import is_executable_file
+            return is_executable_file(cmd)  # Given by path, e.g. ./build.sh
+        return (os.name == "nt" and cmd.lower() in SHELL_INTERNALS) or cmd in self.executables
+
     def cmdloop(self, intro=None):
+        from prompt_toolkit import prompt
+
         console.print(self.intro)
         while True:
             try:
+                self.announce_jobs()
                 user_input = prompt(
                     self.prompt,
                     completer=self.completer,
                     history=self.history,  # Add history here
                     complete_while_typing=True,
+                    complete_in_thread=True,  # Slow mounts must never block typing
                     mouse_support=True
                 )
-                self.onecmd(user_input)
+                self.run_and_record(user_input)
             except KeyboardInterrupt:
                 console.print("\n[bold yellow]⚠ Use 'exit' to quit[/]")
             except EOFError:
                 self.do_exit("")
 
+    def run_and_record(self, line: str) -> bool:
+        """Run a line typed at the prompt and append it to the persistent history."""
+        from historydb import record
+
+        cwd, started, clock = os.getcwd(), time.time(), time.monotonic()
+        try:
+            return self.onecmd(line)
+        finally:
+            record(self.history_store, line, cwd, self.last_status, time.monotonic() - clock, started)
+
     def onecmd(self, line: str) -> bool:
+        """Run one line, keeping what it prints in the scrollback for `last`.
+
+        The line's exit status is left in self.last_status.
+        """
+        self.adopt_job_undo()
+        words = line.split()
+        run = self.run_timed if words and (self.time_commands or words[0] == "time") else self.run_line
+        if not self.keep_scrollback or not words or words[0] == "last":
+            return run(line)
+        with self.scrollback.capture(line.strip()) as entry:
+            try:
+                return run(line)
+            finally:
+                entry.status = self.last_status
+
+    def run_timed(self, line: str) -> bool:
+        """Run a line, then report its wall time, CPU time, peak memory and I/O (`time <command>`, or `time -on`)."""
+        from accounting import ResourceMeter, describe, timed_command
+        command = timed_command(line)
+        if command is None:
+            return self.run_line(line)  # `time -on`, `time --help`: the builtin itself
+        meter = ResourceMeter()
+        try:
+            with meter:
+                return self.run_line(command)
+        finally:
+            console.print(describe(meter.usage))
+
+    def run_line(self, line: str) -> bool:
         """Process command input, handle typos, and correct minor syntax errors interactively."""
+        self.last_status = 0
         if not line.strip():
             return False
 
+        # ✅ Execution Profiles: `profile bulk chkdsk C:` runs the rest of the line at low priority
+        if line.split(maxsplit=1)[0] == "profile":
+            from profiles import ProfileError, run, split_line
+            try:
+                profile, command = split_line(line)
+            except ProfileError as e:
+                console.print(f"[bold red]❌ {e}[/]")
+                self.last_status = 2
+                return False
+            if profile is not None:
+                self.last_status = run(self, profile, command)
+                return False
+
+        # ✅ Background Jobs: `ping -t host &`
+        if line.rstrip().endswith("&"):
+            from jobs import JobError, background_line
+            command = background_line(line)
+            if command is not None:
+                try:
+                    job = self.job_table.start(self, command)
+                except JobError as e:
+                    console.print(f"[bold red]❌ {e}[/]")
+                    self.last_status = 1
+                    return False
+                console.print(f"[bold cyan]\\[%{job.number}] {job.pid}[/]  {command}")
+                return False
+
+        # ✅ Pipelines and Redirection: `ls | find .log`, `tasklist > procs.txt`
+        if "|" in line or ">" in line:
+            from pipeline import PipelineError, parse_pipeline
+            try:
+                pipeline = parse_pipeline(line)
+                if pipeline is not None:
+                    with self.undo_group(line):
+                        self.last_status = pipeline.run(self)
+                    return False
+            except PipelineError as e:
+                console.print(f"[bold red]❌ {e}[/]")
+                self.last_status = e.status
+                return False
+
         parts = shlex.split(line)
         if not parts:
             return False
@@ -102,8 +288,8 @@ class PowerShell(cmd.Cmd):
         original_cmd = cmd
 
         # ✅ Handle Unrecognized Commands with Suggestions
-        if cmd not in self.commands:
-            closest_matches = difflib.get_close_matches(cmd, self.commands, n=3, cutoff=0.6)
+        if cmd not in self.commands and not self.is_system_command(cmd):
+            closest_matches = self.suggestions.suggest(cmd, limit=3)
 
             if closest_matches:
                 confirm = Confirm.ask(f"[yellow]Did you mean '{closest_matches[0]}'?[/]", default=True)
@@ -111,81 +297,83 @@ class PowerShell(cmd.Cmd):
                     cmd = closest_matches[0]
                 else:
                     console.print(f"[red]Unknown command: '{cmd}'[/]")
+                    self.last_status = 127
                     return False
             else:
                 console.print(f"[red]Unknown command: '{cmd}'[/]")
+                self.last_status = 127
                 return False  
         
-        # ✅ Handle --help or -h Globally (if not already handled by the command method)
+        builtin = self.dispatch.get(cmd)
+        if builtin is None:
+            # ✅ Run System Command; its arguments are passed through untouched
+            msg = f"Executing command: {cmd}"
+            with self.undo_group(line):
+                undo_cmd = self.get_undo_command(cmd, args)
+                self.last_status = self.run_system_command(cmd, args, msg, undo_cmd, line if cmd == original_cmd else None)
+            return False
+
+        # ✅ Handle --help or -h Globally (every builtin prints its own usage)
         if "--help" in args or "-h" in args:
-            method_name = f"do_{cmd.replace('-', '_')}"
-            if hasattr(self, method_name):
-                # Let the command method handle --help or -h
-                return getattr(self, method_name)(" ".join(args))
-            else:
-                # Fallback to global help message
-                console.print(f"[green]Usage: {self.commands[cmd]}[/]")
-                return False  # Skip further processing
-        
-        # ✅ Handle Misplaced or Invalid Flags in a Single Loop
-        corrected_args = []
-        invalid_flags = []
-        
-        for arg in args:
-            if arg.startswith("/") or arg.startswith("-"):
-                if not re.match(r"^[-/][a-zA-Z0-9]+$", arg):  # Basic flag validation
-                    console.print(f"[red]Invalid flag format detected: '{arg}'[/] (Expected format: -option or /option)")
-                    return False  # Stop immediately on invalid format
+            return builtin.method(self, args)
 
-                if arg not in self.valid_flags.get(cmd, []):
-                    invalid_flags.append(arg)
-            corrected_args.append(arg)
+        # ✅ Check Flags Against the Command's Declared Schema
+        invalid_flags, malformed, _ = builtin.scan(args)
+        if malformed:
+            console.print(f"[red]Invalid flag format detected: '{malformed}'[/] (Expected format: -option or /option)")
+            self.last_status = 2
+            return False  # Stop immediately on invalid format
+
+        corrected_args = list(args)
 
         # ✅ Handle Invalid Flags with Auto-Suggestions
         if invalid_flags:
             console.print(f"[red]Invalid flags for '{cmd}': {', '.join(invalid_flags)}[/]")
 
-            if cmd in self.valid_flags and self.valid_flags[cmd]:
-                valid_flags = self.valid_flags[cmd]
-                console.print(f"[yellow]Valid flags for '{cmd}': {', '.join(valid_flags)}[/]")
-
-                for i, flag in enumerate(invalid_flags):
-                    closest_flag = difflib.get_close_matches(flag, valid_flags, n=1, cutoff=0.7)
-                    if closest_flag:
-                        auto_fix = Confirm.ask(f"[yellow]Did you mean '{closest_flag[0]}' instead of '{flag}'?[/]", default=True)
-                        if auto_fix:
-                            corrected_args = [closest_flag[0] if arg == flag else arg for arg in corrected_args]
-                            continue
-
-                    choice = Prompt.ask(
-                        f"Do you want to (1) replace '{flag}', (2) remove it, or (3) keep it?",
-                        choices=["1", "2", "3"],
-                        default="1"
+            valid_flags = sorted(builtin.flags)
+            console.print(f"[yellow]Valid flags for '{cmd}': {', '.join(valid_flags)}[/]")
+
+            for flag in invalid_flags:
+                closest_flag = builtin.suggest_flag(flag)
+                if closest_flag:
+                    auto_fix = Confirm.ask(f"[yellow]Did you mean '{closest_flag[0]}' instead of '{flag}'?[/]", default=True)
+                    if auto_fix:
+                        corrected_args = [closest_flag[0] if arg == flag else arg for arg in corrected_args]
+                        continue
+
+                choice = Prompt.ask(
+                    f"Do you want to (1) replace '{flag}', (2) remove it, or (3) keep it?",
+                    choices=["1", "2", "3"],
+                    default="1"
+                )
+                if choice == "1":
+                    new_flag = Prompt.ask(
+                        f"Enter a valid flag to replace '{flag}'",
+                        choices=valid_flags,
+                        default=valid_flags[0]
                     )
-                    if choice == "1":
-                        new_flag = Prompt.ask(
-                            f"Enter a valid flag to replace '{flag}'",
-                            choices=valid_flags,
-                            default=valid_flags[0]
-                        )
-                        corrected_args = [new_flag if arg == flag else arg for arg in corrected_args]
-                    elif choice == "2":
-                        corrected_args = [arg for arg in corrected_args if arg != flag]
+                    corrected_args = [new_flag if arg == flag else arg for arg in corrected_args]
+                elif choice == "2":
+                    corrected_args = [arg for arg in corrected_args if arg != flag]
+
+        # ✅ Check the Number of Positional Arguments
+        if not builtin.accepts(builtin.scan(corrected_args)[2]):
+            console.print(f"[red]Usage: {builtin.usage}[/] (quote arguments that contain spaces)")
+            self.last_status = 2
+            return False
 
         # ✅ Handle Built-in Commands
-        method_name = f"do_{cmd.replace('-', '_')}"
-        if hasattr(self, method_name):
-            return getattr(self, method_name)(shlex.join(corrected_args))
+        if cmd in ("undo", "redo"):
+            return builtin.method(self, corrected_args)
+        with self.undo_group(line):
+            return builtin.method(self, corrected_args)
 
-        # ✅ Run System Command
-        msg = f"Executing command: {cmd}"
-        undo_cmd = self.get_undo_command(cmd, corrected_args)
-        self.run_system_command(cmd, corrected_args, msg, undo_cmd)
+    def run_system_command(self, cmd: str, args: List[str], msg: str, undo_cmd, line: Optional[str] = None) -> int:
+        """Execute system command and save undo action; returns the command's exit code.
 
-        return False
-
-    def run_system_command(self, cmd: str, args: List[str], msg: str, undo_cmd: str):
-        """Execute system command and save undo action with confirmation prompts."""
+        `line` is the text cmd and args were split from; the command only goes
+        through the system shell if that text uses shell syntax.
+        """
         try:
             full_command = f"{cmd} {' '.join(args)}" if args else cmd
 
@@ -199,223 +387,436 @@ class PowerShell(cmd.Cmd):
             #         console.print("[bold yellow]🚫 Operation canceled.[/]")
             #         return
 
-            # Ensure Windows commands work properly
-            if os.name == "nt":
-                full_command = f"cmd.exe /c {full_command}"
-
-            process = subprocess.Popen(
-                full_command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                shell=True
-            )
-
-            with console.status(f"[bold cyan]Running {cmd}...[/]", spinner="dots2"):
-                for line in process.stdout:
-                    console.print(line.strip())
-                for err in process.stderr:
-                    console.print(f"[bold red]{err.strip()}[/]")
-
-            process.wait()
+            # ✅ Exec argv straight from the cached PATH lookup; a shell only for lines that use shell syntax
+            from spawn import spawn
+            limits = {}
+            if self.profile is not None:
+                from profiles import limit_options
+                limits = limit_options(self)  # Set by the child itself, before the program starts
+            process = spawn(self.executables, cmd, args, line, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **limits)
+            if self.profile is not None:
+                from profiles import adopt
+                adopt(self, process)
+
+            # ✅ Pump stdout and stderr together, written raw; a spinner only for a silent, slow start
+            from outputpump import OutputPump
+            from progress import Activity
+            sys.stdout.flush()
+            with Activity(console, f"Running {cmd}") as activity:
+                OutputPump().run(process, on_output=activity.release)
 
             if process.returncode == 0:
                 if undo_cmd:
-                    # Handle both string and dictionary format for undo commands
-                    if isinstance(undo_cmd, dict):
-                        self.command_history.append((full_command, undo_cmd))
-                    else:
-                        self.command_history.append((
-                            full_command,
-                            {
-                                "command": undo_cmd,
-                                "message": f"Undo: {full_command}"
-                            }
-                        ))
+                    self.command_history.append((full_command, undo_cmd))
                 console.print(f"[bold green]✅ {msg}[/]")
             else:
                 console.print(f"[bold red]❌ Command failed (code {process.returncode})[/]")
+            return process.returncode
 
         except FileNotFoundError:
             console.print(f"[bold red]❌ Command not found: {cmd}[/]")
+            return 127
         except Exception as e:
             console.print(f"[bold red]❌ Unexpected error: {str(e)}[/]")
+            return 1
+
+    def get_undo_command(self, cmd: str, args: List[str]):
+        """Undo record for supported system commands (a dict of undoops operations), or "" if there is none."""
+        from undoops import undo_record
+        full_command = " ".join([cmd] + args)
 
-    def get_undo_command(self, cmd: str, args: List[str]) -> str:
-        """Generate undo commands for supported operations"""
-        if cmd == "mkdir" and args:
-            dir_path = os.path.abspath(args[0])  # Ensure full path
-            return f'rmdir /s /q "{dir_path}"'  # Windows needs /s /q
+        if cmd == "mkdir" and args and not os.path.exists(args[0]):
+            return undo_record(f"Undo: {full_command}", {"op": "remove", "path": os.path.abspath(args[0])})
 
-        if cmd == "rmdir" and args:
-            dir_path = os.path.abspath(args[0])
-            return f'mkdir "{dir_path}"'  # Recreate the deleted directory
+        if cmd == "rmdir" and args and os.path.isdir(args[0]):
+            return undo_record(f"Undo: {full_command}", {"op": "mkdir", "path": os.path.abspath(args[0])})
 
         if cmd == "del" and args:
-            # Only create a backup if the file exists
-            if os.path.exists(args[0]):
-                backup_path = f"backup_{args[0]}"
-                shutil.copy(args[0], backup_path)  # Backup before deleting
-                return f'copy "{backup_path}" "{args[0]}"'
+            # Only save the file if it exists
+            if os.path.isfile(args[0]):
+                return self.save_for_undo(args[0], f"Undo: del {args[0]}", deleting=True)
             return ""
 
-        if cmd == "copy" and len(args) == 2:
-            return f'del "{args[1]}"'
+        if cmd == "copy" and len(args) == 2 and not os.path.exists(args[1]):
+            return undo_record(f"Undo: {full_command}", {"op": "remove", "path": os.path.abspath(args[1])})
 
         if cmd == "move" and len(args) == 2:
-            return f'move "{args[1]}" "{args[0]}"'
+            destination = os.path.join(args[1], os.path.basename(args[0])) if os.path.isdir(args[1]) else args[1]
+            return undo_record(f"Undo: {full_command}",
+                               {"op": "rename", "src": os.path.abspath(destination), "dst": os.path.abspath(args[0])})
 
-        if cmd == "cd":
-            # Store the current directory before changing it
-            current_dir = os.getcwd()
-            return f'cd "{current_dir}"'  # Return to the previous working directory
-
-        if cmd == "touch" and args:
-            return f'del "{args[0]}"'
+        if cmd == "touch" and args and not os.path.exists(args[0]):
+            return undo_record(f"Undo: {full_command}", {"op": "remove", "path": os.path.abspath(args[0])})
 
         if cmd == "rename" and len(args) == 2:
-            return f'rename "{args[1]}" "{args[0]}"'
+            renamed = os.path.join(os.path.dirname(args[0]), args[1])  # cmd.exe's rename takes a bare new name
+            return undo_record(f"Undo: {full_command}",
+                               {"op": "rename", "src": os.path.abspath(renamed), "dst": os.path.abspath(args[0])})
 
         if cmd == "append" and len(args) == 2:
-            backup_path = f"backup_{args[0]}"
-            if os.path.exists(args[0]):
-                shutil.copy(args[0], backup_path)  # Backup before appending
-            return f'copy "{backup_path}" "{args[0]}"' if os.path.exists(backup_path) else ""
+            if os.path.isfile(args[0]):
+                return undo_record(f"Undo: append {args[0]}",
+                                   {"op": "truncate", "path": os.path.abspath(args[0]), "length": os.path.getsize(args[0])})
+            return ""
             
         return ""
+
+    def save_for_undo(self, path: str, message: str, deleting: bool = False) -> dict:
+        """Undo record restoring `path` from the backup store as it is now."""
+        from backupstore import BackupStore
+        from undoops import undo_record
+        size = os.path.getsize(path)
+        object_id = BackupStore().save(path, deleting=deleting)
+        return undo_record(message, {"op": "restore", "object": object_id, "path": os.path.abspath(path), "bytes": size})
       
-    def do_undo(self, arg: str):
-        """Undo the last executed command"""
-        if not self.command_history:
-            console.print("[bold yellow]⚠  Nothing to undo[/]")
+    def undo_count(self, argv: List[str], name: str):
+        """The count given to undo/redo (1 by default), or None after reporting a bad one."""
+        if not argv:
+            return 1
+        if argv[0].isdigit() and int(argv[0]) > 0:
+            return int(argv[0])
+        console.print(f"[red]Usage: {name} [count][/] (count is a positive number)")
+        self.last_status = 2
+        return None
+
+    def do_undo(self, argv: List[str]):
+        """Undo the last command, or the last N: undo [count]"""
+        count = self.undo_count(argv, "undo")
+        if count is None:
             return
-        
-        # Get last command and its undo info
-        last_command, undo_info = self.command_history.pop()
-        
-        if not undo_info or not isinstance(undo_info, dict):
-            console.print("[bold yellow]⚠  No undo action available for this command[/]")
+        history = self.command_history
+        if not history:
+            console.print("[bold yellow]⚠  Nothing to undo[/]")
             return
-        
-        undo_command = undo_info.get("command", "")
-        undo_message = undo_info.get("message", f"Undoing: {last_command}")
-        
-        if not undo_command:
-            console.print("[bold yellow]⚠  No undo command available[/]")
+
+        # ✅ Apply the inverse operations in process, newest record first; each record is all or nothing
+        from journal import release_all
+        from undoops import OpContext, UndoError, apply_record, ops_of
+        records = history[-count:][::-1]
+        verbose = len(records) <= 10
+        if not verbose:
+            console.print(f"[bold cyan]🔄 Undoing the last {len(records)} commands[/]")
+        undone, redo = [], []
+        context = OpContext()
+        try:
+            for last_command, undo_info in records:
+                if not ops_of(undo_info):
+                    console.print(f"[bold yellow]⚠  No undo action available for: {last_command}[/]")
+                    undone.append(undo_info)
+                    redo.append((last_command, None))
+                    continue
+                if verbose:
+                    console.print(f"[bold cyan]🔄 {undo_info.get('message') or f'Undoing: {last_command}'}[/]")
+                try:
+                    redo.append((last_command, apply_record(undo_info, context)))
+                except UndoError as e:
+                    console.print(f"[bold red]❌ Failed to undo '{last_command}': {str(e)}[/]")
+                    self.last_status = 1
+                    break
+                undone.append(undo_info)
+        finally:
+            context.finish()
+
+        history.pop_many(len(undone))
+        for last_command, redo_info in redo:
+            if redo_info is None:
+                self.clear_redo()  # Redoing newer commands over one that cannot be redone would mix states
+            else:
+                self.redo_stack.append((last_command, redo_info))
+        history.keep_redo(self.redo_stack)  # Before collecting, so the store keeps what redo restores from
+        release_all(undone)  # Restored backups and trashed items are no longer needed
+        if not verbose:
+            console.print(f"[bold green]✅ Undid {len(undone)} commands[/]")
+
+    def do_redo(self, argv: List[str]):
+        """Redo what undo reverted, or the last N undos: redo [count]"""
+        count = self.undo_count(argv, "redo")
+        if count is None:
             return
-        
-        console.print(f"[bold cyan]🔄 {undo_message}[/]")
-        
-        # Split the undo command into parts
-        parts = shlex.split(undo_command)
-        if not parts:
-            console.print("[bold red]❌ Invalid undo command[/]")
+        if not self.redo_stack:
+            console.print("[bold yellow]⚠  Nothing to redo[/]")
             return
-        
-        cmd, args = parts[0], parts[1:]
-        
-        # Execute the undo command without storing it in history
+
+        from undoops import OpContext, UndoError, apply_record
+        count = min(count, len(self.redo_stack))
+        verbose = count <= 10
+        if not verbose:
+            console.print(f"[bold cyan]🔁 Redoing {count} commands[/]")
+        redone = []
+        context = OpContext()
         try:
-            method_name = f"do_{cmd.replace('-', '_')}"
-            if hasattr(self, method_name):
-                # Use the command method directly if it exists
-                getattr(self, method_name)(" ".join(args))
-            else:
-                # Fall back to system command
-                self.run_system_command(cmd, args, undo_message, undo_cmd="")
-        except Exception as e:
-            console.print(f"[bold red]❌ Failed to undo: {str(e)}[/]")
-            
-    def do_cd(self, arg):
-        do_cd(self, arg, self.command_history)  
+            for _ in range(count):
+                last_command, redo_info = self.redo_stack[-1]
+                if verbose:
+                    console.print(f"[bold cyan]🔁 Redo: {last_command}[/]")
+                try:
+                    undo_info = apply_record(redo_info, context)
+                except UndoError as e:
+                    console.print(f"[bold red]❌ Failed to redo '{last_command}': {str(e)}[/]")
+                    self.last_status = 1
+                    return
+                self.redo_stack.pop()
+                if undo_info is not None:
+                    redone.append((last_command, undo_info))
+        finally:
+            self.command_history.append_many(redone)  # What was redone can be undone again
+            self.command_history.keep_redo(self.redo_stack)
+            context.finish()
+        if not verbose:
+            console.print(f"[bold green]✅ Redid {len(redone)} commands[/]")
+
+    def clear_redo(self):
+        """Forget what could be redone, deleting what it kept in the trash."""
+        if self.redo_stack:
+            from journal import release_all
+            released = list(self.redo_stack)
+            self.redo_stack.clear()
+            if "command_history" in self.__dict__:
+                self.command_history.keep_redo(self.redo_stack)
+            release_all([redo_info for _, redo_info in released])
+
+    @contextmanager
+    def undo_group(self, line: str):
+        """Record everything `line` does as one undo entry; a new entry ends what redo can bring back."""
+        self._open_groups += 1
+        if "command_history" in self.__dict__:
+            self.command_history.begin_group()
+        try:
+            yield
+        finally:
+            self._open_groups -= 1
+            if "command_history" in self.__dict__ and self.command_history.end_group(line):
+                self.clear_redo()
+
+    def do_cd(self, argv):
+        do_cd(self, argv, self.command_history)  
+
+    def do_z(self, argv):
+        do_z(self, argv, self.command_history)
+
+    def do_jump(self, argv):
+        do_z(self, argv, self.command_history)
+
+    def do_ls(self, argv):
+        do_ls(self, argv)
+
+    def do_dir(self, argv):
+        do_dir(self, argv)
+
+    def do_tree(self, argv):
+        do_tree(self, argv)
+
+    def do_taskkill(self, argv):
+        do_taskkill(self, argv)
+
+    def do_tasklist(self, argv):
+        do_tasklist(self, argv)
 
-    def do_ls(self, arg):
-        do_ls(self, arg)
+    def do_systeminfo(self, argv):
+        do_systeminfo(self, argv)
 
-    def do_dir(self, arg):
-        do_dir(self, arg)
+    def do_whoami(self, argv):
+        do_whoami(self, argv)
 
-    def do_tree(self, arg):
-        do_tree(self, arg)
+    def do_hostname(self, argv):
+        do_hostname(self, argv)
 
-    def do_taskkill(self, arg):
-        do_taskkill(self, arg)
+    def do_touch(self, argv):
+        do_touch(self, argv, self.command_history)
 
-    def do_tasklist(self, arg):
-        do_tasklist(self, arg)
+    def do_mkdir(self, argv):
+        do_mkdir(self, argv, self.command_history)
 
-    def do_systeminfo(self, arg):
-        do_systeminfo(self, arg)
+    def do_rmdir(self, argv):
+        do_rmdir(self, argv, self.command_history)
 
-    def do_whoami(self, arg):
-        do_whoami(self, arg)
+    def do_rm(self, argv):
+        do_rm(self, argv, self.command_history)
 
-    def do_hostname(self, arg):
-        do_hostname(self, arg)
+    def do_rename(self, argv):
+        do_rename(self, argv, self.command_history)
 
-    def do_touch(self, arg):
-        do_touch(self, arg, self.command_history)
+    def do_copy(self, argv):
+        do_copy(self, argv, self.command_history)
 
-    def do_mkdir(self, arg):
-        do_mkdir(self, arg, self.command_history)
+    def do_move(self, argv):
+        do_move(self, argv, self.command_history)
 
-    def do_rmdir(self, arg):
-        do_rmdir(self, arg, self.command_history)
+    def do_ping(self, argv):
+        do_ping(self, argv)
 
-    def do_rm(self, arg):
-        do_rm(self, arg, self.command_history)
+    def do_nslookup(self, argv):
+        do_nslookup(self, argv)
 
-    def do_rename(self, arg):
-        do_rename(self, arg, self.command_history)
+    def do_ipconfig(self, argv):
+        do_ipconfig(self, argv)
 
-    def do_copy(self, arg):
-        do_copy(self, arg, self.command_history)
+    def do_tracert(self, argv):
+        do_tracert(self, argv)
 
-    def do_move(self, arg):
-        do_move(self, arg, self.command_history)
+    def do_netstat(self, argv):
+        do_netstat(self, argv)
 
-    def do_ping(self, arg):
-        do_ping(self, arg)
+    def do_diskpart(self, argv):
+        do_diskpart(self, argv)
 
-    def do_nslookup(self, arg):
-        do_nslookup(self, arg)
+    def do_chkdsk(self, argv):
+        do_chkdsk(self, argv)
 
-    def do_ipconfig(self, arg):
-        do_ipconfig(self, arg)
+    def do_wmic(self, argv):
+        do_wmic(self, argv)
 
-    def do_tracert(self, arg):
-        do_tracert(self, arg)
+    def do_append(self, argv):
+        do_append(self, argv, self.command_history)
 
-    def do_netstat(self, arg):
-        do_netstat(self, arg)
+    def do_which(self, argv):
+        do_which(self, argv)
 
-    def do_diskpart(self, arg):
-        do_diskpart(self, arg)
+    def do_history(self, argv):
+        do_history(self, argv)
 
-    def do_chkdsk(self, arg):
-        do_chkdsk(self, arg)
+    def do_last(self, argv):
+        do_last(self, argv)
 
-    def do_wmic(self, arg):
-        do_wmic(self, arg)
+    def do_parallel(self, argv):
+        do_parallel(self, argv)
 
-    def do_append(self, arg):
-        do_append(self, arg, self.command_history)
+    def do_jobs(self, argv):
+        do_jobs(self, argv)
 
-    def do_exit(self, arg):
-        do_exit(self, arg)
+    def do_fg(self, argv):
+        do_fg(self, argv)
 
-    def do_help(self, arg):
-        do_help(self, arg)
+    def do_bg(self, argv):
+        do_bg(self, argv)
+
+    def do_kill(self, argv):
+        do_kill(self, argv)
+
+    def do_wait(self, argv):
+        do_wait(self, argv)
+
+    def do_time(self, argv):
+        do_time(self, argv)
+
+    def do_profile(self, argv):
+        do_profile(self, argv)
+
+    def do_exit(self, argv):
+        do_exit(self, argv)
+
+    def do_help(self, argv):
+        do_help(self, argv)
         
-    def do_ask(self, arg):
+    def do_ask(self, argv):
         """Ask the GPT assistant about a CLI command"""
-        do_ask(self, arg)
-        
+        do_ask(self, argv)
+
+
+# Built once: `onecmd` looks commands up here instead of building do_<name> strings per line
+PowerShell.dispatch = compile_dispatch(PowerShell)
+
+@app.callback(invoke_without_command=True)
+def main(
+    ctx: typer.Context,
+    startup_profile_flag: bool = typer.Option(
+        False, "--startup-profile", help="Print an import-time breakdown before the first prompt"
+    ),
+):
+    """Windows Enhanced Shell; starts the interactive shell when no command is given"""
+    if ctx.invoked_subcommand is None:
+        start_shell(startup_profile_flag)
+
 @app.command("shell")
-def start_shell():
+def start_shell(
+    startup_profile_flag: bool = typer.Option(
+        False, "--startup-profile", help="Print an import-time breakdown before the first prompt"
+    ),
+):
     """Launch interactive shell"""
     print("Starting shell...")  # Debugging statement
-    PowerShell().cmdloop()
+    shell = PowerShell()
+    if startup_profile is not None:
+        startup_profile.mark("shell constructed")
+        shell._interactive  # Include prompt setup in the profile
+        startup_profile.mark("prompt ready")
+        startup_profile.report(console)
+    shell.cmdloop()
+
+@app.command("serve")
+def serve(
+    socket_path: str = typer.Option(None, "--socket", help="Socket path (default: $MYCLI_SOCKET or ~/.mycli/mycli.sock)"),
+    max_clients: int = typer.Option(64, "--max-clients", help="Maximum number of connections handled at once"),
+):
+    """Keep a warm shell resident and run lines sent by 'mycli exec'"""
+    from daemon import default_socket_path, serve as serve_daemon
+
+    path = socket_path or default_socket_path()
+    console.print(f"[bold cyan]🚀 mycli daemon listening on [underline]{path}[/][/]")
+    try:
+        serve_daemon(PowerShell, path, max_clients=max_clients)
+    except KeyboardInterrupt:
+        console.print("\n[bold yellow]⚠ Daemon stopped[/]")
+    except OSError as e:
+        console.print(f"[bold red]❌ Cannot start daemon: {e}[/]")
+        raise typer.Exit(1)
+
+@app.command("run")
+def run_script(
+    script: str = typer.Argument(..., help="Script file with one command per line, or '-' for stdin"),
+    yes: bool = typer.Option(False, "--yes", "-y", help="Answer yes to every confirmation"),
+    no: bool = typer.Option(False, "--no", "-n", help="Answer no to every confirmation"),
+    answers_file: str = typer.Option(None, "--answers", help="File with one scripted answer per line, used in order"),
+    stop_on_error: bool = typer.Option(False, "--stop-on-error", "-e", help="Stop at the first line that fails"),
+    report: str = typer.Option(None, "--report", help="Write a JSON line per command (status, seconds) to this file, or '-'"),
+):
+    """Run commands from a script or stdin without an interactive prompt"""
+    from answers import AnswerPolicy
+    from batch import exit_status, run_lines, script_lines, write_report
+    from rich.table import Table
+
+    if yes and no:
+        console.print("[bold red]❌ --yes and --no cannot be combined[/]")
+        raise typer.Exit(2)
+    assume = True if yes else False if no else None
+    try:
+        policy = AnswerPolicy.from_file(answers_file, assume) if answers_file else AnswerPolicy(assume)
+        stream = sys.stdin if script == "-" else open(script, "r", encoding="utf-8")
+    except OSError as e:
+        console.print(f"[bold red]❌ {e}[/]")
+        raise typer.Exit(2)
+
+    with stream:
+        results = run_lines(PowerShell(), script_lines(stream), policy, stop_on_error)
+
+    if report:
+        if report == "-":
+            write_report(results, sys.stdout)
+        else:
+            with open(report, "w", encoding="utf-8") as f:
+                write_report(results, f)
+
+    failed = [result for result in results if result.status != 0]
+    if failed:
+        table = Table(title="❌ Failed Lines", header_style="bold cyan")
+        table.add_column("Line", justify="right", style="bold yellow")
+        table.add_column("Status", justify="right", style="bold red")
+        table.add_column("Command", style="bold magenta")
+        for result in failed:
+            table.add_row(str(result.lineno), str(result.status), result.line)
+        console.print(table)
+    elapsed = sum(result.seconds for result in results)
+    console.print(
+        f"[bold {'red' if failed else 'green'}]{'❌' if failed else '✅'} "
+        f"{len(results) - len(failed)}/{len(results)} lines succeeded in {elapsed:.2f}s[/]"
+    )
+    raise typer.Exit(exit_status(results))
+
+@app.command("exec", context_settings={"allow_extra_args": True, "ignore_unknown_options": True})
+def exec_command(ctx: typer.Context):
+    """Run a line in the running daemon and stream its output"""
+    from daemon import exec_main
+    raise typer.Exit(exec_main(ctx.args))
 
 if __name__ == "__main__":
     app()
\ No newline at end of file
@@ -0,0 +1,151 @@
+# outputpump.py
+"""
+Streams a child process's stdout and stderr to the terminal.
+
+One reader thread per pipe moves chunks of up to READ_SIZE bytes into a
+single bounded queue, so a child writing to both pipes never blocks on the one
+nobody reads. When the child produces output faster than the terminal takes
+it, the full queue blocks the readers, which slows the child down instead of
+growing memory.
+
+The calling thread writes the chunks, in the order they arrived, straight to
+the binary buffers of the standard streams. Rich markup is never parsed, so
+"[...]" in a program's output is shown as it is. Writes are coalesced: queued chunks are
+gathered until FLUSH_BYTES are pending or the flush interval has passed. The
+interval adapts to the terminal. It doubles (up to MAX_INTERVAL) when a write
+takes more than half of it, so a slow terminal gets fewer, larger writes. It
+shrinks back toward MIN_INTERVAL while writes are fast, so interactive output
+shows up promptly.
+"""
+
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+READ_SIZE = 64 * 1024
+QUEUE_CHUNKS = 64  # At most QUEUE_CHUNKS * READ_SIZE bytes wait for the terminal
+FLUSH_BYTES = 256 * 1024
+MIN_INTERVAL = 0.01
+MAX_INTERVAL = 0.25
+
+STDOUT, STDERR = 1, 2
+ERROR_START, ERROR_END = b"\x1b[1;31m", b"\x1b[0m"  # Bold red, like the shell's own errors
+
+
+class _TextWriter:
+    """Binary-stream face for a text-only stream (e.g. one replaced by a test)."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, data: bytes):
+        self.stream.write(data.decode("utf-8", "replace"))
+
+    def flush(self):
+        self.stream.flush()
+
+    def isatty(self) -> bool:
+        return getattr(self.stream, "isatty", lambda: False)()
+
+
+def binary_stream(stream):
+    return getattr(stream, "buffer", None) or _TextWriter(stream)
+
+
+def _read(pipe, stream: int, chunks: queue.Queue):
+    try:
+        fd = pipe.fileno()
+        while True:
+            data = os.read(fd, READ_SIZE)
+            if not data:
+                break
+            chunks.put((stream, data))
+    except (OSError, ValueError):
+        pass  # Pipe closed under us: nothing more to read
+    finally:
+        chunks.put((stream, None))
+
+
+class OutputPump:
+    """Copies a process's stdout and stderr to two binary streams concurrently, in arrival order."""
+
+    def __init__(self, out=None, err=None, color_errors: Optional[bool] = None):
+        self.out = out if out is not None else binary_stream(sys.stdout)
+        self.err = err if err is not None else binary_stream(sys.stderr)
+        if color_errors is None:
+            color_errors = getattr(self.err, "isatty", lambda: False)()
+        self.color_errors = color_errors
+        self.interval = MIN_INTERVAL
+        self.bytes_written = 0
+        self.writes = 0
+
+    def run(self, process, on_output: Optional[Callable[[], None]] = None) -> int:
+        """Pump until both pipes close, then wait for the process; returns its exit code.
+
+        `on_output` is called once, just before the first bytes are written
+        (to take down a spinner, for instance).
+        """
+        chunks: queue.Queue = queue.Queue(maxsize=QUEUE_CHUNKS)
+        readers = [threading.Thread(target=_read, args=(pipe, stream, chunks), name="output pump", daemon=True)
+                   for pipe, stream in ((process.stdout, STDOUT), (process.stderr, STDERR)) if pipe is not None]
+        for reader in readers:
+            reader.start()
+
+        open_pipes = len(readers)
+        runs: List[Tuple[int, List[bytes]]] = []  # Consecutive chunks of one stream, oldest first
+        pending, deadline = 0, 0.0
+        while open_pipes:
+            try:
+                timeout = max(0.0, deadline - time.monotonic()) if runs else None
+                stream, data = chunks.get(timeout=timeout)
+            except queue.Empty:
+                self._flush(runs)
+                runs, pending = [], 0
+                continue
+            if data is None:
+                open_pipes -= 1
+                continue
+            if on_output is not None:
+                on_output()
+                on_output = None
+            if not runs:
+                deadline = time.monotonic() + self.interval
+            if runs and runs[-1][0] == stream:
+                runs[-1][1].append(data)
+            else:
+                runs.append((stream, [data]))
+            pending += len(data)
+            if pending >= FLUSH_BYTES:
+                self._flush(runs)
+                runs, pending = [], 0
+        self._flush(runs)
+
+        for reader in readers:
+            reader.join()
+        for pipe in (process.stdout, process.stderr):
+            if pipe is not None:
+                pipe.close()
+        return process.wait()
+
+    def _flush(self, runs):
+        if not runs:
+            return
+        started = time.monotonic()
+        for stream, data in runs:
+            data = b"".join(data)
+            if stream == STDERR and self.color_errors:
+                data = ERROR_START + data + ERROR_END
+            (self.err if stream == STDERR else self.out).write(data)
+            self.bytes_written += len(data)
+        self.out.flush()
+        if self.err is not self.out:
+            self.err.flush()
+        self.writes += 1
+        elapsed = time.monotonic() - started
+        if elapsed > self.interval / 2:
+            self.interval = min(MAX_INTERVAL, self.interval * 2)  # The terminal is slow: write less often
+        else:
+            self.interval = max(MIN_INTERVAL, self.interval * 0.75)
@@ -0,0 +1,249 @@
+# parallel.py
+"""
+Fan-out: `parallel [-j n] [-r retries] [-f file | -g glob] <command ...>` runs
+one command template once per input item, several items at a time.
+
+In the template, `{}` is replaced by the item, even inside a word as in
+`{}.bak`. A template without `{}` gets the item as its last argument. Items
+come from a file (one per line, `-f -` for stdin), from a glob, or from the
+records piped into `parallel`.
+
+External commands run as child processes, without a shell. Builtins run on
+the worker threads. Each call gets a shallow copy of the shell, so it has its
+own exit status, and what it prints goes to that worker's buffer. Questions
+are answered "no" unless a policy is already installed.
+
+Each item's output is kept apart and shown whole, in input order, once that
+item and every item before it are done. At most WINDOW_PER_WORKER items per
+worker are in flight, so output never piles up behind a slow item. A failing
+item is retried up to `-r` more times.
+"""
+
+import copy
+import glob
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from registry import SHELL_INTERNALS
+
+DEFAULT_JOBS = min(16, (os.cpu_count() or 2) * 2)  # Override with -j or MYCLI_PARALLEL_JOBS
+DEFAULT_RETRIES = 1
+WINDOW_PER_WORKER = 4
+SUMMARY_ROWS = 50  # Longer runs list only the failed items
+
+
+class ParallelError(Exception):
+    """The parallel command line is unusable."""
+
+
+class ItemResult(NamedTuple):
+    index: int
+    item: str
+    status: int
+    attempts: int
+    seconds: float
+    output: bytes
+
+
+def parse_args(argv: List[str]) -> Tuple[int, int, Optional[Tuple[str, str]], List[str]]:
+    """(workers, retries, item source as (flag, value) or None, command template) from the options before the command."""
+    jobs = int(os.environ.get("MYCLI_PARALLEL_JOBS", DEFAULT_JOBS))
+    retries, source = DEFAULT_RETRIES, None
+    index = 0
+    while index < len(argv) and argv[index] in ("-j", "-r", "-f", "-g"):
+        flag = argv[index]
+        if index + 1 >= len(argv):
+            raise ParallelError(f"{flag} needs a value")
+        value = argv[index + 1]
+        if flag in ("-j", "-r"):
+            if not value.isdigit() or (flag == "-j" and int(value) < 1):
+                raise ParallelError(f"{flag} takes a number{' of at least 1' if flag == '-j' else ''}, not '{value}'")
+            if flag == "-j":
+                jobs = int(value)
+            else:
+                retries = int(value)
+        else:
+            source = (flag, value)
+        index += 2
+    template = argv[index:]
+    if not template:
+        raise ParallelError("No command to run")
+    return jobs, retries, source, template
+
+
+def read_items(source: Tuple[str, str]) -> Iterator[str]:
+    """Items from a glob (sorted) or a file with one per line; blank lines and '#' comments are skipped."""
+    flag, value = source
+    if flag == "-g":
+        return iter(sorted(glob.glob(value, recursive=True)))
+    try:
+        stream = sys.stdin if value == "-" else open(value, "r", encoding="utf-8")
+    except OSError as e:
+        raise ParallelError(f"Cannot read '{value}': {e.strerror or e}")
+
+    def lines():
+        try:
+            for line in stream:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    yield line
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+    return lines()
+
+
+def expand(template: List[str], item: str) -> List[str]:
+    if any("{}" in word for word in template):
+        return [word.replace("{}", item) for word in template]
+    return template + [item]
+
+
+class _Router:
+    """sys.stdout stand-in that sends a worker thread's writes to that worker's buffer."""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.local = threading.local()
+
+    def write(self, text: str) -> int:
+        buffer = getattr(self.local, "buffer", None)
+        return (buffer if buffer is not None else self._stream).write(text)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class Runner:
+    """Runs a command template over items on a pool of worker threads."""
+
+    def __init__(self, shell, template: List[str], jobs: int = DEFAULT_JOBS, retries: int = DEFAULT_RETRIES):
+        name = template[0]
+        if name not in shell.dispatch and not shell.is_system_command(name):
+            raise ParallelError(f"Unknown command: '{name}'")
+        if name in ("parallel", "undo", "redo", "cd", "z", "jump", "exit"):
+            raise ParallelError(f"'{name}' cannot run in parallel")
+        self.shell = shell
+        self.template = template
+        self.jobs = jobs
+        self.retries = retries
+        self._router: Optional[_Router] = None
+        if name in shell.dispatch:
+            shell.command_history  # Created once here, not once per shell copy
+        self._direct = {}  # The program's resolved path, looked up once for every item
+        if name not in shell.dispatch and "{}" not in name and not (os.name == "nt" and name.lower() in SHELL_INTERNALS):
+            from spawn import direct_options
+            try:
+                self._direct = direct_options(shell.executables, template)
+            except FileNotFoundError:
+                raise ParallelError(f"Unknown command: '{name}'")
+
+    def run(self, items: Iterable[str]) -> Iterator[ItemResult]:
+        """Results in input order, each as soon as it and those before it are done."""
+        from answers import AnswerPolicy, answering, get_policy
+        stdout = sys.stdout
+        self._router = sys.stdout = _Router(stdout)
+        pool = ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="parallel")
+        pending: deque = deque()
+        try:
+            with answering(get_policy() or AnswerPolicy(False)):
+                for index, item in enumerate(items, start=1):
+                    pending.append(pool.submit(self._item, index, item))
+                    while pending and (len(pending) >= self.jobs * WINDOW_PER_WORKER or pending[0].done()):
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)  # Items not started yet are dropped
+            sys.stdout = stdout
+
+    def _item(self, index: int, item: str) -> ItemResult:
+        argv = expand(self.template, item)
+        started = time.perf_counter()
+        for attempt in range(1, self.retries + 2):
+            status, output = self._run(argv)
+            if status == 0:
+                break
+        return ItemResult(index, item, status, attempt, time.perf_counter() - started, output)
+
+    def _run(self, argv: List[str]) -> Tuple[int, bytes]:
+        builtin = self.shell.dispatch.get(argv[0])
+        if builtin is not None:
+            return self._builtin(builtin, argv[1:])
+        command, options = argv, self._direct
+        if os.name == "nt" and argv[0].lower() in SHELL_INTERNALS:
+            command = ["cmd.exe", "/c", *argv]
+        if self.shell.profile is not None:
+            from profiles import limit_options
+            options = {**options, **limit_options(self.shell)}
+        try:
+            process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                       **options)
+        except OSError as e:
+            return 127, f"Cannot run '{argv[0]}': {e.strerror or e}\n".encode()
+        if self.shell.profile is not None:
+            from profiles import adopt
+            adopt(self.shell, process)  # `profile bulk parallel ...`: each item gets the profile's limits
+        output, _ = process.communicate()
+        return process.returncode, output
+
+    def _builtin(self, builtin, args: List[str]) -> Tuple[int, bytes]:
+        shell = copy.copy(self.shell)
+        shell.last_status = 0
+        buffer = io.StringIO()
+        self._router.local.buffer = buffer
+        try:
+            builtin.method(shell, args)
+        except Exception as e:
+            buffer.write(f"{e}\n")
+            shell.last_status = 1
+        finally:
+            self._router.local.buffer = None
+        return shell.last_status, buffer.getvalue().encode("utf-8")
+
+
+def report(console, results: List[ItemResult], seconds: float, jobs: int):
+    """Summary table of a run (only the failed items when there are many), then the totals."""
+    from rich.table import Table
+    failed = [result for result in results if result.status != 0]
+    rows = results if len(results) <= SUMMARY_ROWS else failed
+    if rows:
+        table = Table(title="⚡ Parallel Run" if rows is results else "⚡ Failed Items", header_style="bold cyan")
+        table.add_column("#", justify="right", style="dim")
+        table.add_column("Item", style="bold magenta")
+        table.add_column("Status", justify="right")
+        table.add_column("Attempts", justify="right")
+        table.add_column("Time", justify="right", style="bold yellow")
+        for result in rows:
+            status = f"[green]{result.status}[/]" if result.status == 0 else f"[red]{result.status}[/]"
+            table.add_row(str(result.index), result.item, status, str(result.attempts), f"{result.seconds:.2f}s")
+        console.print(table)
+    console.print(
+        f"[bold {'red' if failed else 'green'}]{'❌' if failed else '✅'} "
+        f"{len(results) - len(failed)}/{len(results)} items succeeded in {seconds:.2f}s with {jobs} workers[/]"
+    )
+
+
+def parallel_records(shell, argv: List[str], records: Iterator[str]) -> Iterator[str]:
+    """`parallel` as a pipeline stage: the items are the records piped in, the output lines are its records."""
+    from rich.console import Console
+    from scrollback import plain
+    jobs, retries, source, template = parse_args(argv)
+    items = read_items(source) if source is not None else records
+    runner = Runner(shell, template, jobs, retries)
+
+    def outputs():
+        results, started = [], time.perf_counter()
+        for result in runner.run(items):
+            results.append(result._replace(output=b""))
+            yield from plain(result.output).splitlines()
+        report(Console(stderr=True), results, time.perf_counter() - started, jobs)  # Kept out of the piped output
+        return 1 if any(result.status != 0 for result in results) else 0
+    return outputs()
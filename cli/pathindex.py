@@ -0,0 +1,224 @@
+# pathindex.py
+"""
+Persistent index of the executables reachable through PATH.
+
+Each PATH directory is stored with the mtime it had when it was scanned, so a
+refresh only costs one stat() per directory and only directories whose
+contents changed are listed again. The index is saved to the state directory
+and shared by every shell started afterwards.
+
+Two changes never move a directory's mtime past the cached value: a file
+added within the same timestamp tick as the scan (coarse filesystems) and
+`chmod +x` on an existing file. Directories modified within RACY_WINDOW of
+their scan are therefore rescanned on the next refresh until they settle, and
+a lookup miss probes the PATH directories for the name directly before
+reporting it as missing.
+"""
+
+import bisect
+import os
+import time
+from typing import Dict, List, Optional
+
+from appdata import data_path, read_json, write_json_atomic
+
+INDEX_VERSION = 1
+WINDOWS_EXTENSIONS = (".exe", ".bat", ".cmd", ".com")
+RACY_WINDOW_NS = 1_000_000_000  # A directory modified this close to its scan may change again unseen
+
+
+def _normalize(name: str) -> str:
+    """Command names are case-insensitive on Windows."""
+    return name.lower() if os.name == "nt" else name
+
+
+def scan_directory(directory: str) -> List[str]:
+    """Return the executable file names found directly inside `directory`."""
+    names = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if os.name == "nt":
+                    if entry.name.lower().endswith(WINDOWS_EXTENSIONS) and entry.is_file():
+                        names.append(entry.name)
+                elif entry.is_file() and os.access(entry.path, os.X_OK):
+                    names.append(entry.name)
+            except OSError:
+                continue
+    return names
+
+
+def is_executable_file(path: str) -> bool:
+    if os.name == "nt":
+        return path.lower().endswith(WINDOWS_EXTENSIONS) and os.path.isfile(path)
+    return os.path.isfile(path) and os.access(path, os.X_OK)
+
+
+def command_name(filename: str) -> str:
+    """Map a file name to the command that runs it ('git.exe' -> 'git' on Windows)."""
+    if os.name == "nt":
+        base, ext = os.path.splitext(filename)
+        if ext.lower() in WINDOWS_EXTENSIONS:
+            return _normalize(base)
+    return filename
+
+
+class ExecutableIndex:
+    """Executable lookup over PATH backed by an on-disk, per-directory mtime cache."""
+
+    def __init__(self, path: Optional[str] = None, index_file: Optional[str] = None, max_age: float = 1.0):
+        self._path_override = path
+        self.index_file = index_file or data_path("path_index.json")
+        self.max_age = max_age  # Seconds between PATH re-stats
+        self._dirs: Dict[str, dict] = {}
+        self._commands: Dict[str, List[str]] = {}
+        self._sorted: List[str] = []
+        self._checked_at = 0.0
+        self._path_value = None
+        self.rescanned: List[str] = []  # Directories listed during the last refresh
+        self._load()
+
+    # -- persistence ---------------------------------------------------------
+
+    def _load(self):
+        data = read_json(self.index_file, default={})
+        if isinstance(data, dict) and data.get("version") == INDEX_VERSION:
+            self._dirs = data.get("dirs", {})
+
+    def _save(self):
+        try:
+            write_json_atomic(self.index_file, {"version": INDEX_VERSION, "dirs": self._dirs})
+        except OSError:
+            pass  # The index is only a cache; failing to persist it is not fatal
+
+    # -- refreshing ----------------------------------------------------------
+
+    def path_dirs(self) -> List[str]:
+        value = self._path_override if self._path_override is not None else os.getenv("PATH", "")
+        seen = []
+        for directory in value.split(os.pathsep):
+            if directory and directory not in seen:
+                seen.append(directory)
+        return seen
+
+    def refresh(self, force: bool = False) -> bool:
+        """Re-stat the PATH directories and rescan the ones that changed. Returns True if anything did."""
+        path_value = self._path_override if self._path_override is not None else os.getenv("PATH", "")
+        now = time.monotonic()
+        if not force and path_value == self._path_value and now - self._checked_at < self.max_age:
+            return False
+        self._checked_at = now
+
+        directories = self.path_dirs()
+        self.rescanned = []
+        changed = path_value != self._path_value
+
+        for directory in directories:
+            try:
+                mtime_ns = os.stat(directory).st_mtime_ns
+            except OSError:
+                if directory in self._dirs:
+                    del self._dirs[directory]
+                    changed = True
+                continue
+
+            cached = self._dirs.get(directory)
+            if cached is not None and cached.get("mtime_ns") == mtime_ns and not cached.get("racy"):
+                continue
+
+            scanned_at_ns = time.time_ns()
+            try:
+                names = scan_directory(directory)
+            except (PermissionError, NotADirectoryError, FileNotFoundError):
+                names = []
+            entry = {"mtime_ns": mtime_ns, "names": names}
+            if scanned_at_ns - mtime_ns < RACY_WINDOW_NS:
+                entry["racy"] = True
+            if cached is None or cached.get("names") != names or cached.get("mtime_ns") != mtime_ns:
+                changed = True
+            self._dirs[directory] = entry
+            self.rescanned.append(directory)
+
+        if self.rescanned:
+            self._save()
+        if changed:
+            self._path_value = path_value
+            self._rebuild(directories)
+        return changed
+
+    def _rebuild(self, directories: List[str]):
+        commands: Dict[str, List[str]] = {}
+        for directory in directories:
+            entry = self._dirs.get(directory)
+            if not entry:
+                continue
+            for filename in entry["names"]:
+                commands.setdefault(command_name(filename), []).append(os.path.join(directory, filename))
+        self._commands = commands
+        self._sorted = sorted(commands)
+
+    def probe(self, name: str) -> bool:
+        """Look for `name` in each PATH directory directly; index and return True if found.
+
+        Catches executables the mtime check cannot see. Costs one stat per
+        directory (per extension on Windows), never a directory listing.
+        """
+        if not name or os.sep in name or (os.altsep and os.altsep in name):
+            return False
+        candidates = [name + ext for ext in WINDOWS_EXTENSIONS] if os.name == "nt" else [name]
+        found = False
+        for directory in self.path_dirs():
+            entry = self._dirs.get(directory)
+            if entry is None:
+                continue
+            for filename in candidates:
+                if filename not in entry["names"] and is_executable_file(os.path.join(directory, filename)):
+                    entry["names"].append(filename)
+                    found = True
+        if found:
+            self._save()
+            self._rebuild(self.path_dirs())
+        return found
+
+    # -- lookups -------------------------------------------------------------
+
+    def __contains__(self, name: str) -> bool:
+        self.refresh()
+        if _normalize(name) in self._commands:
+            return True
+        return self.probe(name)
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self._commands)
+
+    def names(self) -> List[str]:
+        """All command names, sorted."""
+        self.refresh()
+        return self._sorted
+
+    def with_prefix(self, prefix: str, limit: Optional[int] = None) -> List[str]:
+        """Command names starting with `prefix`, found by bisecting the sorted name list."""
+        self.refresh()
+        prefix = _normalize(prefix)
+        start = bisect.bisect_left(self._sorted, prefix)
+        matches = []
+        for name in self._sorted[start:]:
+            if not name.startswith(prefix) or (limit is not None and len(matches) >= limit):
+                break
+            matches.append(name)
+        return matches
+
+    def which(self, name: str, all_matches: bool = False) -> List[str]:
+        """Full paths for `name` in PATH order; only the first unless all_matches is set."""
+        self.refresh()
+        paths = self._commands.get(_normalize(name))
+        if not paths or all_matches:
+            self.probe(name)
+            paths = self._commands.get(_normalize(name), [])
+        return list(paths) if all_matches else paths[:1]
+
+    def resolve(self, name: str) -> Optional[str]:
+        """The path that would run for `name`, or None."""
+        paths = self.which(name)
+        return paths[0] if paths else None
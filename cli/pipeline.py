@@ -0,0 +1,491 @@
+# pipeline.py
+"""
+Pipelines and output redirection: `ls | find .log`, `tasklist > procs.txt`.
+
+A line is cut at unquoted `|`, `>` and `>>` into stages. Builtins run in this
+process and hand records (lines of text, without their newline) downstream
+as generators, one at a time. A stage that stops early, like
+`tasklist | head 5`, therefore stops everything upstream of it: nothing is
+produced that nobody reads. External commands run with their standard streams
+on OS pipes, connected straight to each other when they are neighbours. Where
+they meet an in-process stage, a feeder thread writes records into the
+child's stdin, or its stdout is read back line by line.
+
+Builtins with a record source of their own (PRODUCERS) are iterated lazily.
+CONSUMERS, such as `parallel`, read the records piped into them. Any other
+builtin runs once, and what it prints is cut into records. The FILTERS run in
+process only when something is piped into them. First on a line, `find` or
+`sort` is still the system command.
+"""
+
+import io
+import itertools
+import os
+import shlex
+import subprocess
+import sys
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from registry import SHELL_INTERNALS
+
+WRITE_BATCH = 64 * 1024  # Records written to a file or pipe are gathered up to this many bytes
+
+
+class PipelineError(Exception):
+    """A pipeline could not be run; `status` is the exit status it leaves."""
+
+    def __init__(self, message: str, status: int = 1):
+        super().__init__(message)
+        self.status = status
+
+
+# Parsing
+
+def _split(line: str) -> Tuple[List[str], List[str]]:
+    """The line's text between unquoted operators, and the operators."""
+    parts, operators, current, quote = [], [], [], None
+    index = 0
+    while index < len(line):
+        char = line[index]
+        if char == "\\" and quote != "'" and index + 1 < len(line):
+            current.append(line[index:index + 2])  # Escaped: shlex.split deals with it per stage
+            index += 2
+            continue
+        if quote:
+            quote = None if char == quote else quote
+        elif char in "'\"":
+            quote = char
+        elif char in "|>":
+            operator = ">>" if line.startswith(">>", index) else char
+            parts.append("".join(current))
+            operators.append(operator)
+            current = []
+            index += len(operator)
+            continue
+        current.append(char)
+        index += 1
+    parts.append("".join(current))
+    return parts, operators
+
+
+def parse_pipeline(line: str) -> Optional["Pipeline"]:
+    """The pipeline `line` describes, or None when it has no unquoted `|`, `>` or `>>`."""
+    parts, operators = _split(line)
+    if not operators:
+        return None
+    redirect = None
+    if operators[-1] in (">", ">>"):
+        target = shlex.split(parts[-1])
+        if len(target) != 1:
+            raise PipelineError(f"'{operators[-1]}' needs exactly one file name", 2)
+        redirect = (target[0], operators[-1] == ">>")
+        parts, operators = parts[:-1], operators[:-1]
+    if any(operator != "|" for operator in operators):
+        raise PipelineError("Output can only be redirected at the end of a line", 2)
+    stages = [shlex.split(part) for part in parts]
+    if not all(stages):
+        raise PipelineError("Empty command in pipeline", 2)
+    return Pipeline(line, stages, redirect)
+
+
+# Record sources of builtins
+
+def _tasklist(shell, argv: List[str]) -> Optional[Iterator[str]]:
+    if argv:
+        return None  # Options go to the system tasklist through the builtin
+    import psutil
+
+    def processes():
+        for process in psutil.process_iter(["pid", "name", "memory_info"]):
+            info = process.info
+            memory = f"{info['memory_info'].rss / (1024 ** 2):.2f} MB" if info["memory_info"] else "N/A"
+            yield f"{info['pid']:>7}  {info['name'] or '?':<32} {memory:>12}"
+    return processes()
+
+
+def _listing(argv: List[str], default) -> Iterator[str]:
+    from listing import parse_args, rows
+    try:
+        options, directory = parse_args(argv, default)
+    except ValueError as e:
+        raise PipelineError(str(e), 2)
+    directory = directory or os.getcwd()
+    if not os.path.isdir(directory):
+        raise PipelineError(f"'{directory}' is not a directory.")
+    return (row.text for row in rows(directory, options))
+
+
+def _ls(shell, argv: List[str]) -> Iterator[str]:
+    from listing import LS_DEFAULTS
+    return _listing(argv, LS_DEFAULTS)
+
+
+def _dir(shell, argv: List[str]) -> Iterator[str]:
+    from listing import DIR_DEFAULTS
+    return _listing(argv, DIR_DEFAULTS)  # The same rows as the dir builtin prints
+
+
+def _tree(shell, argv: List[str]) -> Iterator[str]:
+    from treewalk import TreeError, Walker, parse_args, text_lines
+    try:
+        options, directory = parse_args(argv)
+    except TreeError as e:
+        raise PipelineError(str(e), 2)
+    if options.json:
+        return None  # Chunks of one document, not records: what the builtin prints
+    directory = directory or "."
+    if not os.path.isdir(directory):
+        raise PipelineError(f"'{directory}' is not a directory.")
+
+    def lines():
+        with Walker(options) as walker:
+            yield from text_lines(walker, directory)
+    return lines()
+
+
+def _last(shell, argv: List[str]) -> Optional[Iterator[str]]:
+    if len(argv) > 1 or (argv and not argv[0].isdigit()):
+        return None  # -l and -f: what the builtin prints
+    entry = shell.scrollback.recent(int(argv[0]) if argv else 1)
+    if entry is None:
+        raise PipelineError("No kept output that far back (see 'last -l').")
+    return iter(shell.scrollback.text(entry).splitlines())
+
+
+# Builtins whose output can be produced record by record: (shell, argv) -> records, or None to run the builtin
+PRODUCERS: Dict[str, Callable[..., Optional[Iterator[str]]]] = {
+    "tasklist": _tasklist,
+    "ls": _ls,
+    "dir": _dir,
+    "tree": _tree,
+    "last": _last,
+}
+
+
+def _parallel(shell, argv: List[str], records: Iterator[str]) -> Iterator[str]:
+    from parallel import ParallelError, parallel_records
+    try:
+        return parallel_records(shell, argv, records)
+    except ParallelError as e:
+        raise PipelineError(str(e), 2)
+
+
+# Builtins that take the records piped into them: (shell, argv, records) -> records
+CONSUMERS: Dict[str, Callable[..., Iterator[str]]] = {
+    "parallel": _parallel,
+}
+
+
+# Filters
+
+def _options(argv: List[str], letters: str) -> Tuple[set, List[str]]:
+    """Single-letter options written /x or -x (any case), and the other words."""
+    options, words = set(), []
+    for arg in argv:
+        if len(arg) == 2 and arg[0] in "/-" and arg[1].lower() in letters:
+            options.add(arg[1].lower())
+        else:
+            words.append(arg)
+    return options, words
+
+
+def _count(argv: List[str], usage: str) -> int:
+    words = argv[1:] if argv[:1] == ["-n"] else argv
+    if not words:
+        return 10
+    if len(words) == 1 and words[0].isdigit():
+        return int(words[0])
+    raise PipelineError(f"Usage: {usage}", 2)
+
+
+def _find(argv: List[str], records: Iterator[str]) -> Iterator[str]:
+    """find [/i] [/v] [/c] <text>: the records containing text, like FIND; status 1 if none do."""
+    options, words = _options(argv, "ivc")
+    if len(words) != 1:
+        raise PipelineError("Usage: find [/i] [/v] [/c] <text>", 2)
+    ignore_case, invert, count = "i" in options, "v" in options, "c" in options
+    text = words[0].lower() if ignore_case else words[0]
+
+    def matching():
+        found = 0
+        for record in records:
+            if (text in (record.lower() if ignore_case else record)) != invert:
+                found += 1
+                if not count:
+                    yield record
+        if count:
+            yield str(found)
+        return 0 if found else 1
+    return matching()
+
+
+def _head(argv: List[str], records: Iterator[str]) -> Iterator[str]:
+    """head [n]: the first n records (10); nothing after them is read."""
+    count = _count(argv, "head [n]")
+
+    def first():
+        yield from itertools.islice(records, count)
+    return first()
+
+
+def _tail(argv: List[str], records: Iterator[str]) -> Iterator[str]:
+    """tail [n]: the last n records (10)."""
+    count = _count(argv, "tail [n]")
+
+    def last():
+        yield from deque(records, maxlen=count)
+    return last()
+
+
+def _sort(argv: List[str], records: Iterator[str]) -> Iterator[str]:
+    """sort [/r]: records in order, ignoring case like SORT."""
+    options, words = _options(argv, "r")
+    if words:
+        raise PipelineError("Usage: sort [/r]", 2)
+
+    def ordered():
+        yield from sorted(records, key=str.casefold, reverse="r" in options)
+    return ordered()
+
+
+# Stages that only run in process when records are piped into them: (argv, records) -> records
+FILTERS: Dict[str, Callable[[List[str], Iterator[str]], Iterator[str]]] = {
+    "find": _find,
+    "head": _head,
+    "tail": _tail,
+    "sort": _sort,
+}
+
+
+# Running
+
+def _replay(records: List[str], status: int) -> Iterator[str]:
+    yield from records
+    return status
+
+
+def _captured(shell, argv: List[str]) -> Iterator[str]:
+    """Run a builtin with no record source of its own now; what it printed becomes its records."""
+    from scrollback import plain
+    buffer, stdout = io.StringIO(), sys.stdout
+    sys.stdout = buffer
+    shell.last_status = 0
+    try:
+        shell.dispatch[argv[0]].method(shell, argv[1:])
+    finally:
+        sys.stdout = stdout
+    return _replay(plain(buffer.getvalue().encode("utf-8")).splitlines(), shell.last_status)
+
+
+def _builtin_records(shell, argv: List[str]) -> Iterator[str]:
+    producer = PRODUCERS.get(argv[0])
+    records = producer(shell, argv[1:]) if producer is not None else None
+    return records if records is not None else _captured(shell, argv)
+
+
+def _lines(pipe) -> Iterator[str]:
+    for line in pipe:
+        yield line.decode("utf-8", "replace").rstrip("\r\n")
+
+
+def _records(source) -> Iterator[str]:
+    if source is None:
+        return iter(())
+    if isinstance(source, subprocess.Popen):
+        return _lines(source.stdout)
+    return source
+
+
+def _close(records):
+    close = getattr(records, "close", None)
+    if close is not None:
+        close()
+
+
+def _feed(records: Iterator[str], pipe, upstream: list, errors: list):
+    """Write records into a child's stdin (on a thread) until they run out or the child stops reading."""
+    batch, size = [], 0
+    try:
+        for record in records:
+            batch.append(record.encode("utf-8", "replace") + b"\n")
+            size += len(batch[-1])
+            if size >= WRITE_BATCH:
+                pipe.write(b"".join(batch))
+                batch, size = [], 0
+        pipe.write(b"".join(batch))
+    except (BrokenPipeError, ValueError):
+        pass  # The child exited or closed its stdin: nobody wants the rest
+    except Exception as e:
+        errors.append(e)
+    finally:
+        for generator in reversed(upstream):
+            _close(generator)
+        try:
+            pipe.close()
+        except OSError:
+            pass
+
+
+def _drain(records: Iterator[str], out) -> int:
+    """Write the last stage's records to `out`; returns the stage's status.
+
+    A terminal gets every record as it comes, anything else batches of them.
+    """
+    interactive = getattr(out, "isatty", lambda: False)()
+    batch, size = [], 0
+    try:
+        while True:
+            try:
+                record = next(records)
+            except StopIteration as stop:
+                return stop.value or 0
+            batch.append(record.encode("utf-8", "replace") + b"\n")
+            size += len(batch[-1])
+            if interactive or size >= WRITE_BATCH:
+                out.write(b"".join(batch))
+                out.flush()
+                batch, size = [], 0
+    finally:
+        if batch:
+            out.write(b"".join(batch))
+        out.flush()
+
+
+def _redirect_undo(path: str, append: bool) -> dict:
+    """Undo record putting the redirect target back as it is before the pipeline writes to it."""
+    from commands import undo_save
+    from undoops import undo_record
+    full = os.path.abspath(path)
+    if not os.path.lexists(path):
+        op = {"op": "remove", "path": full}
+    elif append:
+        op = {"op": "truncate", "path": full, "length": os.path.getsize(path)}
+    else:
+        op = undo_save(path)
+    return undo_record(f'Undo: output redirected to "{path}"', op)
+
+
+class Pipeline:
+    """Stages connected by `|`, with the last one's output optionally redirected to a file."""
+
+    def __init__(self, line: str, stages: List[List[str]], redirect: Optional[Tuple[str, bool]] = None):
+        self.line = line
+        self.stages = stages
+        self.redirect = redirect  # (path, append)
+
+    def _kind(self, shell, argv: List[str], index: int) -> str:
+        name = argv[0]
+        if name in ("undo", "redo"):
+            raise PipelineError(f"'{name}' cannot be part of a pipeline", 2)
+        if index and name in FILTERS:
+            return "filter"
+        if name in shell.dispatch:
+            return "builtin"
+        if shell.is_system_command(name):
+            return "external"
+        raise PipelineError(f"Unknown command: '{name}'", 127)
+
+    def _open_target(self, shell):
+        path, append = self.redirect
+        if os.path.isdir(path):
+            raise PipelineError(f"'{path}' is a directory.")
+        undo = _redirect_undo(path, append)
+        try:
+            return open(path, "ab" if append else "wb"), undo
+        except OSError as e:
+            raise PipelineError(f"Cannot write to '{path}': {e.strerror or e}")
+
+    def run(self, shell) -> int:
+        """Run every stage; returns the exit status of the last one."""
+        kinds = [self._kind(shell, argv, index) for index, argv in enumerate(self.stages)]
+        target, undo = self._open_target(shell) if self.redirect else (None, None)
+        owned: list = []  # Generators iterated by this thread, upstream first
+        processes: List[subprocess.Popen] = []
+        threads: List[threading.Thread] = []
+        errors: list = []
+        finished = False
+        source = None
+        try:
+            for index, (argv, kind) in enumerate(zip(self.stages, kinds)):
+                if kind == "filter":
+                    upstream = _records(source)
+                    owned.append(upstream)
+                    source = FILTERS[argv[0]](argv[1:], upstream)
+                elif kind == "builtin" and index and argv[0] in CONSUMERS:
+                    upstream = _records(source)
+                    owned.append(upstream)
+                    source = CONSUMERS[argv[0]](shell, argv[1:], upstream)
+                elif kind == "builtin":
+                    source = _builtin_records(shell, argv)
+                else:
+                    last = index == len(kinds) - 1
+                    stdout = target if last and target is not None else subprocess.PIPE
+                    source = self._spawn(shell, argv, source, stdout, owned, threads, errors)
+                    processes.append(source)
+                    continue
+                owned.append(source)
+
+            if isinstance(source, subprocess.Popen):
+                if target is not None:
+                    status = source.wait()
+                else:
+                    from outputpump import OutputPump
+                    status = OutputPump().run(source)
+            else:
+                from outputpump import binary_stream
+                status = _drain(source, target if target is not None else binary_stream(sys.stdout))
+            finished = True
+        except OSError as e:
+            raise PipelineError(str(e))
+        finally:
+            for generator in reversed(owned):
+                _close(generator)
+            for process in processes:
+                if process.stdout is not None:
+                    process.stdout.close()  # A writer still going gets a broken pipe and stops
+                if not finished and process.poll() is None:
+                    process.terminate()
+            for process in processes:
+                process.wait()
+            for thread in threads:
+                thread.join()
+            if target is not None:
+                target.close()
+            if undo is not None:
+                shell.command_history.append((self.line, undo))
+        if errors:
+            raise PipelineError(str(errors[0]))
+        return status
+
+    def _spawn(self, shell, argv: List[str], source, stdout, owned: list, threads: list, errors: list) -> subprocess.Popen:
+        """Start an external stage reading from `source`: another process's pipe, records, or the terminal."""
+        from spawn import direct_options
+        command = argv
+        if os.name == "nt" and argv[0].lower() in SHELL_INTERNALS:
+            command = ["cmd.exe", "/c", *argv]
+        if isinstance(source, subprocess.Popen):
+            stdin = source.stdout
+        else:
+            stdin = subprocess.PIPE if source is not None else None
+        try:
+            options = direct_options(shell.executables, command) if command is argv else {}
+            if shell.profile is not None:
+                from profiles import limit_options
+                options.update(limit_options(shell))
+            process = subprocess.Popen(command, stdin=stdin, stdout=stdout, **options)
+        except OSError as e:
+            raise PipelineError(f"Cannot run '{argv[0]}': {e.strerror or e}", 127)
+        if shell.profile is not None:
+            from profiles import adopt
+            adopt(shell, process)
+        if isinstance(source, subprocess.Popen):
+            source.stdout.close()  # Only the child reads it now, so the writer sees its reader exit
+        elif source is not None:
+            upstream, owned[:] = list(owned) + [source], []  # Iterated by the feeder from now on
+            thread = threading.Thread(target=_feed, args=(source, process.stdin, upstream, errors),
+                                      name="pipeline feeder", daemon=True)
+            thread.start()
+            threads.append(thread)
+        return process
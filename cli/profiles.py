@@ -0,0 +1,376 @@
+# profiles.py
+"""
+Execution profiles: `profile bulk chkdsk C:` runs the rest of the line at low
+priority, so bulk work does not starve other services on the host.
+
+A profile can set:
+
+    nice      CPU priority, 0 to 19 (only ever lowered)
+    ionice    I/O class: "idle", "best-effort[:0-7]" or "realtime[:0-7]"
+    affinity  CPUs the work may run on, e.g. "2-3" or [2, 3]
+    memory    address-space limit of each child process, e.g. "2G"
+    cpu_time  CPU-seconds limit of each child process
+    timeout   wall-clock limit of the whole line, e.g. "90", "30m", "2h"
+
+The built-in profiles are below. Others, or changes to these, go in
+profiles.json in the state directory:
+
+    {"nightly": {"nice": 15, "ionice": "idle", "affinity": "1-3", "timeout": "2h"}}
+
+The line runs on a thread of its own. On Linux nice, the I/O class and CPU
+affinity belong to a thread, and a thread's children and threads start with
+its values. So the settings reach builtins (a `copy`), every child process
+(each started with them), and `parallel`'s worker threads, while the shell
+keeps its own priority. The thread ends with the line, so nothing has to be
+restored, which an unprivileged process could not do for nice. On other
+systems the settings are applied to each child right after it starts, and
+builtins run unchanged.
+
+Memory and CPU-time limits are per process, so each child sets them on
+itself between fork and exec (setrlimit in a preexec_fn, on POSIX systems),
+before the program runs a single instruction; a command run through sh
+passes them on to everything it starts. They never reach the shell. Where a
+child cannot set them itself, they are applied right after it starts
+(prlimit) instead.
+
+When the timeout expires, every process the line started is killed,
+children first, and the builtin still running is stopped. The line's
+status is then 124, as with timeout(1).
+"""
+
+import ctypes
+import os
+import re
+import sys
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from appdata import data_path, read_json
+
+try:
+    import resource  # noqa: F401  POSIX only
+    _CHILD_SETS_LIMITS = True  # A child sets its own limits between fork and exec
+except ImportError:
+    _CHILD_SETS_LIMITS = False
+
+TIMEOUT_STATUS = 124  # Exit status of a line stopped by its profile's timeout, as timeout(1) uses
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+DURATION_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600}
+IONICE_CLASSES = ("idle", "best-effort", "realtime")
+
+BUILTIN_PROFILES = {
+    "low": {"nice": 10, "ionice": "best-effort:7", "description": "Below normal CPU and I/O priority"},
+    "bulk": {"nice": 19, "ionice": "idle", "description": "Runs only when the CPU and disks are otherwise idle"},
+}
+
+
+class ProfileError(Exception):
+    """A profile is unknown or its settings are unusable."""
+
+
+class ProfileTimeout(BaseException):
+    """Raised in the thread running a profiled line when its timeout expires (not an Exception, like KeyboardInterrupt)."""
+
+
+class Profile(NamedTuple):
+    name: str
+    nice: Optional[int] = None
+    ionice: Optional[Tuple[str, int]] = None  # (class, level)
+    affinity: Optional[List[int]] = None
+    memory: Optional[int] = None  # Bytes
+    cpu_time: Optional[int] = None  # Seconds
+    timeout: Optional[float] = None  # Seconds
+    description: str = ""
+
+
+def parse_size(value) -> int:
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*", str(value), re.IGNORECASE)
+    if not match:
+        raise ProfileError(f"'{value}' is not a size such as 512M or 2G")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+
+def parse_duration(value) -> float:
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smh]?)\s*", str(value))
+    if not match:
+        raise ProfileError(f"'{value}' is not a duration such as 90, 30s, 15m or 2h")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+
+def parse_cpus(value) -> List[int]:
+    if isinstance(value, list):
+        cpus = value
+    else:
+        cpus = []
+        for part in str(value).split(","):
+            first, _, last = part.strip().partition("-")
+            if not first.isdigit() or (last and not last.isdigit()):
+                raise ProfileError(f"'{value}' is not a CPU list such as 0-3,6")
+            cpus.extend(range(int(first), int(last or first) + 1))
+    if not cpus or not all(isinstance(cpu, int) and cpu >= 0 for cpu in cpus):
+        raise ProfileError(f"'{value}' is not a CPU list such as 0-3,6")
+    return sorted(set(cpus))
+
+
+def parse_profile(name: str, settings: dict) -> Profile:
+    """A Profile from its profiles.json entry; raises ProfileError naming the bad setting."""
+    if not isinstance(settings, dict):
+        raise ProfileError(f"Profile '{name}' must be an object of settings")
+    unknown = set(settings) - (set(Profile._fields) - {"name"})
+    if unknown:
+        raise ProfileError(f"Profile '{name}' has unknown settings: {', '.join(sorted(unknown))}")
+    values = {"name": name, "description": str(settings.get("description", ""))}
+    try:
+        if settings.get("nice") is not None:
+            values["nice"] = int(settings["nice"])
+            if not 0 <= values["nice"] <= 19:
+                raise ProfileError("nice must be between 0 and 19")
+        if settings.get("ionice") is not None:
+            io_class, _, level = str(settings["ionice"]).partition(":")
+            if io_class not in IONICE_CLASSES or (level and not (level.isdigit() and int(level) <= 7)):
+                raise ProfileError(f"ionice must be idle, best-effort[:0-7] or realtime[:0-7], not '{settings['ionice']}'")
+            values["ionice"] = (io_class, int(level or 4))
+        if settings.get("affinity") is not None:
+            values["affinity"] = parse_cpus(settings["affinity"])
+        if settings.get("memory") is not None:
+            values["memory"] = parse_size(settings["memory"])
+        if settings.get("cpu_time") is not None:
+            values["cpu_time"] = int(parse_duration(settings["cpu_time"]))
+        if settings.get("timeout") is not None:
+            values["timeout"] = parse_duration(settings["timeout"])
+    except (ProfileError, TypeError, ValueError) as e:
+        raise ProfileError(f"Profile '{name}': {e}")
+    return Profile(**values)
+
+
+def load_profiles() -> Dict[str, Profile]:
+    """The built-in profiles, overridden and extended by profiles.json."""
+    settings = dict(BUILTIN_PROFILES)
+    custom = read_json(data_path("profiles.json"), {})
+    if not isinstance(custom, dict):
+        raise ProfileError("profiles.json must be an object of profiles")
+    settings.update(custom)
+    return {name: parse_profile(name, values) for name, values in settings.items()}
+
+
+def get_profile(name: str) -> Profile:
+    profiles = load_profiles()
+    if name not in profiles:
+        raise ProfileError(f"Unknown profile '{name}' (have: {', '.join(sorted(profiles))})")
+    return profiles[name]
+
+
+def split_line(line: str) -> Tuple[Optional[Profile], str]:
+    """(profile, command) for `profile <name> <command ...>`; (None, line) when the line only names the builtin."""
+    words = line.split(maxsplit=2)
+    if len(words) < 3 or words[1].startswith("-"):
+        return None, line
+    return get_profile(words[1]), words[2]
+
+
+def describe(profile: Profile) -> str:
+    """The profile's settings, in profiles.json terms."""
+    parts = []
+    if profile.nice is not None:
+        parts.append(f"nice {profile.nice}")
+    if profile.ionice is not None:
+        io_class, level = profile.ionice
+        parts.append(f"ionice {io_class}" + (f":{level}" if io_class != "idle" else ""))
+    if profile.affinity is not None:
+        parts.append(f"CPUs {','.join(map(str, profile.affinity))}")
+    if profile.memory is not None:
+        from accounting import size
+        parts.append(f"memory {size(profile.memory)}")
+    if profile.cpu_time is not None:
+        parts.append(f"cpu_time {profile.cpu_time}s")
+    if profile.timeout is not None:
+        parts.append(f"timeout {profile.timeout:g}s")
+    return ", ".join(parts) or "no limits"
+
+
+# Applying a profile
+
+def _ionice_args(psutil, profile: Profile) -> tuple:
+    io_class, level = profile.ionice
+    if os.name == "nt":
+        return (psutil.IOPRIO_VERYLOW if io_class == "idle" else psutil.IOPRIO_LOW if level >= 4 else psutil.IOPRIO_NORMAL,)
+    io_class = {"idle": psutil.IOPRIO_CLASS_IDLE, "best-effort": psutil.IOPRIO_CLASS_BE,
+                "realtime": psutil.IOPRIO_CLASS_RT}[io_class]
+    return (io_class,) if io_class == psutil.IOPRIO_CLASS_IDLE else (io_class, level)
+
+
+def _windows_priority(psutil, nice: int):
+    return psutil.IDLE_PRIORITY_CLASS if nice >= 15 else psutil.BELOW_NORMAL_PRIORITY_CLASS if nice >= 5 else psutil.NORMAL_PRIORITY_CLASS
+
+
+def _apply(profile: Profile, process, warnings: List[str], nice_now: int):
+    """Set nice, the I/O class and affinity on a psutil process, or a Linux thread (by its id)."""
+    import psutil
+    settings = []
+    if profile.nice is not None and profile.nice > nice_now:  # Raising priority back up takes privileges
+        settings.append(("nice", lambda: process.nice(_windows_priority(psutil, profile.nice) if os.name == "nt" else profile.nice)))
+    if profile.ionice is not None and hasattr(process, "ionice"):
+        settings.append(("ionice", lambda: process.ionice(*_ionice_args(psutil, profile))))
+    if profile.affinity is not None and hasattr(process, "cpu_affinity"):
+        settings.append(("affinity", lambda: process.cpu_affinity(profile.affinity)))
+    for setting, apply in settings:
+        try:
+            apply()
+        except (psutil.Error, OSError, ValueError) as e:
+            warnings.append(f"{setting} not applied: {e}")
+
+
+def lower_thread(profile: Profile) -> List[str]:
+    """Give the calling thread the profile's nice, I/O class and affinity (Linux); returns warnings."""
+    warnings: List[str] = []
+    if not sys.platform.startswith("linux"):
+        return warnings
+    import psutil
+    tid = threading.get_native_id()
+    _apply(profile, psutil.Process(tid), warnings, os.getpriority(os.PRIO_PROCESS, tid))
+    return warnings
+
+
+def _set_limits(profile: Profile):
+    """Runs in the child, before exec: apply the memory and CPU-time limits to itself."""
+    import resource
+    for limit, value in ((resource.RLIMIT_AS, profile.memory), (resource.RLIMIT_CPU, profile.cpu_time)):
+        if value is not None:
+            _, hard = resource.getrlimit(limit)
+            value = value if hard == resource.RLIM_INFINITY else min(value, hard)  # Only root may raise a hard limit
+            resource.setrlimit(limit, (value, value))
+
+
+def limit_options(shell) -> dict:
+    """Popen keyword arguments that make the child take the active profile's limits before it execs."""
+    profile = getattr(shell, "profile", None)
+    if profile is None or (profile.memory is None and profile.cpu_time is None) or not _CHILD_SETS_LIMITS:
+        return {}
+    return {"preexec_fn": lambda: _set_limits(profile)}
+
+
+def adopt(shell, process) -> None:
+    """Apply the shell's active profile to a child process it just started.
+
+    Priorities on non-Linux systems; limits only where limit_options() could not have the child set them.
+    """
+    profile = getattr(shell, "profile", None)
+    if profile is None:
+        return
+    import psutil
+    warnings: List[str] = []
+    try:
+        child = psutil.Process(process.pid)
+        if not sys.platform.startswith("linux"):
+            _apply(profile, child, warnings, 0)
+        limits = [(psutil.RLIMIT_AS, profile.memory), (psutil.RLIMIT_CPU, profile.cpu_time)] \
+            if hasattr(child, "rlimit") and not _CHILD_SETS_LIMITS else []
+        for limit, value in limits:
+            if value is not None:
+                child.rlimit(limit, (value, value))
+        if not limits and not _CHILD_SETS_LIMITS and (profile.memory is not None or profile.cpu_time is not None):
+            warnings.append("memory and cpu_time limits are not supported on this system")
+    except psutil.NoSuchProcess:
+        return  # Already finished
+    except (psutil.Error, OSError, ValueError) as e:
+        warnings.append(f"limits not applied: {e}")
+    _warn(profile, warnings)
+
+
+def _warn(profile: Profile, warnings: List[str]):
+    from rich.console import Console
+    for warning in dict.fromkeys(warnings):
+        Console(stderr=True).print(f"[bold yellow]⚠  Profile '{profile.name}': {warning}[/]")
+
+
+def _raise_in(thread: threading.Thread, exception) -> None:
+    """Raise `exception` in another thread as soon as it runs Python code again."""
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread.ident), ctypes.py_object(exception))
+
+
+def kill_tree(processes) -> int:
+    """Kill psutil processes, children before their parents; returns how many were still running."""
+    import psutil
+    killed = 0
+    for process in sorted(processes, key=lambda process: process.create_time(), reverse=True):
+        try:
+            process.kill()
+            killed += 1
+        except psutil.Error:
+            pass  # Already gone
+    return killed
+
+
+def _started_by_line(shell, started: float) -> list:
+    """The shell's descendants started since `started`, leaving out background jobs."""
+    import psutil
+    jobs = shell.__dict__.get("job_table")
+    job_pids = {job.pid for job in jobs.jobs.values()} if jobs is not None else set()
+    found = []
+    for child in psutil.Process().children():
+        try:
+            if child.pid in job_pids or child.create_time() < started - 1:
+                continue
+            found.append(child)
+            found.extend(child.children(recursive=True))
+        except psutil.Error:
+            pass
+    return found
+
+
+def run(shell, profile: Profile, command: str) -> int:
+    """Run a command line under a profile; returns its exit status (TIMEOUT_STATUS if the timeout stopped it)."""
+    from rich.console import Console
+    outcome = {"status": 0, "error": None, "killed": 0}
+    warnings: List[str] = []
+
+    def target():
+        warnings.extend(lower_thread(profile))
+        _warn(profile, warnings)
+        try:
+            shell.run_line(command)
+            outcome["status"] = shell.last_status
+        except ProfileTimeout:
+            outcome["status"] = TIMEOUT_STATUS
+        except BaseException as e:  # KeyboardInterrupt included: the shell reports it on the calling thread
+            outcome["error"] = e
+
+    previous, shell.profile = shell.profile, profile
+    started, expired = time.time(), threading.Event()
+    worker = threading.Thread(target=target, name=f"profile {profile.name}", daemon=True)
+
+    def expire():
+        if not worker.is_alive():
+            return
+        outcome["killed"] = kill_tree(_started_by_line(shell, started))
+        expired.set()
+        if worker.is_alive():
+            _raise_in(worker, ProfileTimeout)
+
+    timer = threading.Timer(profile.timeout, expire) if profile.timeout else None
+    try:
+        worker.start()
+        if timer is not None:
+            timer.daemon = True
+            timer.start()
+        while worker.is_alive():
+            try:
+                worker.join()
+            except KeyboardInterrupt:
+                _raise_in(worker, KeyboardInterrupt)  # The children got the terminal's SIGINT themselves
+    finally:
+        if timer is not None:
+            timer.cancel()
+            if timer.is_alive():
+                timer.join()  # Expiring right now: let it finish killing first
+        shell.profile = previous
+    if outcome["error"] is not None and not isinstance(outcome["error"], KeyboardInterrupt):
+        raise outcome["error"]
+    if expired.is_set():
+        killed = outcome["killed"]
+        Console(stderr=True).print(f"[bold red]⏱  Timed out after {profile.timeout:g}s"
+                                   f"{f'; killed {killed} process' + ('es' if killed > 1 else '') if killed else ''}[/]")
+        return TIMEOUT_STATUS
+    return 130 if outcome["error"] is not None else outcome["status"]
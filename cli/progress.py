@@ -0,0 +1,126 @@
+# progress.py
+"""
+Progress display for builtins: nothing for quick operations, a spinner or a
+progress bar for slow ones.
+
+An Activity shows nothing until it has run for SPINNER_DELAY seconds (0.25,
+or MYCLI_SPINNER_DELAY). Most operations finish before that and print only
+their result. One that takes longer gets a transient spinner. Where the work
+can be measured, it gets a bar with items or bytes done, the rate and the
+time left. Progress is given with advance(), or by a `completed` callable
+that the display polls, such as the size of a file being copied, so the work
+itself is not slowed down by reporting it.
+
+Nothing is shown when the output is not a terminal. Only one Activity shows
+at a time (Rich allows one live display); one started while another shows,
+for example on a `parallel` worker thread, stays silent.
+
+A child process that writes to the terminal itself must not be drawn over:
+hand_over() withdraws the Activity running, as run_system does before
+os.system.
+"""
+
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+SPINNER_DELAY = float(os.environ.get("MYCLI_SPINNER_DELAY", 0.25))  # Seconds before anything is shown
+POLL_INTERVAL = 0.1  # Seconds between reads of a `completed` callable
+
+_showing = threading.Lock()  # Held by the Activity on screen
+_current = threading.local()  # The Activity running on each thread, for hand_over()
+
+
+class Activity:
+    """A builtin's slow operation: `with Activity(console, "Copying file", total=size, unit="bytes"):`."""
+
+    def __init__(self, console, label: str, total: Optional[float] = None, unit: str = "items",
+                 completed: Optional[Callable[[], float]] = None):
+        self.console = console
+        self.label = label
+        self.total = total
+        self.unit = unit  # "items" or "bytes"
+        self.completed = completed
+        self.done = 0.0
+        self._lock = threading.Lock()
+        self._finished = False
+        self._timer: Optional[threading.Timer] = None
+        self._progress = None
+        self._task = None
+        self._previous = None
+
+    def __enter__(self) -> "Activity":
+        self._previous = getattr(_current, "activity", None)
+        _current.activity = self
+        if self.console.is_terminal:
+            self._timer = threading.Timer(SPINNER_DELAY, self._show)
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def __exit__(self, *exc):
+        _current.activity = self._previous
+        self.release()
+        return False
+
+    def advance(self, amount: float = 1):
+        self.done += amount
+        if self._progress is not None:
+            self._progress.update(self._task, completed=self.done)
+
+    def release(self):
+        """Stop showing, for good: the operation is over, or something else now writes to the terminal."""
+        with self._lock:
+            self._finished = True
+            if self._timer is not None:
+                self._timer.cancel()
+            progress, self._progress = self._progress, None
+        if progress is not None:
+            progress.stop()
+            _showing.release()
+
+    def _columns(self):
+        from rich.progress import (BarColumn, DownloadColumn, MofNCompleteColumn, SpinnerColumn, TextColumn,
+                                   TimeRemainingColumn, TransferSpeedColumn)
+        columns = [SpinnerColumn(), TextColumn(f"[bold yellow]{self.label}...[/]")]
+        if self.total:
+            columns += [BarColumn(), DownloadColumn() if self.unit == "bytes" else MofNCompleteColumn()]
+            if self.unit == "bytes":
+                columns.append(TransferSpeedColumn())
+            columns.append(TimeRemainingColumn())
+        return columns
+
+    def _show(self):
+        from rich.progress import Progress
+        with self._lock:
+            if self._finished or not _showing.acquire(blocking=False):
+                return
+            self._progress = Progress(*self._columns(), console=self.console, transient=True)
+            self._task = self._progress.add_task("", total=self.total or None, completed=self.done)
+            self._progress.start()
+        if self.completed is not None:
+            threading.Thread(target=self._poll, name="progress poll", daemon=True).start()
+
+    def _poll(self):
+        while True:
+            with self._lock:
+                if self._progress is None:
+                    return
+                try:
+                    self._progress.update(self._task, completed=self.completed())
+                except OSError:
+                    pass  # The file measured is not there yet
+            time.sleep(POLL_INTERVAL)
+
+
+def hand_over():
+    """Withdraw this thread's Activity: a child process is about to write to the terminal."""
+    activity = getattr(_current, "activity", None)
+    if activity is not None:
+        activity.release()
+
+
+def file_size(path: str) -> Callable[[], float]:
+    """A `completed` callable: the current size of a file being written."""
+    return lambda: os.path.getsize(path)
@@ -0,0 +1,209 @@
+# registry.py
+"""
+Lazy command registry.
+
+Holds the catalog of built-in commands, each declaring its flags and
+positional arguments once, and hands out callable proxies that import a
+command's implementation the first time it runs, so starting the shell does
+not pay for modules (and their dependencies) that are never used.
+"""
+
+import importlib
+import os
+import re
+from typing import Dict, List, NamedTuple, Tuple
+
+class Builtin(NamedTuple):
+    """Declared command line of a builtin: its flags and positional arguments.
+
+    Positional names take a suffix: "name?" is optional, "name*" takes any
+    number of words, "name+" at least one; a bare name is required.
+    """
+    name: str
+    help: str
+    flags: Tuple[str, ...] = ()
+    value_flags: Tuple[str, ...] = ()  # Flags that take the following word as their value
+    args: Tuple[str, ...] = ()
+
+
+BUILTINS = (
+    # File & Directory Operations
+    Builtin("cd", "Change directory: cd <path> and use 'cd ..' to navigate back to the previous directory", args=("path?",)),
+    Builtin("z", "Jump to the most frecent directory matching: z <part> [part ...] (-l lists the matches)", flags=("-l",), args=("part*",)),
+    Builtin("jump", "Same as z: jump to a frequently and recently visited directory", flags=("-l",), args=("part*",)),
+    Builtin("ls", "List files and directories: ls [-l] [-a] [-1] [-N | -S | -t | -U] [-r] [directory]",
+            flags=("-l", "-a", "-1", "-N", "-S", "-t", "-U", "-r"), args=("directory?",)),
+    Builtin("dir", "List files and directories in long format (Windows alternative to 'ls')",
+            flags=("-l", "-a", "-1", "-N", "-S", "-t", "-U", "-r"), args=("directory?",)),
+    Builtin("touch", "Create an empty file: touch <filename>", args=("filename?",)),
+    Builtin("mkdir", "Create a new directory: mkdir <dirname>", args=("dirname?",)),
+    Builtin("rmdir", "Delete a directory: rmdir <dirname>", args=("dirname?",)),
+    Builtin("rm", "Delete a file: rm <filename>", args=("filename?",)),
+    Builtin("rename", "Rename a file or directory: rename <old> <new>", args=("old?", "new?")),
+    Builtin("copy", "Copy a file: copy <source> <destination>", args=("source?", "destination*")),
+    Builtin("move", "Move a file: move <source> <destination>", args=("source?", "destination?")),
+    Builtin("tree", "Display folder structure in tree format: tree [/f] [/a] [-a] [-L n] [-I pattern] [-s] [-J] [directory]",
+            flags=("/f", "/a", "-a", "-L", "-I", "-s", "-J"), value_flags=("-L", "-I"), args=("directory?",)),
+    Builtin("append", "Append text to a file: append <filename> <text>", args=("filename", "text+")),
+
+    # System Information & Management
+    Builtin("whoami", "Display the current user"),
+    Builtin("hostname", "Show the computer’s hostname"),
+    Builtin("systeminfo", "Get detailed system information", args=("section?",)),
+    Builtin("tasklist", "List running processes", flags=("/fi", "/v", "/svc", "/fo", "/nh"), value_flags=("/fi", "/fo")),
+    Builtin("taskkill", "Kill a process by name or PID: taskkill /PID <id> /F", flags=("/PID", "/F", "/IM"), value_flags=("/PID", "/IM")),
+
+    # Networking & IP Management
+    Builtin("ipconfig", "Show network configuration", flags=("/all", "/release", "/renew"), args=("adapter?",)),
+    Builtin("ping", "Test network connectivity: ping <host>", flags=("-t", "-n", "-l", "-w", "-4", "-6"), value_flags=("-n", "-l", "-w"), args=("host?",)),
+    Builtin("tracert", "Trace the route packets take to a destination", args=("destination?",)),
+    Builtin("netstat", "Display active network connections", flags=("-a", "-b", "-e", "-n", "-o", "-p", "-r", "-s"), value_flags=("-p",), args=("interval?",)),
+    Builtin("nslookup", "Get DNS information for a domain: nslookup <domain>", flags=("-querytype", "-timeout", "-debug", "-retry"), args=("domain?", "server?")),
+
+    # Disk & Storage Commands
+    Builtin("diskpart", "Manage disk partitions", flags=("/s",), value_flags=("/s",)),
+    Builtin("chkdsk", "Check disk for errors", flags=("/f", "/r", "/x"), args=("volume?",)),
+    Builtin("wmic", "Windows Management Instrumentation Command-line: wmic logical disk get", flags=("/output",), args=("query*",)),
+
+    # Shell & Exit Commands
+    Builtin("which", "Locate a command: which [-a] <name> (-a lists every match on PATH)", flags=("-a",), args=("name+",)),
+    Builtin("history", "Search past commands from every session: history [-f] [-d] [-x] [-s <status>] [-n <count>] [-a] [-c] [text]",
+            flags=("-f", "-d", "-x", "-s", "-n", "-a", "-c"), value_flags=("-s", "-n"), args=("text*",)),
+    Builtin("last", "Show an earlier command's output again without re-running it: last [n] [-l] [-f <text>]",
+            flags=("-l", "-f"), value_flags=("-f",), args=("n?",)),
+    Builtin("parallel", "Run a command for many items at once: parallel [-j n] [-r retries] [-f file | -g glob] <command ...>",
+            args=("command+",)),  # Its options come before the command, whose own flags are not checked
+    Builtin("jobs", "List background jobs; end a line with & to start one"),
+    Builtin("fg", "Bring a background job to the foreground and follow its output: fg [%n]", args=("job?",)),
+    Builtin("bg", "Resume a stopped background job: bg [%n]", args=("job?",)),
+    Builtin("kill", "End or pause background jobs or processes: kill [-9] [-STOP] [-CONT] <%n|pid>...",
+            flags=("-9", "-STOP", "-CONT"), args=("job+",)),
+    Builtin("wait", "Wait for background jobs to finish: wait [%n...]", args=("job*",)),
+    Builtin("time", "Report a command's time, CPU, peak memory and I/O: time <command ...> | time -on | time -off",
+            args=("command*",)),  # Like parallel, the timed command's own flags are not checked
+    Builtin("profile", "Run a command at low priority or with limits: profile <name> <command ...>; profile lists them",
+            args=("command*",)),  # The profiled command's own flags are not checked
+    Builtin("exit", "Exit the shell"),
+    Builtin("help", "Show available commands or details for a specific command using '<command> --help'.", args=("command?",)),
+    Builtin("undo", "Undo the last command: undo [count] reverts the last count commands", args=("count?",)),
+    Builtin("redo", "Redo what undo reverted: redo [count]", args=("count?",)),
+    Builtin("ask", "Ask the CLI assistant a question about commands or usage. Type 'ask' to start."),
+)
+
+COMMANDS = {builtin.name: builtin.help for builtin in BUILTINS}
+
+FLAG_SYNTAX = re.compile(r"^[-/][a-zA-Z0-9]+$")
+
+
+class CompiledCommand:
+    """A Builtin resolved to its handler, with its argument schema precomputed for dispatch."""
+
+    __slots__ = ("name", "method", "flags", "value_flags", "prefixes", "min_args", "max_args", "usage", "_flag_index")
+
+    def __init__(self, builtin: Builtin, method):
+        self.name = builtin.name
+        self.method = method
+        self.flags = frozenset(builtin.flags)
+        self.value_flags = frozenset(builtin.value_flags)
+        self.prefixes = frozenset(flag[0] for flag in builtin.flags)
+        self.min_args = sum(1 for arg in builtin.args if arg[-1] not in "?*")
+        self.max_args = None if any(arg[-1] in "*+" for arg in builtin.args) else len(builtin.args)
+        self.usage = " ".join([builtin.name]
+                              + [f"[{flag} <value>]" if flag in self.value_flags else f"[{flag}]" for flag in builtin.flags]
+                              + [_usage_word(arg) for arg in builtin.args])
+        self._flag_index = None
+
+    def is_flag(self, word: str) -> bool:
+        """True if `word` should be read as a flag of this command rather than a positional argument."""
+        if not word or word[0] not in self.prefixes:
+            return False
+        if word[0] == "/" and (not FLAG_SYNTAX.match(word) or os.path.exists(word)):
+            return False  # An absolute path such as /tmp/x, not a /switch
+        return True
+
+    def scan(self, argv: List[str]):
+        """Return (unknown flags, malformed flag or None, positional count) for argv."""
+        unknown, positional = [], 0
+        takes_value = False
+        for word in argv:
+            if takes_value:
+                takes_value = False
+                continue
+            if not self.is_flag(word):
+                positional += 1
+            elif not FLAG_SYNTAX.match(word):
+                return unknown, word, positional
+            elif word in self.flags:
+                takes_value = word in self.value_flags
+            else:
+                unknown.append(word)
+        return unknown, None, positional
+
+    def suggest_flag(self, flag: str) -> List[str]:
+        """Declared flags closest to a mistyped one, best first."""
+        if self._flag_index is None:
+            from suggest import SuggestionIndex
+            self._flag_index = SuggestionIndex(self.flags)
+        return self._flag_index.suggest(flag, limit=1)
+
+    def accepts(self, count: int) -> bool:
+        return count >= self.min_args and (self.max_args is None or count <= self.max_args)
+
+
+def _usage_word(arg: str) -> str:
+    if arg[-1] == "?":
+        return f"[{arg[:-1]}]"
+    if arg[-1] == "*":
+        return f"[{arg[:-1]}...]"
+    if arg[-1] == "+":
+        return f"<{arg[:-1]}>..."
+    return f"<{arg}>"
+
+
+def compile_dispatch(owner) -> Dict[str, CompiledCommand]:
+    """Map each builtin name to its compiled entry, binding the `do_<name>` handler of `owner` once."""
+    return {builtin.name: CompiledCommand(builtin, getattr(owner, f"do_{builtin.name}")) for builtin in BUILTINS}
+
+# cmd.exe internals that have no executable on PATH but still run through the system shell
+SHELL_INTERNALS = {"cls", "help", "exit", "cd", "dir", "copy", "del", "mkdir", "rmdir", "echo", "type"}
+
+
+class LazyCommand:
+    """Callable proxy that imports its implementation on first call."""
+
+    def __init__(self, module: str, name: str):
+        self.module = module
+        self.name = name
+        self._func = None
+
+    def load(self):
+        """Import the implementation (once) and return it."""
+        if self._func is None:
+            self._func = getattr(importlib.import_module(self.module), self.name)
+        return self._func
+
+    @property
+    def loaded(self) -> bool:
+        return self._func is not None
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "deferred"
+        return f"<LazyCommand {self.module}.{self.name} ({state})>"
+
+
+_lazy_commands = []
+
+
+def lazy_import(module: str, *names: str):
+    """Return a LazyCommand for each name, in order, without importing the module."""
+    commands = tuple(LazyCommand(module, name) for name in names)
+    _lazy_commands.extend(commands)
+    return commands
+
+
+def lazy_commands():
+    """Every proxy handed out by lazy_import, e.g. to load them all up front."""
+    return list(_lazy_commands)
@@ -0,0 +1,220 @@
+# scrollback.py
+"""
+Scrollback: the output of the last commands, kept so `last` can show or grep
+it again without re-running them.
+
+While a line runs, sys.stdout and sys.stderr are wrapped so everything written
+through them is also appended to that line's entry: builtins printing through
+Rich, and system commands whose output the pump writes to the binary buffers.
+Output is stored as written, colours included. text() strips the escape
+codes and spinner redraws for searching.
+
+Entries live in a ring of at most MAX_COMMANDS. Their bytes are kept in memory
+up to MEMORY_CAP in total. Past that, the oldest entries' bytes move to a spill
+file, an anonymous temporary file that is read back through mmap. The spill
+file is bounded too (SPILL_CAP): the oldest entries are dropped to make room,
+and a single command's output beyond it is cut off. Space freed in the spill
+file is reclaimed by rewriting it once most of it is dead.
+"""
+
+import mmap
+import re
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+MAX_COMMANDS = 100
+MEMORY_CAP = 16 * 1024 * 1024
+SPILL_CAP = 512 * 1024 * 1024
+COMPACT_MIN = 4 * 1024 * 1024  # Never rewrite a spill file smaller than this
+
+ESCAPES = re.compile(r"\x1b\[[0-?]*[ -/]*[@-~]|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)|\x1b[@-Z\\-_]")
+
+
+class Entry:
+    """One command line's captured output."""
+
+    __slots__ = ("command", "started", "status", "chunks", "memory", "spilled", "size", "truncated")
+
+    def __init__(self, command: str):
+        self.command = command
+        self.started = time.time()
+        self.status: Optional[int] = None  # None while the line is running
+        self.chunks: List[bytes] = []  # In memory, after whatever was spilled
+        self.memory = 0
+        self.spilled: List[Tuple[int, int]] = []  # (offset, length) in the spill file, oldest first
+        self.size = 0
+        self.truncated = False
+
+
+def plain(data: bytes) -> str:
+    """Captured bytes as the text a user saw: escape codes removed, overwritten (\\r) line parts dropped."""
+    text = ESCAPES.sub("", data.decode("utf-8", "replace"))
+    return "\n".join(line.rsplit("\r", 1)[-1] for line in text.split("\n"))
+
+
+class Scrollback:
+    """Ring buffer of command output, bounded in memory and spilled to a memory-mapped file."""
+
+    def __init__(self, max_commands: int = MAX_COMMANDS, memory_cap: int = MEMORY_CAP, spill_cap: int = SPILL_CAP):
+        self.max_commands = max_commands
+        self.memory_cap = memory_cap
+        self.spill_cap = spill_cap
+        self.entries: List[Entry] = []  # Oldest first
+        self.memory = 0
+        self._spill = None
+        self._spill_end = 0  # Bytes written to the spill file
+        self._spill_live = 0  # Bytes of it still referenced by entries
+        self._map: Optional[mmap.mmap] = None
+
+    # Capturing
+
+    def begin(self, command: str) -> Entry:
+        entry = Entry(command)
+        self.entries.append(entry)
+        while len(self.entries) > self.max_commands:
+            self._drop(self.entries[0])
+        return entry
+
+    def write(self, entry: Entry, data: bytes):
+        if not data or entry.truncated:
+            return
+        if entry.size + len(data) > self.spill_cap:
+            data = data[:self.spill_cap - entry.size]
+            entry.truncated = True
+        entry.chunks.append(data)
+        entry.memory += len(data)
+        entry.size += len(data)
+        self.memory += len(data)
+        if self.memory > self.memory_cap:
+            self._spill_oldest()
+
+    @contextmanager
+    def capture(self, command: str):
+        """Record what the standard streams receive while the block runs; yields the Entry."""
+        entry = self.begin(command)
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = TeeStream(stdout, self, entry), TeeStream(stderr, self, entry)
+        try:
+            yield entry
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            sys.stdout, sys.stderr = stdout, stderr
+
+    # Reading
+
+    def recent(self, n: int = 1) -> Optional[Entry]:
+        """The n-th most recent finished entry (1 is the last one)."""
+        finished = [entry for entry in self.entries if entry.status is not None]
+        return finished[-n] if 0 < n <= len(finished) else None
+
+    def output(self, entry: Entry) -> bytes:
+        parts = []
+        if entry.spilled:
+            view = self._mapped()
+            parts.extend(view[offset:offset + length] for offset, length in entry.spilled)
+        parts.extend(entry.chunks)
+        return b"".join(parts)
+
+    def text(self, entry: Entry) -> str:
+        return plain(self.output(entry))
+
+    # Spilling
+
+    def _spill_oldest(self):
+        """Move in-memory output to the spill file, oldest entries first, until under the memory cap."""
+        for entry in list(self.entries):
+            if self.memory <= self.memory_cap:
+                return
+            if entry.memory:
+                self._spill_entry(entry)
+
+    def _spill_entry(self, entry: Entry):
+        data = b"".join(entry.chunks)
+        while self._spill_live + len(data) > self.spill_cap and self.entries[0] is not entry:
+            self._drop(self.entries[0])
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile(prefix="mycli-scrollback-")
+        self._maybe_compact()
+        self._spill.seek(self._spill_end)
+        self._spill.write(data)
+        entry.spilled.append((self._spill_end, len(data)))
+        self._spill_end += len(data)
+        self._spill_live += len(data)
+        self.memory -= entry.memory
+        entry.chunks, entry.memory = [], 0
+
+    def _drop(self, entry: Entry):
+        self.entries.remove(entry)
+        self.memory -= entry.memory
+        self._spill_live -= sum(length for _, length in entry.spilled)
+
+    def _maybe_compact(self):
+        """Rewrite the spill file with only live output once most of it is dead."""
+        if not self._spill_end or self._spill_end < COMPACT_MIN or self._spill_end <= 2 * self._spill_live:
+            return
+        view = self._mapped()
+        fresh = tempfile.TemporaryFile(prefix="mycli-scrollback-")
+        offset = 0
+        for entry in self.entries:
+            moved = []
+            for start, length in entry.spilled:
+                fresh.write(view[start:start + length])
+                moved.append((offset, length))
+                offset += length
+            entry.spilled = moved
+        self._close_map()
+        self._spill.close()
+        self._spill, self._spill_end, self._spill_live = fresh, offset, offset
+
+    def _mapped(self) -> mmap.mmap:
+        if self._map is None or len(self._map) != self._spill_end:
+            self._close_map()
+            self._spill.flush()
+            self._map = mmap.mmap(self._spill.fileno(), self._spill_end, access=mmap.ACCESS_READ)
+        return self._map
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def close(self):
+        self._close_map()
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+
+
+class TeeStream:
+    """Stands in for sys.stdout or sys.stderr: writes go through and into a scrollback entry."""
+
+    def __init__(self, stream, scrollback: Scrollback, entry: Entry):
+        self._stream = stream
+        self._scrollback = scrollback
+        self._entry = entry
+        self.buffer = _TeeBuffer(getattr(stream, "buffer", None), scrollback, entry) if hasattr(stream, "buffer") else None
+
+    def write(self, text: str) -> int:
+        self._scrollback.write(self._entry, text.encode("utf-8", "replace"))
+        return self._stream.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class _TeeBuffer:
+    def __init__(self, buffer, scrollback: Scrollback, entry: Entry):
+        self._buffer = buffer
+        self._scrollback = scrollback
+        self._entry = entry
+
+    def write(self, data: bytes) -> int:
+        self._scrollback.write(self._entry, bytes(data))
+        return self._buffer.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._buffer, name)
@@ -0,0 +1,107 @@
+# spawn.py
+"""
+Starting external commands without a shell.
+
+A command normally runs from its argv list. The program's path comes from the
+PATH index (ExecutableIndex, cached on disk and re-statted at most once a
+second), so there is no `sh -c` or `cmd.exe /c` process in between and no
+re-quoting of arguments that were already split. With a full executable path
+and close_fds=False, subprocess starts the child with posix_spawn where the
+platform has it (Linux with glibc, macOS) instead of fork + exec. File
+descriptors are created non-inheritable (PEP 446), so not closing them in the
+child leaks nothing.
+
+Only a line that needs a shell goes through one. That means the operators the
+shell itself does not take (`;`, `&&`, `<`, `2>`), variables, command
+substitution, globs and `~` on POSIX, `%VAR%` and `^` on Windows, cmd.exe
+internals, and batch files.
+"""
+
+import os
+import subprocess
+from typing import List, Optional
+
+from registry import SHELL_INTERNALS
+
+POSIX_OPERATORS = set(";&|<>()`$*?[\n")
+WINDOWS_OPERATORS = set("&|<>^%\n")
+WINDOWS_SCRIPTS = (".bat", ".cmd")
+
+
+def needs_shell(line: str) -> bool:
+    """True if running `line` takes a shell: it uses syntax that splitting it into words would lose."""
+    if os.name == "nt":
+        words = line.split()
+        if words and words[0].lower() in SHELL_INTERNALS:
+            return True
+        # cmd.exe expands %VAR% even inside double quotes, so only ^ & | < > are protected by them
+        quoted = False
+        for char in line:
+            if char == '"':
+                quoted = not quoted
+            elif char == "%" or (char in WINDOWS_OPERATORS and not quoted):
+                return True
+        return False
+
+    quote, word_start, words_before = None, True, 0
+    for char in line:
+        if quote == "'":
+            quote = None if char == "'" else quote
+            continue
+        if quote == '"':
+            if char in "$`":
+                return True  # Expanded inside double quotes too
+            quote = None if char == '"' else quote
+            continue
+        if char in " \t":
+            words_before += not word_start
+            word_start = True
+            continue
+        if char in "'\"":
+            quote = char
+        elif char in POSIX_OPERATORS:
+            return True
+        elif word_start and char in "~#":
+            return True  # Home directory, or a comment
+        elif char == "=" and not words_before:
+            return True  # VAR=value command
+        word_start = False
+    return False
+
+
+def resolve(executables, name: str) -> str:
+    """Full path of the program `name` runs; raises FileNotFoundError if there is none."""
+    if os.path.dirname(name):
+        if not os.path.exists(name):
+            raise FileNotFoundError(name)
+        return os.path.abspath(name)
+    path = executables.resolve(name)
+    if path is None:
+        raise FileNotFoundError(name)
+    return path
+
+
+def direct_options(executables, argv: List[str]) -> dict:
+    """Popen keyword arguments that execute argv[0] from its resolved path (by posix_spawn where possible)."""
+    options = {"executable": resolve(executables, argv[0])}
+    if os.name != "nt":
+        options["close_fds"] = False
+    return options
+
+
+def spawn(executables, cmd: str, args: List[str], line: Optional[str] = None, **options) -> subprocess.Popen:
+    """Start `cmd args` directly, or through the system shell when `line`, the text they were split from, needs one."""
+    words = [cmd] + args
+    if line is not None:
+        use_shell, shell_text = needs_shell(line), line.strip()
+    else:
+        # Already split words carry no shell syntax of their own; only cmd.exe internals need it
+        use_shell = os.name == "nt" and cmd.lower() in SHELL_INTERNALS
+        shell_text = subprocess.list2cmdline(words)
+    if not use_shell:
+        direct = direct_options(executables, words)
+        if os.name == "nt" and direct["executable"].lower().endswith(WINDOWS_SCRIPTS):
+            use_shell = True  # CreateProcess cannot run batch files; cmd.exe does
+        else:
+            return subprocess.Popen(words, **direct, **options)
+    return subprocess.Popen(shell_text, shell=True, **options)
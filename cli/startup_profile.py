@@ -0,0 +1,143 @@
+# startup_profile.py
+"""
+Import-time profiler for the `--startup-profile` switch.
+
+`enable()` has to run before the heavy imports in main.py, so main checks
+sys.argv for the flag itself and turns profiling on ahead of typer parsing.
+Timing is collected by handing each module a spec copy whose loader is a
+timing proxy around the real one, which gives both cumulative and self time
+per module (the same numbers `-X importtime` reports) without re-executing the
+interpreter.
+"""
+
+import copy
+import sys
+import time
+from importlib.abc import MetaPathFinder
+
+_start = None
+_records = {}   # module name -> [self_time, cumulative_time]
+_stack = []     # [name, started_at, time_spent_in_children]
+_phases = []    # (label, seconds since enable)
+
+
+class _TimingLoader:
+    """Wraps a module's loader so exec_module is timed; everything else is delegated.
+
+    Loaders such as zipimporter or PyInstaller's frozen importer are shared by
+    many modules, so the original loader is never modified.
+    """
+
+    def __init__(self, loader, fullname):
+        self._loader = loader
+        self._fullname = fullname
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        create_module = getattr(self._loader, "create_module", None)
+        return create_module(spec) if create_module is not None else None
+
+    def exec_module(self, module):
+        _stack.append([self._fullname, time.perf_counter(), 0.0])
+        try:
+            self._loader.exec_module(module)
+        finally:
+            name, started, children = _stack.pop()
+            elapsed = time.perf_counter() - started
+            _records[name] = [elapsed - children, elapsed]
+            if _stack:
+                _stack[-1][2] += elapsed
+
+
+class _TimingFinder(MetaPathFinder):
+    """Meta path hook that times the execution of every module it sees."""
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self:
+                continue
+            find_spec = getattr(finder, "find_spec", None)
+            if find_spec is None:
+                continue
+            spec = find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+
+        loader = spec.loader
+        # Built-in and frozen importers are classes shared by every module; they are cheap anyway
+        if (loader is None or isinstance(loader, (type, _TimingLoader))
+                or not hasattr(loader, "exec_module")):
+            return spec
+
+        spec = copy.copy(spec)
+        spec.loader = _TimingLoader(loader, fullname)
+        return spec
+
+
+def enable():
+    """Start recording import times."""
+    global _start
+    if _start is not None:
+        return
+    _start = time.perf_counter()
+    sys.meta_path.insert(0, _TimingFinder())
+
+
+def enabled() -> bool:
+    return _start is not None
+
+
+def mark(label: str):
+    """Record a startup phase boundary (e.g. 'imports done', 'shell ready')."""
+    if _start is not None:
+        _phases.append((label, time.perf_counter() - _start))
+
+
+def summary(top: int = 15):
+    """Return (packages, modules, phases) sorted by cost, times in milliseconds."""
+    packages = {}
+    for name, (self_time, _) in _records.items():
+        root = name.split(".")[0]
+        packages[root] = packages.get(root, 0.0) + self_time
+
+    by_package = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    by_module = sorted(_records.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    return (
+        [(name, ms * 1000) for name, ms in by_package],
+        [(name, self_time * 1000, cumulative * 1000) for name, (self_time, cumulative) in by_module],
+        [(label, at * 1000) for label, at in _phases],
+    )
+
+
+def report(console, top: int = 15):
+    """Print the import-time breakdown as Rich tables."""
+    from rich.table import Table
+
+    packages, modules, phases = summary(top)
+
+    phase_table = Table(title="⏱️ Startup Phases", header_style="bold cyan")
+    phase_table.add_column("Phase", style="bold magenta")
+    phase_table.add_column("At (ms)", justify="right", style="bold green")
+    for label, at in phases:
+        phase_table.add_row(label, f"{at:.1f}")
+
+    package_table = Table(title="📦 Import Time by Package", header_style="bold cyan")
+    package_table.add_column("Package", style="bold magenta")
+    package_table.add_column("Self (ms)", justify="right", style="bold green")
+    for name, ms in packages:
+        package_table.add_row(name, f"{ms:.1f}")
+
+    module_table = Table(title="🐢 Slowest Modules", header_style="bold cyan")
+    module_table.add_column("Module", style="bold magenta")
+    module_table.add_column("Self (ms)", justify="right", style="bold green")
+    module_table.add_column("Cumulative (ms)", justify="right", style="bold yellow")
+    for name, self_ms, cumulative_ms in modules:
+        module_table.add_row(name, f"{self_ms:.1f}", f"{cumulative_ms:.1f}")
+
+    console.print(phase_table)
+    console.print(package_table)
+    console.print(module_table)
@@ -0,0 +1,180 @@
+# suggest.py
+"""
+Fuzzy "Did you mean" suggestions over builtins, PATH executables and flags.
+
+Names are indexed by their padded character bigrams ("^g", "gi", "it", "t$"
+for "git"). A lookup counts shared bigrams through the inverted index, which is a
+handful of C-level set iterations, keeps the names that share enough of them
+to be within the edit-distance budget, and computes the exact (banded) distance
+only for the VERIFY_LIMIT that share the most. Adding or removing a name only touches that name's postings, so the
+index follows the PATH index without being rebuilt.
+"""
+
+import heapq
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+VERIFY_LIMIT = 40  # Most candidates whose exact distance is computed per lookup
+
+
+def bigrams(word: str) -> Set[str]:
+    padded = f"^{word.lower()}$"
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+def default_max_distance(word: str) -> int:
+    """Edits tolerated for a typo: one for short names, two otherwise."""
+    return 1 if len(word) <= 4 else 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (transpositions count as one edit).
+
+    Only the diagonal band |i - j| <= limit is computed, and the result is
+    capped at limit + 1 (returned as soon as the distance must exceed `limit`).
+    """
+    n, m = len(a), len(b)
+    cap = limit + 1
+    if abs(n - m) > limit:
+        return cap
+    previous2 = None
+    previous = [j if j <= limit else cap for j in range(m + 1)]
+    for i in range(1, n + 1):
+        current = [cap] * (m + 1)
+        if i <= limit:
+            current[0] = i
+        row_min = current[0]
+        ca = a[i - 1]
+        for j in range(max(1, i - limit), min(m, i + limit) + 1):
+            cb = b[j - 1]
+            value = previous[j - 1] + (ca != cb)
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if previous2 is not None and j > 1 and ca == b[j - 2] and a[i - 2] == cb and previous2[j - 2] + 1 < value:
+                value = previous2[j - 2] + 1
+            current[j] = value if value < cap else cap
+            if value < row_min:
+                row_min = value
+        if row_min > limit:
+            return cap
+        previous2, previous = previous, current
+    return previous[m]
+
+
+class SuggestionIndex:
+    """Bigram inverted index answering ranked nearest-name queries.
+
+    Matching ignores case, so '/pid' finds '/PID' and 'LS' finds 'ls'.
+    """
+
+    def __init__(self, words: Iterable[str] = ()):
+        self._postings: Dict[str, Set[str]] = {}
+        self._grams: Dict[str, Set[str]] = {}
+        self._by_length: Dict[int, Set[str]] = {}
+        self._source = None  # Last list passed to sync(), to skip unchanged sources
+        self.update(words)
+
+    def __len__(self) -> int:
+        return len(self._grams)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._grams
+
+    def add(self, word: str):
+        if not word or word in self._grams:
+            return
+        grams = bigrams(word)
+        self._grams[word] = grams
+        self._by_length.setdefault(len(word), set()).add(word)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(word)
+
+    def discard(self, word: str):
+        grams = self._grams.pop(word, None)
+        if grams is None:
+            return
+        self._by_length[len(word)].discard(word)
+        for gram in grams:
+            posting = self._postings[gram]
+            posting.discard(word)
+            if not posting:
+                del self._postings[gram]
+
+    def update(self, words: Iterable[str]):
+        for word in words:
+            self.add(word)
+
+    def sync(self, words: List[str]):
+        """Make the index hold exactly `words`, adding and removing only the difference.
+
+        Passing the same list object again (ExecutableIndex.names() returns the
+        same list until PATH changes) costs nothing.
+        """
+        if words is self._source:
+            return
+        wanted = set(words)
+        current = set(self._grams)
+        for word in current - wanted:
+            self.discard(word)
+        for word in wanted - current:
+            self.add(word)
+        self._source = words
+
+    def matches(self, word: str, max_distance: Optional[int] = None) -> List[Tuple[int, str]]:
+        """(distance, name) pairs within `max_distance` edits, best first."""
+        if max_distance is None:
+            max_distance = default_max_distance(word)
+        query = word.lower()
+        grams = bigrams(word)
+
+        shared = Counter()
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting:
+                shared.update(posting)
+
+        # Each edit destroys at most three of the query's bigrams (a transposition)
+        needed = len(grams) - 3 * max_distance
+        low, high = len(query) - max_distance, len(query) + max_distance
+        candidates = [(count, name) for name, count in shared.items()
+                      if count >= needed and low <= len(name) <= high]
+        if len(query) <= 2:
+            # Names this short can be one edit away without sharing a single bigram
+            for length in range(max(low, 1), high + 1):
+                candidates.extend((0, name) for name in self._by_length.get(length, ()) if name not in shared)
+        if len(candidates) > VERIFY_LIMIT:
+            # The best matches share the most bigrams; only those are worth an exact distance
+            candidates = heapq.nlargest(VERIFY_LIMIT, candidates)
+
+        scored = []
+        for count, name in candidates:
+            distance = edit_distance(query, name.lower(), max_distance)
+            if distance <= max_distance:
+                scored.append((distance, -count, name))
+        scored.sort()
+        return [(distance, name) for distance, _, name in scored]
+
+    def suggest(self, word: str, limit: int = 3, max_distance: Optional[int] = None) -> List[str]:
+        """The `limit` closest names, best first."""
+        return [name for _, name in self.matches(word, max_distance)[:limit]]
+
+
+class CommandSuggester:
+    """Suggestions for a mistyped command: builtins win ties against PATH executables."""
+
+    def __init__(self, builtins: Iterable[str], executables=None):
+        self.builtins = SuggestionIndex(builtins)
+        self.programs = SuggestionIndex()
+        self.executables = executables  # ExecutableIndex, synced before each lookup
+
+    def suggest(self, word: str, limit: int = 3) -> List[str]:
+        if self.executables is not None:
+            self.programs.sync(self.executables.names())
+        scored = [(distance, 0, name) for distance, name in self.builtins.matches(word)]
+        scored += [(distance, 1, name) for distance, name in self.programs.matches(word)
+                   if name not in self.builtins]
+        scored.sort()
+        return [name for _, _, name in scored[:limit]]
@@ -0,0 +1,250 @@
+# trash.py
+"""
+Per-filesystem trash for undoable deletes.
+
+Deleting a file or directory is a single rename into a trash area on the
+same filesystem, so it costs the same for a 50 GB build tree as for an empty
+file, and undo renames it back. Each filesystem gets its own area, because
+a rename cannot cross filesystems:
+
+    <state dir>/trash                   when the path is on the state dir's filesystem
+    <mount point>/.mycli-trash-<user>   otherwise (like XDG's .Trash-<uid>)
+
+If neither can be used (read-only mount root, for instance), move() returns
+None and the caller falls back to a copy.
+
+Items are named "<time_ns>-<random>-<name>", so the oldest sort first. A
+background purger keeps each area under MYCLI_TRASH_QUOTA bytes by deleting
+the oldest items. Items whose undo record is evicted or discarded are deleted
+at once.
+
+Each item's size is kept next to it in a hidden file, ".<item name>.size".
+A file's is written when it is trashed; a directory's is added up by the
+first purge that sees it. Items never change, so no purge walks a trashed
+tree twice, whichever process (or Trash instance) runs it.
+"""
+
+import getpass
+import os
+import shutil
+import stat
+import threading
+import time
+from typing import Dict, List, Optional
+
+from appdata import data_path, read_json, write_json_atomic
+
+DEFAULT_QUOTA = 20 * 1024 ** 3
+
+
+def trash_quota() -> int:
+    try:
+        return int(os.environ["MYCLI_TRASH_QUOTA"])
+    except (KeyError, ValueError):
+        return DEFAULT_QUOTA
+
+
+def _user() -> str:
+    if hasattr(os, "getuid"):
+        return str(os.getuid())
+    try:
+        return getpass.getuser()
+    except Exception:
+        return "user"
+
+
+def mount_point(path: str) -> str:
+    """Topmost directory above `path` that is still on the same filesystem."""
+    path = os.path.abspath(path)
+    device = os.stat(path).st_dev
+    while True:
+        parent = os.path.dirname(path)
+        if parent == path:
+            return path
+        try:
+            if os.stat(parent).st_dev != device:
+                return path
+        except OSError:
+            return path
+        path = parent
+
+
+def delete_path(path: str):
+    """Remove a file, link or directory tree for good."""
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _size_file(item: str) -> str:
+    directory, name = os.path.split(item)
+    return os.path.join(directory, f".{name}.size")
+
+
+def _recorded_size(item: str) -> Optional[int]:
+    try:
+        with open(_size_file(item)) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _record_size(item: str, size: int):
+    try:
+        with open(_size_file(item), "w") as f:
+            f.write(str(size))
+    except OSError:
+        pass  # Added up again by the next purge
+
+
+def _forget_size(item: str):
+    try:
+        os.remove(_size_file(item))
+    except OSError:
+        pass
+
+
+def _tree_size(path: str) -> int:
+    if not os.path.isdir(path) or os.path.islink(path):
+        try:
+            return os.lstat(path).st_size
+        except OSError:
+            return 0
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class Trash:
+    """Trash areas, one per filesystem, with a quota enforced in the background."""
+
+    def __init__(self, quota: Optional[int] = None):
+        self.quota = trash_quota() if quota is None else quota
+        self.home = data_path("trash")
+        self._areas_file = data_path("trash_areas.json")
+        self._area_by_device: Dict[int, Optional[str]] = {}
+        self._purging = threading.Lock()
+
+    def areas(self) -> List[str]:
+        """Every trash area in use, the state directory's first."""
+        areas = [self.home] + [area for area in read_json(self._areas_file, []) if area != self.home]
+        return [area for area in areas if os.path.isdir(area)]
+
+    def area_for(self, path: str) -> Optional[str]:
+        """The trash area on `path`'s filesystem, created if needed; None if there can be none."""
+        device = os.lstat(path).st_dev
+        area = self._area_by_device.get(device)
+        if area is None or not os.path.isdir(area):
+            area = self._area_by_device[device] = self._find_area(path, device)
+        return area
+
+    def _find_area(self, path: str, device: int) -> Optional[str]:
+        os.makedirs(self.home, exist_ok=True)
+        if os.stat(self.home).st_dev == device:
+            return self.home
+        area = os.path.join(mount_point(os.path.dirname(os.path.abspath(path))), f".mycli-trash-{_user()}")
+        try:
+            os.makedirs(area, exist_ok=True)
+            if os.stat(area).st_dev != device:
+                return None
+        except OSError:
+            return None
+        known = read_json(self._areas_file, [])
+        if area not in known:
+            write_json_atomic(self._areas_file, known + [area])
+        return area
+
+    def move(self, path: str, purge: bool = True) -> Optional[str]:
+        """Rename `path` into its filesystem's trash; returns the item, or None if no trash is usable.
+
+        Pass purge=False when trashing many paths in a row, then purge once.
+        """
+        try:
+            area = self.area_for(path)
+        except OSError:
+            return None
+        if area is None:
+            return None
+        name = os.path.basename(os.path.normpath(path))
+        item = os.path.join(area, f"{time.time_ns()}-{os.urandom(4).hex()}-{name}")
+        try:
+            info = os.lstat(path)
+            os.rename(path, item)
+        except OSError:
+            return None  # e.g. a bind mount that looked like the same device
+        if not stat.S_ISDIR(info.st_mode):
+            _record_size(item, info.st_size)  # A directory's is added up by the purge, off this thread
+        if purge:
+            self.purge_in_background()
+        return item
+
+    def restore(self, item: str, original: str):
+        """Rename a trashed item back; refuses to overwrite something created at the same path since."""
+        if not os.path.lexists(item):
+            raise FileNotFoundError(f"'{original}' is no longer in the trash (purged to stay under the quota)")
+        if os.path.lexists(original):
+            raise FileExistsError(f"'{original}' exists again; move it away first")
+        os.rename(item, original)
+        _forget_size(item)
+
+    def discard(self, items: List[str]):
+        """Delete trashed items nobody can restore any more, without waiting for it."""
+        items = [item for item in items if os.path.lexists(item)]
+        if items:
+            threading.Thread(target=lambda: [self._delete(item) for item in items],
+                             name="trash discard", daemon=True).start()
+
+    @staticmethod
+    def _delete(item: str):
+        delete_path(item)
+        _forget_size(item)
+
+    @staticmethod
+    def size_of(item: str) -> int:
+        """Bytes in a trashed item: recorded when it was trashed, or added up once and recorded."""
+        size = _recorded_size(item)
+        if size is None:
+            size = _tree_size(item)
+            _record_size(item, size)
+        return size
+
+    def purge_in_background(self):
+        if self._purging.locked():
+            return  # The running purge will see this item too, or the next one will
+        threading.Thread(target=self.purge, name="trash purge", daemon=True).start()
+
+    def purge(self) -> int:
+        """Delete the oldest items of each area until it is under the quota; returns items deleted."""
+        if not self._purging.acquire(blocking=False):
+            return 0  # Another purge is already running
+        try:
+            deleted = 0
+            for area in self.areas():
+                try:
+                    names = os.listdir(area)
+                except OSError:
+                    continue
+                items = sorted(os.path.join(area, name) for name in names if not name.startswith("."))
+                for stale in {name for name in names if name.endswith(".size")} - \
+                        {os.path.basename(_size_file(item)) for item in items}:
+                    _forget_size(os.path.join(area, stale[1:-len(".size")]))  # Its item was removed by hand
+                sizes = [self.size_of(item) for item in items]
+                total = sum(sizes)
+                for item, size in zip(items, sizes):
+                    if total <= self.quota:
+                        break
+                    self._delete(item)
+                    total -= size
+                    deleted += 1
+            return deleted
+        finally:
+            self._purging.release()
@@ -0,0 +1,296 @@
+# treewalk.py
+"""
+The native engine behind `tree`: a directory tree drawn as it is walked.
+
+    /f          show files, not only directories
+    /a          draw with ASCII characters (+---, \\---, |) instead of box drawing
+    -a          include hidden entries
+    -L n        descend at most n levels
+    -I pattern  leave out names matching a glob pattern; several as "a|b" or
+                repeated -I
+    -s          show sizes, each directory's being the total of everything
+                under it
+    -J          print the tree as JSON instead (the layout of tree -J)
+
+The tree is drawn depth first, each directory's entries in natural name order
+(the listing engine's). Directories are read with os.scandir by a pool of
+worker threads: when a directory is read, its subdirectories are queued for
+the pool, so by the time the drawing reaches one its entries are usually
+there. At most PREFETCH_PER_WORKER listings per worker are read ahead, so a
+tree with millions of files is drawn as it goes, in bounded memory. Only
+the largest single directory has to be held whole, to be sorted.
+
+A directory's total size is only known once everything under it has been
+read, so with -s the whole tree is read first (by the same pool), keeping one
+number per directory. The drawing starts after that.
+"""
+
+import fnmatch
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from listing import natural_key
+
+DEFAULT_WORKERS = min(8, (os.cpu_count() or 2) * 2)  # Override with MYCLI_TREE_WORKERS
+PREFETCH_PER_WORKER = 8
+WRITE_SIZE = 64 * 1024
+
+UNICODE = ("├── ", "└── ", "│   ", "    ")
+ASCII = ("+---", "\\---", "|   ", "    ")
+
+
+class TreeError(Exception):
+    """The tree command line is unusable."""
+
+
+class TreeOptions(NamedTuple):
+    files: bool = False
+    ascii: bool = False
+    hidden: bool = False
+    depth: Optional[int] = None
+    ignore: Tuple[str, ...] = ()
+    sizes: bool = False
+    json: bool = False
+
+
+class Node(NamedTuple):
+    name: str
+    path: str
+    is_dir: bool
+    size: int  # Bytes of a file; 0 for a directory until the sizes are added up
+    link: Optional[str]  # Target of a symbolic link (never followed)
+
+
+def parse_args(argv: List[str]) -> Tuple[TreeOptions, Optional[str]]:
+    """(options, directory or None) from `tree` arguments."""
+    options, directory = TreeOptions()._asdict(), None
+    words = iter(argv)
+    for word in words:
+        lowered = word.lower()
+        if lowered == "/f":
+            options["files"] = True
+        elif lowered == "/a":
+            options["ascii"] = True
+        elif word == "-a":
+            options["hidden"] = True
+        elif word == "-s":
+            options["sizes"] = True
+        elif word == "-J":
+            options["json"] = True
+        elif word in ("-L", "-I"):
+            value = next(words, None)
+            if value is None:
+                raise TreeError(f"{word} needs a value")
+            if word == "-L":
+                if not value.isdigit() or int(value) < 1:
+                    raise TreeError(f"-L takes a number of levels of at least 1, not '{value}'")
+                options["depth"] = int(value)
+            else:
+                options["ignore"] += tuple(pattern for pattern in value.split("|") if pattern)
+        elif word.startswith("-") and len(word) > 1:
+            raise TreeError(f"Unknown option {word}")
+        else:
+            directory = word
+    return TreeOptions(**options), directory
+
+
+class Walker:
+    """Reads a directory tree with a pool of scandir workers and yields it in drawing order."""
+
+    def __init__(self, options: TreeOptions, workers: Optional[int] = None):
+        self.options = options
+        self.workers = workers or int(os.environ.get("MYCLI_TREE_WORKERS", DEFAULT_WORKERS))
+        self.pool: Optional[ThreadPoolExecutor] = None
+        self.ahead: Dict[str, Future] = {}  # Listings being read ahead, by path
+        self.waiting: deque = deque()  # (path, depth) to read ahead once there is room
+        self.directories = 0
+        self.files = 0
+        self.unreadable: List[str] = []
+        self.totals: Dict[str, int] = {}  # Directory path -> bytes under it (-s)
+
+    def __enter__(self) -> "Walker":
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tree")
+        return self
+
+    def __exit__(self, *exc):
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        return False
+
+    def _skipped(self, name: str) -> bool:
+        if not self.options.hidden and name.startswith("."):
+            return True
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.options.ignore)
+
+    def _scan(self, path: str, files: bool) -> Optional[List[Node]]:
+        """The entries of a directory, sorted (None if it cannot be read)."""
+        nodes = []
+        try:
+            with os.scandir(path) as scan:
+                for entry in scan:
+                    if self._skipped(entry.name):
+                        continue
+                    try:
+                        link = os.readlink(entry.path) if entry.is_symlink() else None
+                        is_dir = link is None and entry.is_dir(follow_symlinks=False)
+                        if not is_dir and not files:
+                            continue
+                        size = entry.stat(follow_symlinks=False).st_size if self.options.sizes and not is_dir else 0
+                    except OSError:
+                        continue  # Removed while we looked
+                    nodes.append(Node(entry.name, entry.path, is_dir, size, link))
+        except OSError:
+            return None
+        nodes.sort(key=lambda node: natural_key(node.name))
+        return nodes
+
+    # Drawing order
+
+    def _read_ahead(self):
+        limit = self.workers * PREFETCH_PER_WORKER
+        while self.waiting and len(self.ahead) < limit:
+            path, depth = self.waiting.popleft()
+            if path not in self.ahead:
+                self.ahead[path] = self.pool.submit(self._scan, path, self.options.files)
+
+    def _listing(self, path: str, depth: int) -> Optional[List[Node]]:
+        """The entries of a directory about to be drawn, `depth` levels below the root."""
+        future = self.ahead.pop(path, None)
+        if future is None and self.waiting and self.waiting[0][0] == path:
+            self.waiting.popleft()  # Reached before it could be read ahead
+        nodes = future.result() if future is not None else self._scan(path, self.options.files)
+        if nodes is None:
+            self.unreadable.append(path)
+            return None
+        if self.options.depth is None or depth + 1 < self.options.depth:
+            # Subdirectories are drawn next, in this order, so they are read next
+            self.waiting.extendleft(reversed([(node.path, depth + 1) for node in nodes if node.is_dir]))
+        self._read_ahead()
+        return nodes
+
+    def walk(self, root: str) -> Iterator[Tuple[Node, Tuple[bool, ...]]]:
+        """Each entry below `root` with, for it and each of its ancestors, whether it is the last of its siblings."""
+        nodes = self._listing(root, 0)
+        stack = [(nodes or [], 0, ())]
+        while stack:
+            nodes, index, lasts = stack.pop()
+            if index >= len(nodes):
+                continue
+            stack.append((nodes, index + 1, lasts))
+            node = nodes[index]
+            node_lasts = lasts + (index == len(nodes) - 1,)
+            if node.is_dir:
+                self.directories += 1
+                node = node._replace(size=self.totals.get(node.path, 0))
+            else:
+                self.files += 1
+            yield node, node_lasts
+            if node.is_dir and (self.options.depth is None or len(node_lasts) < self.options.depth):
+                children = self._listing(node.path, len(node_lasts))
+                if children:
+                    stack.append((children, 0, node_lasts))
+
+    # Sizes
+
+    def add_up(self, root: str):
+        """Fill self.totals with the bytes under every directory below `root`, reading them all in parallel."""
+        own: Dict[str, int] = {}
+        parents: Dict[str, str] = {}
+        running = {self.pool.submit(self._scan, root, True): root}
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = running.pop(future)
+                nodes = future.result() or []
+                own[path] = sum(node.size for node in nodes if not node.is_dir)
+                for node in nodes:
+                    if node.is_dir:
+                        parents[node.path] = path
+                        running[self.pool.submit(self._scan, node.path, True)] = node.path
+        totals = dict(own)
+        for path in sorted(own, key=lambda path: path.count(os.sep), reverse=True):  # Deepest first
+            parent = parents.get(path)
+            if parent is not None:
+                totals[parent] += totals[path]
+        self.totals = totals
+
+
+def _size(count: int) -> str:
+    from accounting import size
+    return size(count)
+
+
+def text_lines(walker: Walker, root: str) -> Iterator[str]:
+    """The tree as text lines, the first being the root itself."""
+    options = walker.options
+    branch, last, through, blank = ASCII if options.ascii else UNICODE
+    if options.sizes:
+        walker.add_up(root)
+    entries = walker.walk(root)
+    total = f"[{_size(walker.totals.get(root, 0)):>9}]  " if options.sizes else ""
+    yield f"{total}{root}"
+    for node, lasts in entries:
+        prefix = "".join(blank if is_last else through for is_last in lasts[:-1]) + (last if lasts[-1] else branch)
+        size = f"[{_size(node.size):>9}]  " if options.sizes else ""
+        link = f" -> {node.link}" if node.link else ""
+        yield f"{prefix}{size}{node.name}{link}"
+
+
+def json_chunks(walker: Walker, root: str) -> Iterator[str]:
+    """The tree as JSON, written as it is walked: [{"type": "directory", "name": ..., "contents": [...]}, report]."""
+    sizes = walker.options.sizes
+
+    def item(node: Node) -> str:
+        fields = {"type": "directory" if node.is_dir else "link" if node.link else "file", "name": node.name}
+        if node.link:
+            fields["target"] = node.link
+        if sizes or not node.is_dir:
+            fields["size"] = node.size
+        return json.dumps(fields)[:-1]  # Left open for "contents"
+
+    if sizes:
+        walker.add_up(root)
+    entries = walker.walk(root)
+    opening = {"type": "directory", "name": root}
+    if sizes:
+        opening["size"] = walker.totals.get(root, 0)
+    yield "[" + json.dumps(opening)[:-1] + ', "contents": ['
+    depth, first = 1, True
+    for node, lasts in entries:
+        while depth > len(lasts):
+            yield "]}"
+            depth -= 1
+            first = False
+        yield ("" if first else ",") + "\n" + "  " * depth + item(node)
+        if node.is_dir:
+            yield ', "contents": ['
+            depth += 1
+            first = True
+        else:
+            yield "}"
+            first = False
+    while depth > 0:
+        yield "]}"
+        depth -= 1
+    report = {"type": "report", "directories": walker.directories, "files": walker.files}
+    yield ",\n" + json.dumps(report) + "]\n"
+
+
+def write(chunks: Iterator[str], out=None, newline: bool = True) -> None:
+    """Write text lines (or JSON chunks, newline=False) to `out`, the first at once and then in batches."""
+    out = out or sys.stdout
+    terminal = hasattr(out, "isatty") and out.isatty()
+    pending, size, first = [], 0, True
+    end = "\n" if newline else ""
+    for chunk in chunks:
+        pending.append(chunk + end)
+        size += len(chunk) + 1
+        if first or size >= WRITE_SIZE or (terminal and size >= 4096):
+            out.write("".join(pending))
+            out.flush()
+            pending, size, first = [], 0, False
+    out.write("".join(pending))
+    out.flush()
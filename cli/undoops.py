@@ -0,0 +1,210 @@
+# undoops.py
+"""
+Typed undo operations, executed in process.
+
+An undo record (the undo_info half of a command_history entry) holds a list
+of operations under "ops", e.g.
+
+    {"op": "rename", "src": "/abs/new.txt", "dst": "/abs/old.txt"}
+
+Undo applies a record's operations newest first. Applying an operation returns
+its own inverse, so the inverses of an undone record form the record that
+redoes it, and vice versa. A record is applied as one unit: if an
+operation fails, the ones already applied are reverted and the record is left
+as it was.
+"""
+
+import base64
+import os
+import shutil
+from typing import Callable, Dict, Iterable, List, Optional
+
+INLINE_LIMIT = 1024 * 1024  # Bytes cut off by an undone append kept in the redo record itself
+
+
+class UndoError(Exception):
+    """An undo record could not be applied; nothing it touched was left changed."""
+
+
+class OpContext:
+    """What operations need while a batch of records is applied: one trash and one backup store."""
+
+    def __init__(self):
+        self._trash = None
+        self._store = None
+        self.trashed = False
+
+    def trash_move(self, path: str) -> Optional[str]:
+        item = self.trash.move(path, purge=False)
+        self.trashed = self.trashed or item is not None
+        return item
+
+    def finish(self):
+        """Enforce the trash quota once for the whole batch."""
+        if self.trashed:
+            self.trash.purge_in_background()
+
+    @property
+    def trash(self):
+        if self._trash is None:
+            from trash import Trash
+            self._trash = Trash()
+        return self._trash
+
+    @property
+    def store(self):
+        if self._store is None:
+            from backupstore import BackupStore
+            self._store = BackupStore()
+        return self._store
+
+
+def _remove(op: dict, ctx: OpContext) -> Optional[dict]:
+    """Delete something a command created; it goes to the trash so redo can bring it back."""
+    path = op["path"]
+    item = ctx.trash_move(path)
+    if item is not None:
+        return {"op": "untrash", "item": item, "path": path}
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)  # Raises if it no longer exists
+    return None  # Deleted for good: no trash on this filesystem
+
+
+def _mkdir(op: dict, ctx: OpContext) -> dict:
+    os.mkdir(op["path"])
+    return {"op": "remove", "path": op["path"]}
+
+
+def _rename(op: dict, ctx: OpContext) -> dict:
+    src, dst = op["src"], op["dst"]
+    if os.path.lexists(dst) and not op.get("replace"):
+        raise FileExistsError(f"'{dst}' exists again; move it away first")
+    shutil.move(src, dst)  # A rename when both are on one filesystem
+    return {"op": "rename", "src": dst, "dst": src}
+
+
+def _chdir(op: dict, ctx: OpContext) -> dict:
+    previous = os.getcwd()
+    os.chdir(op["path"])
+    return {"op": "chdir", "path": previous}
+
+
+def _trash(op: dict, ctx: OpContext) -> dict:
+    item = ctx.trash_move(op["path"])
+    if item is None:
+        raise OSError(f"no trash available for '{op['path']}'")
+    return {"op": "untrash", "item": item, "path": op["path"]}
+
+
+def _untrash(op: dict, ctx: OpContext) -> dict:
+    ctx.trash.restore(op["item"], op["path"])
+    return {"op": "trash", "path": op["path"]}
+
+
+def _restore(op: dict, ctx: OpContext) -> dict:
+    path = op["path"]
+    inverse = {"op": "remove", "path": path}
+    if os.path.lexists(path):
+        inverse = {"op": "restore", "object": ctx.store.save(path), "path": path,
+                   "bytes": os.path.getsize(path)}
+    ctx.store.restore(op["object"], path)
+    return inverse
+
+
+def _truncate(op: dict, ctx: OpContext) -> dict:
+    path, length = op["path"], op["length"]
+    size = os.path.getsize(path)
+    if size < length:
+        raise OSError(f"'{path}' is shorter than before the append; not truncating")
+    if size - length > INLINE_LIMIT:
+        inverse = {"op": "restore", "object": ctx.store.save(path), "path": path, "bytes": size}
+    else:
+        with open(path, "rb") as f:
+            f.seek(length)
+            inverse = {"op": "append_bytes", "path": path, "data": base64.b64encode(f.read()).decode("ascii")}
+    os.truncate(path, length)
+    return inverse
+
+
+def _append_bytes(op: dict, ctx: OpContext) -> dict:
+    path = op["path"]
+    length = os.path.getsize(path)
+    with open(path, "ab") as f:
+        f.write(base64.b64decode(op["data"]))
+    return {"op": "truncate", "path": path, "length": length}
+
+
+OPERATIONS: Dict[str, Callable[[dict, OpContext], Optional[dict]]] = {
+    "remove": _remove,
+    "mkdir": _mkdir,
+    "rename": _rename,
+    "chdir": _chdir,
+    "trash": _trash,
+    "untrash": _untrash,
+    "restore": _restore,
+    "truncate": _truncate,
+    "append_bytes": _append_bytes,
+}
+
+
+def undo_record(message: str, *ops: dict) -> dict:
+    """The undo record of a command, given the operations that revert each of its steps, in the order it took them."""
+    return {"message": message, "ops": list(ops)}
+
+
+def ops_of(undo_info) -> List[dict]:
+    """The operations of an undo record, in the order the command performed them."""
+    if not isinstance(undo_info, dict):
+        return []
+    return list(undo_info.get("ops", ()))
+
+
+def merge(records: List[dict]) -> dict:
+    """One undo record for everything a command line did, so undo reverts it as a unit."""
+    messages = [record.get("message", "") for record in records if isinstance(record, dict)]
+    merged = {"message": "; ".join(message for message in messages if message),
+              "ops": [op for record in records for op in ops_of(record)]}
+    artifacts = [path for record in records if isinstance(record, dict) for path in record.get("artifacts", ())]
+    if artifacts:
+        merged["artifacts"] = artifacts
+    return merged
+
+
+def apply_record(undo_info, ctx: OpContext) -> Optional[dict]:
+    """Apply a record's operations newest first; returns the record that reverses this, or None if some step cannot be reversed.
+
+    Raises UndoError after putting back whatever was already applied.
+    """
+    inverses: List[Optional[dict]] = []
+    for op in reversed(ops_of(undo_info)):
+        try:
+            handler = OPERATIONS[op["op"]]
+            inverses.append(handler(op, ctx))
+        except Exception as e:
+            for inverse in reversed(inverses):
+                if inverse is not None:
+                    try:
+                        OPERATIONS[inverse["op"]](inverse, ctx)
+                    except Exception:
+                        pass  # Best effort: report the original failure
+            raise UndoError(str(e)) from e
+    if any(inverse is None for inverse in inverses):
+        return None
+    message = undo_info.get("message", "") if isinstance(undo_info, dict) else ""
+    return {"message": message, "ops": list(reversed(inverses))}
+
+
+def held_trash_items(undo_info) -> Iterable[str]:
+    """Trash items a record would restore, which must go once nobody can undo it."""
+    for op in ops_of(undo_info):
+        if op["op"] == "untrash":
+            yield op["item"]
+
+
+def held_objects(undo_info) -> Iterable[str]:
+    """Backup store objects a record restores from."""
+    for op in ops_of(undo_info):
+        if op["op"] == "restore":
+            yield op["object"]